@@ -21,7 +21,12 @@ import { UploadService } from "./services/upload";
 import cors from "cors";
 import bodyParser from "body-parser";
 import session from "express-session";
-import { PublicError, createTransaction } from "./utils";
+import {
+    PublicError,
+    SCHEMA_HASH_HEADER,
+    createTransaction,
+    schemaHash,
+} from "./utils";
 import { createServer } from "http";
 import { logger } from "./logging";
 import Busboy from "busboy";
@@ -92,6 +97,7 @@ class FileUploadException extends Error {
 export async function createApp(connector: Connector) {
     // gets the graphql server schema
     const schema = await connector.buildSchema();
+    const schemaId = schemaHash(schema.schema);
     const authService = Container.get(AuthService);
     const app = express();
 
@@ -134,6 +140,7 @@ export async function createApp(connector: Connector) {
     });
 
     app.get("/api/version", (req, res) => {
+        res.set(SCHEMA_HASH_HEADER, schemaId);
         res.status(200).send(config.version);
     });
 
@@ -0,0 +1,14 @@
+import { buildSchema } from "graphql";
+import { schemaHash } from "..";
+
+describe("schema hash", () => {
+    it("only changes with the schema", () => {
+        const schema = buildSchema("type Query { version: String! }");
+        const same = buildSchema("type Query { version: String! }");
+        const other = buildSchema(
+            "type Query { version: String!, sequence: Int! }"
+        );
+        expect(schemaHash(schema)).toEqual(schemaHash(same));
+        expect(schemaHash(schema)).not.toEqual(schemaHash(other));
+    });
+});
@@ -1,3 +1,5 @@
+import { createHash } from "crypto";
+import { GraphQLSchema, printSchema } from "graphql";
 import { EntityManager } from "typeorm";
 
 export class PublicError extends Error {}
@@ -22,3 +24,17 @@ export function createTransaction<V>(
     }
     return manager.transaction(transaction);
 }
+
+/**
+ * the header /api/version sends the schema's hash in, probes cache the
+ * introspected schema by it together with the version
+ */
+export const SCHEMA_HASH_HEADER = "Inquest-Schema-Hash";
+
+/**
+ * hashes the schema's definition so that builds sharing a version but not
+ * a schema can be told apart
+ */
+export function schemaHash(schema: GraphQLSchema): string {
+    return createHash("sha256").update(printSchema(schema)).digest("hex");
+}
@@ -0,0 +1,83 @@
+import argparse
+import ast
+import random
+import timeit
+
+from inquest.injection.ast_injector import ASTInjector
+
+
+def synthetic_function(num_lines: int) -> ast.FunctionDef:
+    """
+    a function of roughly num_lines lines made of straight line code
+    broken up by loops and branches
+    """
+    lines = ['def synthetic(value):']
+    indent = 1
+    while len(lines) < num_lines:
+        roll = len(lines) % 10
+        if roll == 3 and indent < 4:
+            lines.append('    ' * indent + 'for idx in range(value):')
+            indent += 1
+        elif roll == 7 and indent < 4:
+            lines.append('    ' * indent + 'if value > idx:')
+            indent += 1
+        elif roll == 9 and indent > 1:
+            lines.append('    ' * indent + 'value += 1')
+            indent -= 1
+        else:
+            lines.append('    ' * indent + 'value = value * 2 + 1')
+    lines.append('    return value')
+    return ast.parse('\n'.join(lines)).body[0]
+
+
+def trace_statements(num_lines: int, num_traces: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [(
+        rng.randint(1, num_lines),
+        ast.parse('print("trace")').body[0],
+    ) for _ in range(num_traces)]
+
+
+def per_trace(node: ast.AST, statements):
+    injector = ASTInjector(node)
+    for line, statement in sorted(statements, key=lambda pair: pair[0]):
+        injector.insert(line, statement)
+    return injector.result()
+
+
+def batched(node: ast.AST, statements):
+    injector = ASTInjector(node)
+    injector.insert_all(statements)
+    return injector.result()
+
+
+def main():
+    parser = argparse.ArgumentParser("inquest ast injection benchmark")
+    parser.add_argument('-repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{"lines":>6} {"traces":>6} {"per trace":>12} {"batched":>12}')
+    for num_lines, num_traces in [
+        (100, 5),
+        (1000, 10),
+        (1000, 50),
+        (5000, 50),
+        (5000, 200),
+    ]:
+        node = synthetic_function(num_lines)
+        statements = trace_statements(num_lines, num_traces)
+        results = []
+        for method in (per_trace, batched):
+            elapsed = timeit.timeit(
+                lambda method=method: method(node, statements),
+                number=args.repeat,
+            )
+            results.append(elapsed / args.repeat * 1000)
+        print(
+            f'{num_lines:>6} {num_traces:>6} '
+            + f'{results[0]:>9.2f} ms {results[1]:>9.2f} ms'
+        )
+
+
+if __name__ == "__main__":
+    main()
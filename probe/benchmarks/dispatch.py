@@ -0,0 +1,81 @@
+import argparse
+import timeit
+
+import inquest.injection.codegen as codegen
+import inquest.logging
+from inquest.logging import Callback
+
+
+class NullCallback(Callback):
+
+    def log(self, value: str):
+        pass
+
+    def error(self, trace_id: str, value: Exception):
+        pass
+
+
+def handler(value):
+    value = value + 1
+    return value
+
+
+# what log used to do: iterate over a mutable set of callbacks on every hit
+_SET_CALL_BACKS = set()
+
+
+def set_log(value):
+    # pylint: disable=all
+    for callback in _SET_CALL_BACKS:
+        try:
+            callback.log(value)
+        except:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser("inquest trace dispatch benchmark")
+    parser.add_argument('-number', type=int, default=1000000)
+    parser.add_argument('-sinks', type=int, default=8)
+    args = parser.parse_args()
+
+    handler.__code__ = codegen.add_log_statements(
+        handler,
+        [
+            codegen.Trace(
+                lineno=handler.__code__.co_firstlineno + 1,
+                statement='{value}',
+                id='dispatch',
+            )
+        ],
+    )
+
+    print(f'{"sinks":>5} {"dispatch":>14} {"set iteration":>14}')
+    for num_sinks in sorted({0, 1, args.sinks}):
+        callbacks = [NullCallback() for _ in range(num_sinks)]
+        for callback in callbacks:
+            inquest.logging.add_callback(callback)
+        try:
+            dispatched = timeit.timeit(lambda: handler(1), number=args.number)
+        finally:
+            for callback in callbacks:
+                inquest.logging.remove_callback(callback)
+
+        _SET_CALL_BACKS.update(callbacks)
+        dispatch = inquest.logging.log
+        inquest.logging.log = set_log
+        try:
+            iterated = timeit.timeit(lambda: handler(1), number=args.number)
+        finally:
+            inquest.logging.log = dispatch
+            _SET_CALL_BACKS.clear()
+
+        print(
+            f'{num_sinks:>5} '
+            + f'{dispatched / args.number * 1e9:>8.1f} ns/hit '
+            + f'{iterated / args.number * 1e9:>8.1f} ns/hit'
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import timeit
+
+import inquest.injection.codegen as codegen
+
+
+def handler(value):
+    if value < 0:
+        value = -value
+    return value + 1
+
+
+# what codegen used to generate: an import at the top of every call
+def handler_with_import(value):
+    import inquest.logging as ___inquest_logging  # pylint: disable=all
+    if value < 0:
+        try:
+            ___inquest_logging.log(f"{value}")
+        except Exception as exc:
+            ___inquest_logging.error("idle", exc)
+        value = -value
+    return value + 1
+
+
+def main():
+    parser = argparse.ArgumentParser("inquest idle trace benchmark")
+    parser.add_argument('-number', type=int, default=1000000)
+    args = parser.parse_args()
+
+    instrumented = codegen.add_log_statements(
+        handler,
+        [
+            codegen.Trace(
+                lineno=handler.__code__.co_firstlineno + 2,
+                statement='{value}',
+                id='idle',
+            )
+        ],
+    )
+
+    original = handler.__code__
+    baseline = timeit.timeit(lambda: handler(1), number=args.number)
+    handler.__code__ = instrumented
+    try:
+        traced = timeit.timeit(lambda: handler(1), number=args.number)
+    finally:
+        handler.__code__ = original
+    imported = timeit.timeit(
+        lambda: handler_with_import(1), number=args.number
+    )
+
+    for name, elapsed in [
+        ('uninstrumented', baseline),
+        ('instrumented', traced),
+        ('instrumented (per call import)', imported),
+    ]:
+        per_call = elapsed / args.number * 1e9
+        overhead = (elapsed - baseline) / args.number * 1e9
+        print(f'{name:<32} {per_call:7.1f} ns/call {overhead:+7.1f} ns')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# each snippet runs in a fresh interpreter and prints its own import time
+# in milliseconds and its peak rss in kilobytes
+_TEMPLATE = """\
+import resource, time
+start = time.perf_counter()
+{imports}
+elapsed = (time.perf_counter() - start) * 1000
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+SCENARIOS = {
+    # what every process calling inquest.enable pays
+    'import inquest':
+        'import inquest',
+    # what importing inquest used to pay before the comms stack was lazy
+    'import inquest + comms':
+        '''\
+import inquest
+import inquest.comms.client_provider
+import inquest.comms.log_sender
+import inquest.comms.module_sender
+import inquest.comms.trace_set_subscriber
+import inquest.comms.version_checker''',
+}
+
+
+def measure(imports: str, repeat: int):
+    code = _TEMPLATE.format(imports=imports)
+    times = []
+    rss = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout.decode('utf8').split()
+        times.append(float(output[0]))
+        rss.append(int(output[1]))
+    return statistics.median(times), statistics.median(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser("inquest import time benchmark")
+    parser.add_argument('-repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    for name, imports in SCENARIOS.items():
+        elapsed, rss = measure(imports, args.repeat)
+        print(f'{name:<26} {elapsed:8.1f} ms {rss / 1024:8.1f} MB max rss')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+from gql import Client, gql
+from gql.transport.aiohttp import AIOHTTPTransport
+
+from inquest.comms.bulk_log_transport import (
+    BulkLogTransport, ENCODINGS, decode_batch
+)
+
+QUERY = gql(
+    """\
+mutation PublishLogMutation($content: [String!]!) {
+  publishLog(content: $content)
+}
+"""
+)
+
+
+class StandInServer:
+    """
+    accepts publishLog mutations and bulk log batches and counts the bytes
+    and lines it received
+    """
+
+    def __init__(self):
+        self.bytes_received = 0
+        self.lines_received = 0
+        self._compressions = {
+            encoding: compression
+            for compression, encoding in ENCODINGS.items()
+        }
+
+    async def graphql(self, request: web.Request):
+        body = await request.read()
+        self.bytes_received += len(body)
+        content = json.loads(body)['variables']['content']
+        self.lines_received += len(content)
+        return web.json_response({'data': {'publishLog': True}})
+
+    async def logs(self, request: web.Request):
+        body = await request.content.read()
+        self.bytes_received += len(body)
+        compression = self._compressions[request.headers['Content-Encoding']]
+        self.lines_received += len(decode_batch(body, compression))
+        return web.Response()
+
+    async def start(self) -> int:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/api/graphql', self.graphql)
+        app.router.add_post('/api/logs/{trace_set}', self.logs)
+        self.runner = web.AppRunner(app, auto_decompress=False)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+
+def log_lines(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        f'request {rng.randint(0, 10**6)} user={rng.choice(["ann", "bo"])} '
+        + f'path=/api/items/{rng.randint(0, 1000)} '
+        + f'latency={rng.random():.4f} status={rng.choice([200, 404])}'
+        for _ in range(count)
+    ]
+
+
+async def run_graphql(url, batches):
+    async with Client(transport=AIOHTTPTransport(url=url)) as client:
+        for batch in batches:
+            await client.execute(QUERY, variable_values={'content': batch})
+
+
+async def run_bulk(url, batches, compression):
+    async with BulkLogTransport(url=url, compression=compression) as sender:
+        for batch in batches:
+            await sender.send('benchmark', batch)
+
+
+async def main_async(args):
+    server = StandInServer()
+    port = await server.start()
+    base = f'http://127.0.0.1:{port}/api'
+    batches = [
+        log_lines(args.batch_size, seed) for seed in range(args.batches)
+    ]
+    total = args.batch_size * args.batches
+
+    print(f'{"transport":<16} {"lines/s":>12} {"bytes/line":>12}')
+    for name, run in [
+        ('graphql', lambda: run_graphql(f'{base}/graphql', batches)),
+        ('bulk gzip', lambda: run_bulk(f'{base}/logs', batches, 'gzip')),
+        ('bulk zlib', lambda: run_bulk(f'{base}/logs', batches, 'zlib')),
+    ]:
+        server.bytes_received = server.lines_received = 0
+        started = time.perf_counter()
+        await run()
+        elapsed = time.perf_counter() - started
+        assert server.lines_received == total
+        print(
+            f'{name:<16} {total / elapsed:>12.0f} '
+            + f'{server.bytes_received / total:>12.1f}'
+        )
+    await server.runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser("inquest log transport benchmark")
+    parser.add_argument('-batches', type=int, default=50)
+    parser.add_argument('-batch_size', type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
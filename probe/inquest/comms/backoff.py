@@ -0,0 +1,38 @@
+import random
+from typing import Optional
+
+
+class Backoff:
+    """
+    jittered exponential backoff between reconnect attempts.
+    the n-th delay is drawn uniformly from the upper half of
+    min(initial * factor ** n, maximum), so probes that lost their
+    connection at the same moment don't all retry at the same moment
+    """
+
+    def __init__(
+        self,
+        *,
+        initial: float = 0.5,
+        maximum: float = 30.0,
+        factor: float = 2.0,
+        rng: Optional[random.Random] = None,
+    ):
+        if not 0 < initial <= maximum:
+            raise ValueError('the delays must be 0 < initial <= maximum')
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.rng = rng if rng is not None else random.Random()
+        self.attempts = 0
+
+    def next(self) -> float:
+        '''
+        @returns the seconds to wait before the next attempt
+        '''
+        ceiling = min(self.initial * self.factor**self.attempts, self.maximum)
+        self.attempts += 1
+        return ceiling / 2 + self.rng.uniform(0, ceiling / 2)
+
+    def reset(self):
+        self.attempts = 0
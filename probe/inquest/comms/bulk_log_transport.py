@@ -0,0 +1,134 @@
+import asyncio
+import contextlib
+import gzip
+import logging
+import struct
+import urllib.parse
+import zlib
+from typing import List
+
+import aiohttp
+
+LOGGER = logging.getLogger(__name__)
+
+# the length of the line that follows
+_LENGTH = struct.Struct('<I')
+
+CONTENT_TYPE = 'application/x-inquest-log-batch'
+# compression -> its content encoding
+ENCODINGS = {
+    'gzip': 'gzip',
+    'zlib': 'deflate',
+}
+
+# payloads larger than this are compressed off the event loop
+_EXECUTOR_THRESHOLD = 64 * 1024
+
+
+class BulkLogTransportException(Exception):
+    pass
+
+
+def encode_batch(
+    lines: List[str],
+    compression: str = 'gzip',
+    level: int = 1,
+) -> bytes:
+    '''
+    @returns the lines, each prefixed by its length, compressed
+    '''
+    parts = []
+    for line in lines:
+        data = line.encode('utf8')
+        parts.append(_LENGTH.pack(len(data)))
+        parts.append(data)
+    payload = b''.join(parts)
+    if compression == 'gzip':
+        return gzip.compress(payload, compresslevel=level)
+    if compression == 'zlib':
+        return zlib.compress(payload, level)
+    raise ValueError(f'unknown compression {compression}')
+
+
+def decode_batch(body: bytes, compression: str = 'gzip') -> List[str]:
+    if compression == 'gzip':
+        payload = gzip.decompress(body)
+    elif compression == 'zlib':
+        payload = zlib.decompress(body)
+    else:
+        raise ValueError(f'unknown compression {compression}')
+    lines = []
+    offset = 0
+    while offset < len(payload):
+        (length,) = _LENGTH.unpack_from(payload, offset)
+        offset += _LENGTH.size
+        lines.append(payload[offset:offset + length].decode('utf8'))
+        offset += length
+    return lines
+
+
+class BulkLogTransport(contextlib.AsyncExitStack):
+    """
+    posts log batches as compressed, length prefixed lines to the bulk log
+    endpoint over a pooled http session, an alternative to sending them
+    as a json array through the publishLog mutation.
+    the backend doesn't serve the endpoint yet, so only LogSender takes a
+    transport and the probe runner keeps sending logs with publishLog
+    """
+
+    def __init__(
+        self,
+        *,
+        url: str,
+        compression: str = 'gzip',
+        level: int = 1,
+        connections: int = 4,
+    ):
+        if compression not in ENCODINGS:
+            raise ValueError(f'unknown compression {compression}')
+        super().__init__()
+        self.url = url
+        self.compression = compression
+        self.level = level
+        self.connections = connections
+        self.session: aiohttp.ClientSession = None
+        self.bytes_sent = 0
+
+    async def __aenter__(self):
+        await super().__aenter__()
+        self.session = await self.enter_async_context(
+            aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections)
+            )
+        )
+        return self
+
+    async def _encode(self, lines: List[str]) -> bytes:
+        if sum(len(line) for line in lines) < _EXECUTOR_THRESHOLD:
+            return encode_batch(lines, self.compression, self.level)
+        # zlib releases the gil while it compresses
+        return await asyncio.get_running_loop().run_in_executor(
+            None, encode_batch, lines, self.compression, self.level
+        )
+
+    async def send(self, trace_set_id: str, lines: List[str]):
+        body = await self._encode(lines)
+        trace_set_slug = urllib.parse.quote(trace_set_id)
+        async with self.session.post(
+                self.url + f'/{trace_set_slug}',
+                data=body,
+                headers={
+                    'Content-Type': CONTENT_TYPE,
+                    'Content-Encoding': ENCODINGS[self.compression],
+                },
+        ) as resp:
+            if resp.status != 200:
+                LOGGER.error(
+                    "sending logs failed",
+                    extra={
+                        "status_code": resp.status,
+                        "failure_message": (await resp.text()),
+                    },
+                )
+                raise BulkLogTransportException("sending logs failed")
+        self.bytes_sent += len(body)
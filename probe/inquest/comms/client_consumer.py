@@ -2,10 +2,14 @@ import contextlib
 
 from gql import Client
 
+from inquest.comms.scheduler import CONTROL
+
 
 class ClientConsumer(contextlib.AsyncExitStack):
     # whether or not this consumer needs to be run at initialization
     initialization = False
+    # the scheduler lane the consumer's requests go through
+    priority = CONTROL
 
     def __init__(self):
         super().__init__()
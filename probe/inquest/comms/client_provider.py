@@ -3,18 +3,43 @@ import base64
 import contextlib
 import copy
 import logging
-from typing import Dict, List, Optional
+from typing import Awaitable, Dict, List, Optional
 
-from gql import Client, gql
-from gql.transport.exceptions import TransportQueryError
+from gql import Client
+from gql.transport.exceptions import TransportClosed, TransportQueryError
 from gql.transport.websockets import WebsocketsTransport
+from graphql import build_client_schema
 
+from inquest.comms.backoff import Backoff
 from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.operations import NEW_PROBE
+from inquest.comms.scheduler import OutboundScheduler, ScheduledClient
+from inquest.comms.schema_cache import SchemaCache
+from inquest.comms.utils import CONNECTION_ERRORS
+from inquest.comms.version_checker import BackendVersion, check_version
 
 LOGGER = logging.getLogger(__name__)
 
 
 class ClientProvider(contextlib.AsyncExitStack):
+    """
+    connects the consumers to the backend.
+    when the connection is lost the consumers are stopped and the provider
+    reconnects after a jittered exponential backoff, reusing the probe's
+    authorization and the fetched schema. the consumers stay entered across
+    the gap so the logs they buffered are kept, the initialization
+    consumers aren't run again and the main consumers are restarted, which
+    has the trace set subscriber resubscribe
+    @param version_url: if set, where the backend's version is checked
+                        against the probe's before the probe is created
+    @param schema_cache: if set, where the schema is looked up by the
+                         backend's version and schema hash before it's
+                         introspected
+    @param stable_after: seconds a connection has to stay up for the
+                         backoff to start over once it's lost. a backend
+                         that drops connections as soon as it accepts them
+                         keeps getting longer delays
+    """
 
     def __init__(
         self,
@@ -24,6 +49,10 @@ class ClientProvider(contextlib.AsyncExitStack):
         ssl: bool,
         consumers: List[ClientConsumer],
         headers: Optional[Dict[str, str]] = None,
+        backoff: Optional[Backoff] = None,
+        version_url: Optional[str] = None,
+        schema_cache: Optional[SchemaCache] = None,
+        stable_after: float = 10.0,
     ):
         super().__init__()
         self.url = url
@@ -32,79 +61,272 @@ class ClientProvider(contextlib.AsyncExitStack):
         self.ssl = ssl
         self.trace_set_id = trace_set_id
         self.client = None
+        self.scheduler = None
+        self.schema = None
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.stable_after = stable_after
+        self._connection: Optional[contextlib.AsyncExitStack] = None
+        # when the current connection was opened
+        self._connected_at: Optional[float] = None
+        self.version_url = version_url
+        self.backend_version: Optional[BackendVersion] = None
+        self.schema_cache = schema_cache
+        # seconds each startup stage took
+        self.timings: Dict[str, float] = {}
 
-        self.query = gql(
-            """\
-mutation NewProbeMutation($traceSetId: String!) {
-  newProbe(traceSetId: $traceSetId) {
-    id
-  }
-}
-                    """
+        self.query = NEW_PROBE
+
+    def _transport(self):
+        return WebsocketsTransport(
+            url=self.url,
+            ssl=self.ssl,
+            headers=self.headers,
         )
 
-    async def login(self):
-        authorization = 'Authorization'
-        if 'Authorization' not in self.headers:
-            async with Client(transport=WebsocketsTransport(
-                    url=self.url,
-                    ssl=self.ssl,
-                    headers=self.headers,
-            )) as client:
+    async def _timed(self, stage: str, awaitable: Awaitable):
+        '''
+        awaits the awaitable, recording how long it took as the stage's
+        timing
+        '''
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            return await awaitable
+        finally:
+            self.timings[stage] = loop.time() - started
+
+    async def _check_version(self) -> Optional[BackendVersion]:
+        if self.version_url is None:
+            return None
+        self.backend_version = await check_version(self.version_url)
+        return self.backend_version
+
+    async def _login(self, client, version: Awaitable):
+        '''
+        creates the probe on the backend once its version was checked to be
+        compatible
+        '''
+        await version
+        try:
+            result = await client.execute(
+                self.query, variable_values={'traceSetId': self.trace_set_id}
+            )
+        except TransportQueryError as err:
+            raise Exception("failed to authenticate api key") from err
+        id = str(result['newProbe']['id'])
+        token = base64.b64encode(f'probe_{id}:'.encode('utf8'))
+        self.headers['Authorization'] = f'Basic {token.decode("utf8")}'
+        LOGGER.debug('logged in')
+
+    async def _load_schema(self, client, version: Awaitable):
+        '''
+        loads the schema from the schema cache by the backend's version and
+        schema hash, falling back to introspecting it over the client's
+        connection. without a schema hash the cache isn't used, since
+        builds sharing a version can have different schemas
+        '''
+        backend = await version
+        cached = self.schema_cache is not None and backend is not None and \
+            backend.schema_hash is not None
+        if cached:
+            introspection = self.schema_cache.load(
+                backend.version, backend.schema_hash
+            )
+            if introspection is not None:
                 try:
-                    result = (
-                        await client.execute(
-                            self.query,
-                            variable_values={'traceSetId': self.trace_set_id}
-                        )
+                    self.schema = build_client_schema(introspection)
+                    return
+                except Exception as err:  # pylint: disable=broad-except
+                    LOGGER.debug(
+                        'cached schema is invalid', extra={'error': err}
                     )
-                    id = str(result['newProbe']['id'])
-                    result = base64.b64encode(f'probe_{id}:'.encode('utf8'))
-                except TransportQueryError as err: 
-                    raise Exception("failed to authenticate api key")
 
+        await client.fetch_schema()
+        self.schema = client.client.schema
+        if cached:
+            self.schema_cache.store(
+                backend.version,
+                backend.schema_hash,
+                client.client.introspection,
+            )
 
-            value = f'Basic {result.decode("utf8")}'
-            self.headers[authorization] = value
-            LOGGER.debug('logged in')
+    async def _open(self):
+        '''
+        checks the backend's version, logs in, loads the schema and opens the
+        session's connection.
+        the backend only reads a connection's authorization as it's opened,
+        so logging in takes a connection of its own, but the schema is
+        loaded over it while the probe is created and the connection is
+        opened while the version is checked. with a schema cache that
+        holds the schema of the backend's build it isn't loaded at all
+        '''
+        version = asyncio.ensure_future(
+            self._timed('version', self._check_version())
+        )
+        try:
+            if 'Authorization' not in self.headers:
+                async with contextlib.AsyncExitStack() as login:
+                    client = await self._timed(
+                        'login_connect',
+                        login.enter_async_context(
+                            Client(transport=self._transport())
+                        ),
+                    )
+                    await asyncio.gather(
+                        self._timed('login', self._login(client, version)),
+                        self._timed(
+                            'schema', self._load_schema(client, version)
+                        ),
+                    )
+            await self._timed('connect', self._connect())
+            if self.schema is None:
+                await self._timed(
+                    'schema', self._load_schema(self.client, version)
+                )
+            await version
+        finally:
+            version.cancel()
 
-    async def __aenter__(self):
-        await super().__aenter__()
-        await self.login()
-        self.client: Client = await self.enter_async_context(
-            Client(
-                transport=WebsocketsTransport(
-                    url=self.url,
-                    ssl=self.ssl,
-                    headers=self.headers,
+    async def _connect(self):
+        '''
+        opens a connection to the backend with the probe's authorization
+        '''
+        connection = contextlib.AsyncExitStack()
+        await connection.__aenter__()
+        try:
+            self.client = await connection.enter_async_context(
+                Client(
+                    # the schema loaded at startup is reused by every
+                    # connection
+                    schema=self.schema,
+                    transport=self._transport(),
                 )
             )
-        )
+        except BaseException:
+            await connection.aclose()
+            raise
+        self._connection = connection
+        self._connected_at = asyncio.get_running_loop().time()
+        if self.scheduler is not None:
+            self.scheduler.client = self.client
+        LOGGER.debug('connected')
+
+    async def _disconnect(self):
+        connection, self._connection = self._connection, None
+        self.client = None
+        self._connected_at = None
+        if connection is not None:
+            try:
+                await connection.aclose()
+            except Exception as err:  # pylint: disable=broad-except
+                LOGGER.debug(
+                    'failed to close connection', extra={'error': err}
+                )
+
+    async def _connection_lost(self):
+        '''
+        waits until the websocket stops receiving
+        '''
+        # waiting on the task without awaiting it directly so that being
+        # cancelled doesn't cancel the transport's receiving
+        await asyncio.wait([self.client.transport.receive_data_task])
+
+    async def __aenter__(self):
+        await super().__aenter__()
+        self.push_async_callback(self._disconnect)
+        # every request goes through the scheduler so that control traffic
+        # isn't stuck behind bulk traffic on the shared connection
+        self.scheduler = OutboundScheduler(None)
         for consumer in self.consumers:
-            consumer._set_values(self.client, self.trace_set_id)
+            consumer._set_values(
+                ScheduledClient(self.scheduler, consumer.priority),
+                self.trace_set_id,
+            )
+        loop = asyncio.get_running_loop()
+        started = loop.time()
         await asyncio.gather(
-            *[
-                self.enter_async_context(consumer)
-                for consumer in self.consumers
-            ], self.client.fetch_schema()
+            self._open(),
+            self._timed(
+                'consumers',
+                asyncio.gather(
+                    *[
+                        self.enter_async_context(consumer)
+                        for consumer in self.consumers
+                    ]
+                ),
+            ),
+        )
+        self.timings['total'] = loop.time() - started
+        LOGGER.info(
+            'connected to the backend', extra={'timings': dict(self.timings)}
         )
         return self
 
-    async def main(self):
-        # first run and complete the initialization consumers
-        await asyncio.gather(
-            *[
-                consumer.main()
-                for consumer in self.consumers
-                if consumer.initialization
-            ]
+    async def _run(self, consumers: List[ClientConsumer]):
+        '''
+        runs the consumers until they all finish. once one of them fails or
+        the connection is lost the rest are cancelled
+        '''
+        tasks = [
+            asyncio.ensure_future(consumer.main()) for consumer in consumers
+        ]
+        finished = asyncio.gather(*tasks)
+        # a consumer's exception is only raised if it finished first, it's
+        # marked as retrieved otherwise
+        finished.add_done_callback(
+            lambda future: future.cancelled() or future.exception()
         )
+        lost = asyncio.ensure_future(self._connection_lost())
+        try:
+            await asyncio.wait([finished, lost],
+                               return_when=asyncio.FIRST_COMPLETED)
+            if finished.done():
+                return finished.result()
+            raise TransportClosed('the connection to the backend was lost')
+        finally:
+            lost.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, lost, return_exceptions=True)
 
-        # then run and complete the main consumers
-        await asyncio.gather(
-            *[
-                consumer.main()
-                for consumer in self.consumers
-                if not consumer.initialization
-            ]
-        )
+    async def main(self):
+        initialized = False
+        while True:
+            try:
+                if self.client is None:
+                    await self._connect()
+                if not initialized:
+                    # first run and complete the initialization consumers,
+                    # they only run once however often the probe reconnects
+                    await self._run(
+                        [
+                            consumer for consumer in self.consumers
+                            if consumer.initialization
+                        ]
+                    )
+                    initialized = True
+                # then run and complete the main consumers
+                await self._run(
+                    [
+                        consumer for consumer in self.consumers
+                        if not consumer.initialization
+                    ]
+                )
+                return
+            except CONNECTION_ERRORS as err:
+                connected_at = self._connected_at
+                await self._disconnect()
+                now = asyncio.get_running_loop().time()
+                if connected_at is not None and \
+                        now - connected_at >= self.stable_after:
+                    self.backoff.reset()
+                delay = self.backoff.next()
+                LOGGER.warning(
+                    'lost the connection to the backend, reconnecting',
+                    extra={
+                        'error': err,
+                        'attempt': self.backoff.attempts,
+                        'retry_in': delay,
+                    },
+                )
+                await asyncio.sleep(delay)
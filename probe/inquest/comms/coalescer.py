@@ -0,0 +1,71 @@
+import asyncio
+from typing import Generic, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class Coalescer(Generic[T]):
+    """
+    keeps only the latest value of a burst of values.
+    the latest value is released once no newer one arrived for quiet
+    seconds, or max_delay seconds after the burst's first value arrived so
+    that a steady stream of values can't hold it back forever
+    """
+
+    def __init__(self, *, quiet: float = 0.1, max_delay: float = 1.0):
+        if not 0 <= quiet <= max_delay:
+            raise ValueError('the delays must be 0 <= quiet <= max_delay')
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self._value: Optional[T] = None
+        self._pending = asyncio.Event()
+        self._first = 0.0
+        self._last = 0.0
+        self._burst_skipped = 0
+        # how many values were replaced by newer ones before being released
+        self.skipped = 0
+
+    def put(self, value: T):
+        now = asyncio.get_running_loop().time()
+        if self._pending.is_set():
+            self._burst_skipped += 1
+            self.skipped += 1
+        else:
+            self._first = now
+            self._pending.set()
+        self._value = value
+        self._last = now
+
+    def take(self) -> Optional[T]:
+        '''
+        @returns the latest value of the burst in progress without waiting
+                 for the burst to end, or None if there's no burst
+        '''
+        if not self._pending.is_set():
+            return None
+        value, self._value = self._value, None
+        self._burst_skipped = 0
+        self._pending.clear()
+        return value
+
+    async def get(self) -> Tuple[T, int]:
+        '''
+        waits for the end of the next burst
+        @returns the burst's latest value and how many values before it the
+                 burst skipped
+        '''
+        await self._pending.wait()
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline = min(
+                self._last + self.quiet, self._first + self.max_delay
+            )
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+
+        value, self._value = self._value, None
+        skipped, self._burst_skipped = self._burst_skipped, 0
+        self._pending.clear()
+        return value, skipped
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+
+from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.exception_sender import ExceptionSender, UnsentExceptions
+from inquest.comms.operations import PUBLISH_LOG
+from inquest.sampling import TraceLimiter
+from inquest.utils.exceptions import ProbeException
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ErrorReporter(ClientConsumer):
+    """
+    Collects the errors raised by trace statements and reports them in
+    batches. Errors with the same trace id and message are reported once
+    with the number of times they occurred, and each trace can report at
+    most rate_limit distinct errors per second (after a burst of burst).
+    An error that's held back keeps counting occurrences until its trace
+    may report again, as are the errors of a batch that failed to send
+    @param window: seconds between batches
+    @param max_pending: the most distinct errors held at once, errors past
+                        that are dropped and the number dropped is logged
+    """
+
+    def __init__(
+        self,
+        *,
+        exception_sender: ExceptionSender,
+        window: float = 1.0,
+        rate_limit: float = 0.2,
+        burst: float = 3,
+        max_pending: int = 1000,
+    ):
+        super().__init__()
+        self.exception_sender = exception_sender
+        self.window = window
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.max_pending = max_pending
+        # (trace_id, message) -> occurrences since it was last reported
+        self._pending: Dict[Tuple[str, str], int] = {}
+        # only the limiters of traces that reported recently, the others
+        # are full and so no different from a new one
+        self._limiters: Dict[str, TraceLimiter] = {}
+        self.dropped = 0
+        self._reported_dropped = 0
+
+    def report(self, trace_id: str, message: str, count: int = 1):
+        key = (trace_id, message)
+        if key in self._pending:
+            self._pending[key] += count
+        elif len(self._pending) < self.max_pending:
+            self._pending[key] = count
+        else:
+            self.dropped += count
+
+    def _take(self) -> Dict[Tuple[str, str], int]:
+        '''
+        @returns the pending errors whose traces may report now with their
+                 number of occurrences
+        '''
+        taken = {}
+        for key, count in list(self._pending.items()):
+            trace_id, _ = key
+            limiter = self._limiters.get(trace_id)
+            if limiter is None:
+                limiter = TraceLimiter(
+                    rate_limit=self.rate_limit, burst=self.burst
+                )
+                self._limiters[trace_id] = limiter
+            if not limiter.allow():
+                continue
+            del self._pending[key]
+            taken[key] = count
+
+        pending = {trace_id for trace_id, _ in self._pending}
+        for trace_id, limiter in list(self._limiters.items()):
+            if trace_id not in pending and limiter.refilled():
+                del self._limiters[trace_id]
+        return taken
+
+    @staticmethod
+    def _to_reports(taken: Dict[Tuple[str, str], int]) -> List[ProbeException]:
+        reports = []
+        for (trace_id, message), count in taken.items():
+            if count > 1:
+                message = f'{message} (occurred {count} times)'
+            reports.append(ProbeException(message=message, trace_id=trace_id))
+        return reports
+
+    def _take_reports(self) -> List[ProbeException]:
+        '''
+        @returns the pending errors whose traces may report now
+        '''
+        return self._to_reports(self._take())
+
+    def _requeue(self, taken: Dict[Tuple[str, str], int]):
+        for (trace_id, message), count in taken.items():
+            self.report(trace_id, message, count)
+
+    async def _report_dropped(self):
+        dropped = self.dropped - self._reported_dropped
+        if dropped == 0:
+            return
+        try:
+            await self.client.execute(
+                PUBLISH_LOG,
+                variable_values={
+                    'content':
+                        [
+                            f'inquest: dropped {dropped} errors because '
+                            + 'too many were waiting to be reported'
+                        ]
+                },
+            )
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.warning(
+                'failed to report dropped errors', extra={'error': err}
+            )
+            return
+        self._reported_dropped += dropped
+
+    async def _send(self):
+        taken = self._take()
+        if taken:
+            reports = self._to_reports(taken)
+            try:
+                await self.exception_sender.send_exceptions(reports)
+            except asyncio.CancelledError:
+                # sent on the next connection
+                self._requeue(taken)
+                raise
+            except UnsentExceptions as err:
+                # the reports follow the order of taken, and only the ones
+                # of the batches that failed are sent again
+                unsent = dict(
+                    list(taken.items())[len(reports) - len(err.unsent):]
+                )
+                LOGGER.warning(
+                    'failed to report errors',
+                    extra={
+                        'count': len(unsent),
+                        'error': err.__cause__,
+                    },
+                )
+                self._requeue(unsent)
+        await self._report_dropped()
+
+    async def main(self):
+        while True:
+            await asyncio.sleep(self.window)
+            await self._send()
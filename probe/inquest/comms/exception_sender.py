@@ -1,12 +1,48 @@
+import functools
 import logging
+from typing import List
 
 from gql import gql
 from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.operations import PROBE_FAILURE
 from inquest.comms.utils import log_result
 from inquest.utils.exceptions import MultiTraceException, ProbeException
 
 LOGGER = logging.getLogger(__name__)
 
+# the most failures sent in one mutation
+MAX_BATCH = 50
+
+
+class UnsentExceptions(Exception):
+    '''
+    raised when a batch of exceptions failed to send, the batches before it
+    were sent
+    @param unsent: the exceptions of the failed batch and the ones after it
+    '''
+
+    def __init__(self, unsent: List[ProbeException]):
+        super().__init__(unsent)
+        self.unsent = unsent
+
+
+@functools.lru_cache(maxsize=MAX_BATCH)
+def _batch_query(size: int):
+    '''
+    @returns a mutation creating size probe failures at once, each one
+             under its own alias
+    '''
+    variables = ', '.join(
+        f'$input{idx}: NewProbeFailureInput!' for idx in range(size)
+    )
+    fields = '\n'.join(
+        f'  failure{idx}: newProbeFailure(newProbeFailure: $input{idx}) '
+        + '{\n    message\n  }' for idx in range(size)
+    )
+    return gql(
+        f'mutation ProbeFailuresMutation({variables}) {{\n{fields}\n}}'
+    )
+
 
 class ExceptionSender(ClientConsumer):
 
@@ -14,15 +50,7 @@ class ExceptionSender(ClientConsumer):
 
     def __init__(self,):
         super().__init__()
-        self.query = gql(
-            '''
-mutation ProbeFailureMutation($input: NewProbeFailureInput!) {
-  newProbeFailure(newProbeFailure: $input) {
-    message
-  }
-}
-                   '''
-        )
+        self.query = PROBE_FAILURE
 
     async def _send_exception(self, exception: ProbeException):
         LOGGER.debug(
@@ -43,13 +71,39 @@ mutation ProbeFailureMutation($input: NewProbeFailureInput!) {
             )
         )
 
+    async def send_exceptions(self, exceptions: List[ProbeException]):
+        '''
+        sends the exceptions in as few round trips as possible
+        @raises UnsentExceptions: with the exceptions that weren't sent if a
+                                  batch failed
+        '''
+        for start in range(0, len(exceptions), MAX_BATCH):
+            batch = exceptions[start:start + MAX_BATCH]
+            LOGGER.debug('sending %d exceptions', len(batch))
+            try:
+                await self.client.execute(
+                    _batch_query(len(batch)),
+                    variable_values={
+                        f'input{idx}': {
+                            'message': str(exception.message),
+                            'traceId': exception.trace_id,
+                        }
+                        for idx, exception in enumerate(batch)
+                    },
+                )
+            except Exception as err:
+                raise UnsentExceptions(exceptions[start:]) from err
+
     async def send_exception(self, exception: Exception):
         if isinstance(exception, MultiTraceException):
             errors: MultiTraceException = exception
-            for error in errors.errors.items():
-                if not isinstance(error, ProbeException):
-                    error = ProbeException(message=str(error))
-                await self._send_exception(error)
+            await self.send_exceptions(
+                [
+                    error if isinstance(error, ProbeException) else
+                    ProbeException(message=str(error))
+                    for error in errors.errors.values()
+                ]
+            )
         elif isinstance(exception, ProbeException):
             await self._send_exception(exception)
         else:
@@ -1,9 +1,8 @@
 import asyncio
 import logging
 
-from gql import gql
-
 from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.operations import HEARTBEAT
 from inquest.comms.utils import wrap_log
 
 LOGGER = logging.getLogger(__name__)
@@ -17,15 +16,7 @@ class Heartbeat(ClientConsumer):
     def __init__(self, *, delay: int = 60):
         super().__init__()
         self.delay = delay
-        self.query = gql(
-            """\
-mutation HeartbeatMutation {
-  heartbeat {
-    isAlive
-  }
-}
-                    """
-        )
+        self.query = HEARTBEAT
 
     async def _send_heartbeat(self):
         return (await self.client.execute(self.query))
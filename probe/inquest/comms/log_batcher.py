@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from typing import Dict, Generic, List, NamedTuple, TypeVar
+
+from inquest.comms.log_buffer import EmissionBuffer
+from inquest.metrics import MetricAggregator
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# why a batch was flushed
+FLUSH_COUNT = 'count'
+FLUSH_BYTES = 'bytes'
+FLUSH_LATENCY = 'latency'
+FLUSH_REASONS = (FLUSH_COUNT, FLUSH_BYTES, FLUSH_LATENCY)
+
+
+class Batch(NamedTuple):
+    entries: List
+    size: int
+    reason: str
+
+
+def entry_size(entry) -> int:
+    '''
+    @returns the approximate number of bytes the entry adds to a batch
+    '''
+    return sum(len(str(field)) for field in entry)
+
+
+class LogBatcher(Generic[T]):
+    """
+    cuts the entries of an emission buffer into batches.
+    a batch is flushed once it holds max_count entries, max_bytes bytes or
+    its first entry has waited for the batching window, whichever comes
+    first. the window follows the average time a batch takes to send,
+    bounded by min_window and max_window: while the backend is slow to
+    answer waiting longer makes for fewer, fuller batches, while it's fast
+    logs go out with little delay
+    """
+
+    def __init__(
+        self,
+        log_buffer: EmissionBuffer[T],
+        *,
+        max_count: int = 1000,
+        max_bytes: int = 256 * 1024,
+        min_window: float = 0.01,
+        max_window: float = 1.0,
+        poll_interval: float = 0.01,
+    ):
+        if not 0 < min_window <= max_window:
+            raise ValueError('the window bounds must be 0 < min <= max')
+        self.log_buffer = log_buffer
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.min_window = min_window
+        self.max_window = max_window
+        self.poll_interval = poll_interval
+        self.window = min(max(0.05, min_window), max_window)
+        self.send_latency = None
+        # entries drained past the last batch's limits, and entries put
+        # back by requeue, which the next batches take first
+        self._carry: List[T] = []
+        self.batch_sizes = MetricAggregator()
+        self.batch_bytes = MetricAggregator()
+        self.flush_reasons: Dict[str, int] = {
+            reason: 0
+            for reason in FLUSH_REASONS
+        }
+
+    async def next_batch(self) -> Batch:
+        '''
+        waits for and returns the next batch of entries
+        '''
+        entries: List[T] = []
+        size = 0
+        pending, self._carry = self._carry, []
+        if not pending:
+            await self.log_buffer.wait()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while True:
+            if not pending:
+                pending = self.log_buffer.drain(self.max_count - len(entries))
+            for idx, entry in enumerate(pending):
+                # carried and requeued entries weren't drained against the
+                # batch's count, so they're checked like its bytes
+                if len(entries) >= self.max_count:
+                    self._carry = pending[idx:]
+                    return self._flush(entries, size, FLUSH_COUNT)
+                added = entry_size(entry)
+                if entries and size + added > self.max_bytes:
+                    self._carry = pending[idx:]
+                    return self._flush(entries, size, FLUSH_BYTES)
+                entries.append(entry)
+                size += added
+            pending = []
+
+            if size >= self.max_bytes:
+                return self._flush(entries, size, FLUSH_BYTES)
+            if len(entries) >= self.max_count:
+                return self._flush(entries, size, FLUSH_COUNT)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return self._flush(entries, size, FLUSH_LATENCY)
+            await asyncio.sleep(min(remaining, self.poll_interval))
+
+    def take_all(self) -> List[T]:
+        '''
+        @returns every entry that's waiting to be batched
+        '''
+        entries, self._carry = self._carry, []
+        return entries + self.log_buffer.drain()
+
+    def requeue(self, entries: List[T]):
+        '''
+        puts entries that couldn't be sent back ahead of the others
+        '''
+        self._carry = entries + self._carry
+
+    def _flush(self, entries: List[T], size: int, reason: str) -> Batch:
+        self.flush_reasons[reason] += 1
+        self.batch_sizes.observe(len(entries))
+        self.batch_bytes.observe(size)
+        LOGGER.debug(
+            'flushing batch',
+            extra={
+                'count': len(entries),
+                'size': size,
+                'reason': reason,
+            },
+        )
+        return Batch(entries=entries, size=size, reason=reason)
+
+    def record_send(self, latency: float):
+        '''
+        adapts the batching window to the time the last batch took to send
+        '''
+        if self.send_latency is None:
+            self.send_latency = latency
+        else:
+            self.send_latency = 0.8 * self.send_latency + 0.2 * latency
+        self.window = min(
+            max(self.send_latency, self.min_window), self.max_window
+        )
+
+    def stats(self) -> Dict[str, object]:
+        '''
+        @returns the flush reason counts, batch size summaries and the
+                 current window
+        '''
+        return {
+            'flush_reasons': dict(self.flush_reasons),
+            'batch_sizes': self.batch_sizes.summary(),
+            'batch_bytes': self.batch_bytes.summary(),
+            'window': self.window,
+            'send_latency': self.send_latency,
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import collections
+import threading
+from typing import Callable, Deque, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+
+class _Stripe:
+    """
+    the entries one thread buffered, only that thread appends to it and
+    bumps its drop counter. its limit is its share of the buffer's capacity
+    """
+
+    __slots__ = ('thread', 'entries', 'limit', 'dropped')
+
+    def __init__(self, thread: threading.Thread, limit: int):
+        self.thread = thread
+        self.entries: Deque = collections.deque()
+        self.limit = limit
+        self.dropped = 0
+
+
+class EmissionBuffer(Generic[T]):
+    """
+    bounded buffer between the threads hitting traces and the log sender.
+    each thread appends to its own deque, so producers never take a lock,
+    and the consumer is only signalled when it's waiting for entries rather
+    than on every put.
+    the capacity is split evenly across the threads' deques, and split
+    again whenever a thread starts buffering or a finished one is
+    forgotten, so the buffer as a whole holds at most capacity entries, or
+    one per thread once there are more threads than that.
+    entries keep their order within a thread but not across threads.
+    when a thread's deque is full either its oldest entry or the new one is
+    dropped depending on the policy, the drop counts are approximate
+    """
+
+    def __init__(self, *, capacity: int = 10000, policy: str = DROP_OLDEST):
+        if capacity <= 0:
+            raise ValueError('capacity must be positive')
+        if policy not in POLICIES:
+            raise ValueError(f'unknown drop policy {policy}')
+        self.capacity = capacity
+        self.policy = policy
+        self._local = threading.local()
+        # replaced as a whole when a thread registers, never mutated
+        self._stripes: Tuple[_Stripe, ...] = ()
+        self._lock = threading.Lock()
+        self._wakeup: Optional[Callable[[], None]] = None
+        # where the next drain starts so no thread's entries are favored
+        self._next_stripe = 0
+        # the drops of threads that finished and were forgotten, and of
+        # the entries over a deque's limit when the capacity was split again
+        self._other_dropped = 0
+
+    def _register(self) -> _Stripe:
+        stripe = _Stripe(threading.current_thread(), self.capacity)
+        self._local.stripe = stripe
+        with self._lock:
+            self._set_stripes([*self._unfinished_stripes(), stripe])
+        return stripe
+
+    def _unfinished_stripes(self) -> List[_Stripe]:
+        '''
+        @returns the stripes of the threads that are alive or whose entries
+                 weren't drained yet, the others are forgotten
+        '''
+        stripes = []
+        for stripe in self._stripes:
+            if stripe.thread.is_alive() or stripe.entries:
+                stripes.append(stripe)
+            else:
+                self._other_dropped += stripe.dropped
+        return stripes
+
+    def _set_stripes(self, stripes: List[_Stripe]):
+        '''
+        splits the capacity across the stripes, dropping the entries over
+        a stripe's new limit by the policy. called with the lock held
+        '''
+        limit = max(1, self.capacity // max(1, len(stripes)))
+        for stripe in stripes:
+            stripe.limit = limit
+            entries = stripe.entries
+            while len(entries) > limit:
+                try:
+                    if self.policy == DROP_NEWEST:
+                        entries.pop()
+                    else:
+                        entries.popleft()
+                except IndexError:
+                    # drained in the meantime
+                    break
+                self._other_dropped += 1
+        self._stripes = tuple(stripes)
+
+    def put(self, entry: T) -> bool:
+        '''
+        @returns whether or not the entry was buffered
+        '''
+        try:
+            stripe = self._local.stripe
+        except AttributeError:
+            stripe = self._register()
+
+        entries = stripe.entries
+        if len(entries) >= stripe.limit:
+            stripe.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return False
+            try:
+                entries.popleft()
+            except IndexError:
+                # drained in the meantime
+                pass
+        entries.append(entry)
+
+        wakeup = self._wakeup
+        if wakeup is not None:
+            self._wakeup = None
+            wakeup()
+        return True
+
+    def drain(self, max_entries: Optional[int] = None) -> List[T]:
+        '''
+        @returns up to max_entries of the buffered entries
+        '''
+        drained: List[T] = []
+        stripes = self._stripes
+        for offset in range(len(stripes)):
+            stripe = stripes[(self._next_stripe + offset) % len(stripes)]
+            entries = stripe.entries
+            while entries and (
+                    max_entries is None or len(drained) < max_entries):
+                drained.append(entries.popleft())
+        if stripes:
+            self._next_stripe = (self._next_stripe + 1) % len(stripes)
+        self._forget_finished_threads()
+        return drained
+
+    def _forget_finished_threads(self):
+        if all(stripe.thread.is_alive() for stripe in self._stripes):
+            return
+        with self._lock:
+            stripes = self._unfinished_stripes()
+            if len(stripes) != len(self._stripes):
+                self._set_stripes(stripes)
+
+    def dropped(self) -> int:
+        '''
+        @returns the number of entries dropped so far
+        '''
+        return self._other_dropped + sum(
+            stripe.dropped for stripe in self._stripes
+        )
+
+    async def wait(self):
+        '''
+        waits until there's at least one buffered entry
+        '''
+        loop = asyncio.get_running_loop()
+        while len(self) == 0:
+            ready = asyncio.Event()
+
+            def wakeup():
+                try:
+                    loop.call_soon_threadsafe(ready.set)
+                except RuntimeError:
+                    # the loop was closed
+                    pass
+
+            self._wakeup = wakeup
+            # an entry put before the wakeup was set wouldn't have woken us
+            if len(self) != 0:
+                self._wakeup = None
+                break
+            await ready.wait()
+
+    def __len__(self):
+        return sum(len(stripe.entries) for stripe in self._stripes)
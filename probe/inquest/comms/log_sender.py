@@ -1,15 +1,20 @@
 import asyncio
 import logging
-from typing import List, NamedTuple, Union
+from typing import Dict, List, NamedTuple, Optional, Union
 
-import janus
-from gql import gql
+from gql.transport.exceptions import TransportClosed
 
+from inquest.comms.bulk_log_transport import BulkLogTransport
 from inquest.comms.client_consumer import ClientConsumer
-from inquest.comms.exception_sender import ExceptionSender
+from inquest.comms.error_reporter import ErrorReporter
+from inquest.comms.log_batcher import Batch, LogBatcher
+from inquest.comms.log_buffer import DROP_OLDEST, EmissionBuffer
+from inquest.comms.operations import PUBLISH_LOG
+from inquest.comms.scheduler import BULK
+from inquest.comms.send_window import SendWindow
+from inquest.comms.spill_file import SpillFile
 from inquest.comms.utils import wrap_log
 from inquest.logging import Callback, with_callback
-from inquest.utils.exceptions import ProbeException
 
 LOGGER = logging.getLogger(__name__)
 
@@ -25,49 +30,93 @@ class Error(NamedTuple):
 
 class LogSenderCallback(Callback):
 
-    def __init__(self, log_queue):
+    def __init__(self, log_buffer: EmissionBuffer):
         super().__init__()
-        self.log_queue = log_queue
+        self.log_buffer = log_buffer
 
     def log(self, value: str):
-        try:
-            self.log_queue.sync_q.put(Log(value))
-        except asyncio.QueueFull as error:
-            LOGGER.error(error)
+        self.log_buffer.put(Log(value))
 
     def error(self, trace_id: str, value: str):
-        try:
-            self.log_queue.sync_q.put(Error(trace_id, value))
-        except asyncio.QueueFull as error:
-            LOGGER.error(error)
+        self.log_buffer.put(Error(trace_id, value))
 
 
 class LogSender(ClientConsumer):
+    """
+    Sends the traces' logs to the backend in batches
+    @param capacity: how many logs can be buffered before some are dropped
+    @param policy: whether the oldest or the newest logs are dropped
+    @param batching: options for the LogBatcher cutting the logs into batches
+    @param max_in_flight: how many batches can be sent at once
+    @param spill_path: if set, logs that can't be sent are kept in a spill
+                       file at this path and replayed in order once the
+                       backend is reachable again, as are the logs still
+                       buffered when the sender stops
+    @param spill_size: the most bytes the spill file takes up
+    @param replay_delay: seconds to wait before retrying a failed replay,
+                         doubled after each failure up to max_replay_delay
+    @param transport: if set, logs are posted through it to the bulk log
+                      endpoint rather than sent with publishLog
+    without a spill file, logs whose send was cut off by the connection
+    closing are put back in front of the buffered ones to go out once the
+    sender is restarted on a new connection
+    """
 
-    def __init__(self, *, exception_sender: ExceptionSender):
+    priority = BULK
+
+    def __init__(
+        self,
+        *,
+        error_reporter: ErrorReporter,
+        capacity: int = 10000,
+        policy: str = DROP_OLDEST,
+        batching: Optional[Dict[str, float]] = None,
+        max_in_flight: int = 4,
+        spill_path: Optional[str] = None,
+        spill_size: int = 64 * 1024 * 1024,
+        replay_delay: float = 1.0,
+        max_replay_delay: float = 30.0,
+        transport: Optional[BulkLogTransport] = None,
+    ):
         super().__init__()
-        self.exception_sender = exception_sender
-
-        self.log_queue: asyncio.Queue = None
-        self.query = gql(
-            """\
-mutation PublishLogMutation($content: [String!]!) {
-  publishLog(content: $content)
-}
-                    """
+        self.error_reporter = error_reporter
+
+        self.log_buffer: EmissionBuffer[Union[Log, Error]] = EmissionBuffer(
+            capacity=capacity, policy=policy
         )
+        self.batcher = LogBatcher(self.log_buffer, **(batching or {}))
+        self.send_window = SendWindow(max_in_flight)
+        self._reported_dropped = 0
+        self.spill_path = spill_path
+        self.spill_size = spill_size
+        self.replay_delay = replay_delay
+        self.max_replay_delay = max_replay_delay
+        self.spill: Optional[SpillFile] = None
+        self._spilled = asyncio.Event()
+        self.transport = transport
+        self.query = PUBLISH_LOG
 
     async def __aenter__(self):
         await super().__aenter__()
-        self.log_queue = janus.Queue()
+        if self.transport is not None:
+            await self.enter_async_context(self.transport)
+        if self.spill_path is not None:
+            self.spill = SpillFile(self.spill_path, self.spill_size)
+            self.callback(self.spill.close)
+            # runs after the callback below is removed
+            self.callback(self._spill_remaining)
+            if self.spill.pending():
+                self._spilled.set()
         self.enter_context(with_callback(self.gen_callback()))
         return self
 
     def gen_callback(self):
-        return LogSenderCallback(self.log_queue)
+        return LogSenderCallback(self.log_buffer)
 
     async def _send_log(self, log_content: List[str]):
         LOGGER.debug('sending: %s', log_content)
+        if self.transport is not None:
+            return await self.transport.send(self.trace_set_id, log_content)
         params = {
             "content": log_content,
             "traceSetId": self.trace_set_id,
@@ -78,6 +127,95 @@ mutation PublishLogMutation($content: [String!]!) {
             self.client.execute(self.query, variable_values=params),
         )
 
+    def _spill(self, lines: List[str]):
+        written = self.spill.append(lines)
+        LOGGER.debug(
+            'spilled logs',
+            extra={
+                'count': written,
+                'dropped': len(lines) - written,
+            },
+        )
+        self._spilled.set()
+
+    def _spill_remaining(self):
+        logs = []
+        for log_content in self.batcher.take_all():
+            self.add_to_buffers(logs, [], log_content)
+        if logs:
+            self._spill([log.log for log in logs])
+
+    async def _publish(self, lines: List[str]):
+        '''
+        sends the lines, or with a spill file, puts them in the spill file
+        if older lines are still waiting in it or the send fails
+        '''
+        if self.spill is not None and self.spill.pending():
+            self._spill(lines)
+            return
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            await self._send_log(lines)
+        except asyncio.CancelledError:
+            # the sender is stopping, the spill file is closed once it has
+            if self.spill is None:
+                # kept for when the sender is restarted on a new connection
+                self.batcher.requeue([Log(line) for line in lines])
+            elif not self.spill.closed:
+                self._spill(lines)
+            raise
+        except Exception as err:  # pylint: disable=broad-except
+            if self.spill is None:
+                if isinstance(err, TransportClosed):
+                    self.batcher.requeue([Log(line) for line in lines])
+                raise
+            self._spill(lines)
+            return
+        self.batcher.record_send(loop.time() - started)
+
+    async def _replay(self):
+        '''
+        sends the spilled lines in order, committing each batch once the
+        backend acknowledged it
+        '''
+        delay = self.replay_delay
+        while True:
+            await self._spilled.wait()
+            if not self.spill.pending():
+                self._spilled.clear()
+                continue
+
+            lines, offset = self.spill.read(self.batcher.max_count)
+            try:
+                await self._send_log(lines)
+            except Exception as err:  # pylint: disable=broad-except
+                LOGGER.warning(
+                    'failed to replay spilled logs',
+                    extra={
+                        'error': err,
+                        'retry_in': delay,
+                    },
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_replay_delay)
+                continue
+            delay = self.replay_delay
+            self.spill.commit(offset)
+
+    def batch_stats(self) -> Dict[str, object]:
+        '''
+        @returns the batch sizes, flush reasons, batching window and the
+                 number of batches in flight, acknowledged and failed
+        '''
+        return {
+            **self.batcher.stats(),
+            'in_flight': self.send_window.in_flight,
+            'acked': self.send_window.acked,
+            'failed': self.send_window.failed,
+        }
+
     @staticmethod
     def add_to_buffers(
         log_buffer: List[Log], error_buffer: List[Error],
@@ -88,54 +226,76 @@ mutation PublishLogMutation($content: [String!]!) {
         elif isinstance(log_content, Error):
             error_buffer.append(log_content)
 
+    def _dropped_report(self) -> List[str]:
+        '''
+        @returns a line saying how many logs were dropped since the last
+                 report if any were
+        '''
+        dropped = self.log_buffer.dropped()
+        if self.spill is not None:
+            dropped += self.spill.dropped
+        newly_dropped = dropped - self._reported_dropped
+        self._reported_dropped = dropped
+        if newly_dropped == 0:
+            return []
+        return [
+            f'inquest: dropped {newly_dropped} logs because the probe\'s '
+            + 'buffer was full'
+        ]
+
     async def main(self):
         LOGGER.info("sending logs")
 
-        next_queue_value = asyncio.create_task(self.log_queue.async_q.get())
-        while True:
-            logs = []
-            errors = []
-            log_content = await next_queue_value
-            self.add_to_buffers(logs, errors, log_content)
-            self.log_queue.async_q.task_done()
-            sleep_task = asyncio.create_task(asyncio.sleep(0.05))
-
-            buffering = True
+        sends = set()
+        if self.spill is not None:
+            replay = asyncio.create_task(self._replay())
+            sends.add(replay)
+        try:
+            while True:
+                # a slot is taken before the next batch is cut so that while
+                # the backend is congested the logs wait in the bounded
+                # buffer, which drops them by its policy once it's full
+                seq = await self.send_window.acquire()
+                try:
+                    batch = await self.batcher.next_batch()
+                except BaseException:
+                    # the sender is stopped while waiting for logs, which
+                    # happens on every reconnect
+                    self.send_window.cancel(seq)
+                    raise
+                send = asyncio.create_task(self._send_batch(seq, batch))
+                sends.add(send)
+                send.add_done_callback(sends.discard)
+        finally:
+            for send in sends:
+                send.cancel()
+            # the cancelled sends spill or requeue their logs, which has to
+            # happen before the spill file is closed
+            await asyncio.gather(*sends, return_exceptions=True)
 
-            # buffer up the messages
+        LOGGER.info("logs finished being sent")
 
-            while buffering:
-                next_queue_value = asyncio.create_task(
-                    self.log_queue.async_q.get()
-                )
-                finished, unfinished = await asyncio.wait(
-                    [
-                        sleep_task,
-                        next_queue_value,
-                    ],
-                    return_when=asyncio.FIRST_COMPLETED
-                )
-                buffering = sleep_task in unfinished
-                if next_queue_value in finished:
-                    self.add_to_buffers(logs, errors, await next_queue_value)
-                    self.log_queue.async_q.task_done()
-                    if not buffering:
-                        next_queue_value = asyncio.create_task(
-                            self.log_queue.async_q.get()
-                        )
+    async def _send_batch(self, seq: int, batch: Batch):
+        acked = False
+        try:
+            logs = []
+            errors = []
+            for log_content in batch.entries:
+                self.add_to_buffers(logs, errors, log_content)
+            logs.extend(Log(line) for line in self._dropped_report())
 
             if len(logs) != 0:
-                await self._send_log([log.log for log in logs])
-            if len(errors) != 0:
-                await asyncio.gather(
-                    [
-                        self.exception_sender.send_exception(
-                            ProbeException(
-                                message=str(log_content.error),
-                                trace_id=log_content.trace_id,
-                            )
-                        ) for log_content in errors
-                    ]
-                )
-
-        LOGGER.info("logs finished being sent")
+                await self._publish([log.log for log in logs])
+            for error in errors:
+                self.error_reporter.report(error.trace_id, str(error.error))
+            acked = True
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.warning(
+                'failed to send logs',
+                extra={
+                    'seq': seq,
+                    'error': err,
+                },
+            )
+        finally:
+            self.send_window.release(seq, acked=acked)
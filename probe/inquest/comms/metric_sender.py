@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Dict, List
+
+import inquest.logging
+from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.operations import PUBLISH_LOG
+from inquest.comms.scheduler import BULK
+from inquest.comms.utils import wrap_log
+from inquest.metrics import MetricAggregator
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _format(value: float) -> str:
+    return f'{value:.6g}'
+
+
+def format_metric(trace_id: str, aggregator: MetricAggregator) -> str:
+    summary = aggregator.summary()
+    fields = ' '.join(
+        f'{key}={_format(value)}' for key, value in summary.items()
+        if key != 'count'
+    )
+    return (
+        f'inquest: {aggregator.kind} {trace_id} '
+        + f'count={summary["count"]} {fields}'
+    )
+
+
+class MetricSender(ClientConsumer):
+    """
+    Periodically flushes the values metric and latency traces aggregated
+    and publishes one summary line per trace instead of one log line per hit
+    """
+
+    priority = BULK
+
+    def __init__(self, *, delay: int = 10):
+        super().__init__()
+        self.delay = delay
+        self.query = PUBLISH_LOG
+
+    @staticmethod
+    def _report(metrics: Dict[str, MetricAggregator]) -> List[str]:
+        return [
+            format_metric(trace_id, aggregator)
+            for trace_id, aggregator in sorted(metrics.items())
+        ]
+
+    async def main(self):
+        while True:
+            await asyncio.sleep(self.delay)
+            lines = self._report(inquest.logging.flush_metrics())
+            if lines:
+                LOGGER.debug('sending metrics', extra={'lines': lines})
+                await wrap_log(
+                    LOGGER,
+                    self.client.execute(
+                        self.query, variable_values={'content': lines}
+                    ),
+                    mute_error=True,
+                )
@@ -1,8 +1,9 @@
 import logging
 from typing import List, Optional, Union
 
-from gql import gql
 from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.operations import NEW_FILE_CONTENT
+from inquest.comms.scheduler import BULK
 from inquest.comms.utils import wrap_log
 from inquest.file_module_resolver import get_root_dir
 from inquest.file_sender import FileSender
@@ -13,6 +14,7 @@ LOGGER = logging.getLogger(__name__)
 
 class ModuleSender(ClientConsumer):
     initialization = True
+    priority = BULK
 
     def __init__(
         self,
@@ -26,15 +28,7 @@ class ModuleSender(ClientConsumer):
         self.root_dir = get_root_dir()
         self.glob = glob
         self.exclude = exclude
-        self.query = gql(
-            """
-mutation NewFileContentMutation($input: FileContentInput!) {
-  newFileContent(fileInput: $input) {
-    name
-  }
-}
-            """
-        )
+        self.query = NEW_FILE_CONTENT
 
     async def __aenter__(self):
         await super().__aenter__()
@@ -0,0 +1,202 @@
+from typing import Dict
+
+from gql import gql
+from graphql import DocumentNode, get_operation_ast
+
+# every operation the probe sends by its name, each parsed once when the
+# comms are first imported rather than whenever a consumer is created
+OPERATIONS: Dict[str, DocumentNode] = {}
+
+
+def _register(source: str) -> DocumentNode:
+    document = gql(source)
+    OPERATIONS[get_operation_ast(document).name.value] = document
+    return document
+
+
+NEW_PROBE = _register(
+    """\
+mutation NewProbeMutation($traceSetId: String!) {
+  newProbe(traceSetId: $traceSetId) {
+    id
+  }
+}
+"""
+)
+
+HEARTBEAT = _register(
+    """\
+mutation HeartbeatMutation {
+  heartbeat {
+    isAlive
+  }
+}
+"""
+)
+
+PUBLISH_LOG = _register(
+    """\
+mutation PublishLogMutation($content: [String!]!) {
+  publishLog(content: $content)
+}
+"""
+)
+
+PROBE_FAILURE = _register(
+    """\
+mutation ProbeFailureMutation($input: NewProbeFailureInput!) {
+  newProbeFailure(newProbeFailure: $input) {
+    message
+  }
+}
+"""
+)
+
+NEW_FILE_CONTENT = _register(
+    """\
+mutation NewFileContentMutation($input: FileContentInput!) {
+  newFileContent(fileInput: $input) {
+    name
+  }
+}
+"""
+)
+
+INITIAL_PROBE_INFO = _register(
+    """\
+query InitialProbeInfo {
+  thisProbe {
+    traceSet {
+      id
+      desiredSet {
+        id
+        function {
+          name
+          parentClass {
+            name
+          }
+          file {
+            name
+          }
+        }
+        statement
+        line
+      }
+    }
+  }
+}
+"""
+)
+
+PROBE_NOTIFICATION = _register(
+    """\
+subscription probeNotification($traceSetId: String!){
+  probeNotification(traceSetId: $traceSetId) {
+    message
+    traceSet {
+      id
+      desiredSet {
+        id
+        function {
+          name
+          parentClass {
+            name
+          }
+          file {
+            name
+          }
+        }
+        statement
+        line
+      }
+    }
+  }
+}
+"""
+)
+
+# the delta protocol, used when the backend's schema has it. each delta
+# carries the sequence number of the desired set it results in, so a gap
+# in the sequence shows a delta was missed and the probe resyncs from a
+# full snapshot. the backend answers a new subscription right away with an
+# empty delta at its current sequence, which tells the probe the
+# subscription is established
+DESIRED_SET_SNAPSHOT = _register(
+    """\
+query DesiredSetSnapshot {
+  thisProbe {
+    traceSet {
+      id
+      desiredSetSequence
+      desiredSet {
+        id
+        function {
+          name
+          parentClass {
+            name
+          }
+          file {
+            name
+          }
+        }
+        statement
+        line
+      }
+    }
+  }
+}
+"""
+)
+
+PROBE_DELTA_NOTIFICATION = _register(
+    """\
+subscription probeDeltaNotification($traceSetId: String!){
+  probeDeltaNotification(traceSetId: $traceSetId) {
+    sequence
+    removed
+    added {
+      id
+      function {
+        name
+        parentClass {
+          name
+        }
+        file {
+          name
+        }
+      }
+      statement
+      line
+    }
+    changed {
+      id
+      function {
+        name
+        parentClass {
+          name
+        }
+        file {
+          name
+        }
+      }
+      statement
+      line
+    }
+  }
+}
+"""
+)
+
+
+def supports_deltas(schema) -> bool:
+    '''
+    @returns whether the backend with the schema sends desired set deltas
+    '''
+    if schema is None or schema.subscription_type is None:
+        return False
+    trace_set = schema.get_type('TraceSet')
+    return (
+        'probeDeltaNotification' in schema.subscription_type.fields
+        and trace_set is not None
+        and 'desiredSetSequence' in trace_set.fields
+    )
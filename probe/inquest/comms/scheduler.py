@@ -0,0 +1,169 @@
+import asyncio
+import collections
+import logging
+from typing import Any, Deque, Dict, Optional
+
+from inquest.metrics import MetricAggregator
+
+LOGGER = logging.getLogger(__name__)
+
+# heartbeats, probe failures and desired set queries
+CONTROL = 'control'
+# logs, metrics and other reports that can wait
+BULK = 'bulk'
+PRIORITIES = (CONTROL, BULK)
+
+
+class OutboundScheduler:
+    """
+    schedules the requests all consumers send over the one client.
+    at most max_in_flight requests are outstanding at once and reserved of
+    those slots are only ever given to control requests, so a flood of bulk
+    requests can't make a control request wait for more than one request
+    to finish. waiting control requests go first, but after control_weight
+    control requests in a row a waiting bulk request gets its turn so bulk
+    traffic isn't starved either
+    """
+
+    def __init__(
+        self,
+        client,
+        *,
+        max_in_flight: int = 4,
+        reserved: int = 1,
+        control_weight: int = 4,
+    ):
+        if not 0 < reserved < max_in_flight:
+            raise ValueError('reserved must be in (0, max_in_flight)')
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.reserved = reserved
+        self.control_weight = control_weight
+        self._lanes: Dict[str, Deque[asyncio.Future]] = {
+            priority: collections.deque()
+            for priority in PRIORITIES
+        }
+        self._in_flight = {priority: 0 for priority in PRIORITIES}
+        self._control_streak = 0
+        # seconds each request waited for a slot, by priority
+        self.wait_times = {
+            priority: MetricAggregator()
+            for priority in PRIORITIES
+        }
+
+    def _can_start(self, priority: str) -> bool:
+        in_flight = sum(self._in_flight.values())
+        if in_flight >= self.max_in_flight:
+            return False
+        if priority == BULK:
+            return self._in_flight[BULK] < self.max_in_flight - self.reserved
+        return True
+
+    def _next_lane(self) -> Optional[str]:
+        control_waiting = self._has_waiters(CONTROL)
+        bulk_waiting = self._has_waiters(BULK) and self._can_start(BULK)
+        if bulk_waiting and (
+                not control_waiting
+                or self._control_streak >= self.control_weight):
+            return BULK
+        if control_waiting and self._can_start(CONTROL):
+            return CONTROL
+        return None
+
+    def _has_waiters(self, priority: str) -> bool:
+        lane = self._lanes[priority]
+        # waiters that were cancelled are skipped
+        while lane and lane[0].done():
+            lane.popleft()
+        return bool(lane)
+
+    def _dispatch(self):
+        while True:
+            priority = self._next_lane()
+            if priority is None:
+                return
+            waiter = self._lanes[priority].popleft()
+            self._start(priority)
+            waiter.set_result(None)
+
+    def _start(self, priority: str):
+        self._in_flight[priority] += 1
+        if priority == CONTROL:
+            self._control_streak += 1
+        else:
+            self._control_streak = 0
+
+    def _release(self, priority: str):
+        self._in_flight[priority] -= 1
+        self._dispatch()
+
+    async def _acquire(self, priority: str):
+        if not self._has_waiters(priority) and self._can_start(priority):
+            self._start(priority)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was given to us as we were cancelled
+                self._release(priority)
+            raise
+
+    async def execute(
+        self,
+        document,
+        variable_values: Optional[Dict[str, Any]] = None,
+        *,
+        priority: str = CONTROL,
+    ):
+        loop = asyncio.get_running_loop()
+        queued = loop.time()
+        await self._acquire(priority)
+        self.wait_times[priority].observe(loop.time() - queued)
+        try:
+            result = await self.client.execute(
+                document, variable_values=variable_values
+            )
+        finally:
+            self._release(priority)
+        # the client's asyncio.wait_for returns the result rather than
+        # raising when it's cancelled as the request finishes (before python
+        # 3.12), which would leave a stopped consumer running
+        cancelling = getattr(asyncio.current_task(), 'cancelling', None)
+        if cancelling is not None and cancelling():
+            raise asyncio.CancelledError()
+        return result
+
+
+class ScheduledClient:
+    """
+    the client a consumer is handed, its requests go through the scheduler
+    at the consumer's priority. subscriptions are long lived streams rather
+    than requests so they go straight to the client
+    """
+
+    def __init__(self, scheduler: OutboundScheduler, priority: str):
+        if priority not in PRIORITIES:
+            raise ValueError(f'unknown priority {priority}')
+        self.scheduler = scheduler
+        self.priority = priority
+
+    async def execute(self, document, variable_values=None):
+        return await self.scheduler.execute(
+            document, variable_values, priority=self.priority
+        )
+
+    @property
+    def schema(self):
+        '''
+        @returns the schema the backend's connection was validated against
+        '''
+        return self.scheduler.client.client.schema
+
+    def subscribe(self, document, variable_values=None):
+        return self.scheduler.client.subscribe(
+            document, variable_values=variable_values
+        )
@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import re
+import tempfile
+from typing import Dict, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+
+def default_directory() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache'
+    )
+    return os.path.join(cache_home, 'inquest')
+
+
+class SchemaCache:
+    """
+    keeps the backend's introspected schema on disk by the backend's
+    version and the hash of its schema, so once a probe has loaded the
+    schema of a build of the backend the probes started after it skip
+    introspection. the hash tells apart builds that share a version
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory if directory is not None else \
+            default_directory()
+
+    def path(self, version: str, schema_hash: str) -> str:
+        # both are only ever used as part of the file's name
+        name = re.sub(r'[^\w.-]', '_', f'{version}-{schema_hash}')
+        return os.path.join(self.directory, f'schema-{name}.json')
+
+    def load(self, version: str, schema_hash: str) -> Optional[Dict]:
+        '''
+        @returns the introspection result stored for the version and schema
+                 hash if there is a readable one
+        '''
+        try:
+            with open(
+                    self.path(version, schema_hash), encoding='utf8'
+            ) as cached:
+                return json.load(cached)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            LOGGER.debug(
+                'failed to read cached schema',
+                extra={
+                    'version': version,
+                    'schema_hash': schema_hash,
+                    'error': err,
+                },
+            )
+            return None
+
+    def store(self, version: str, schema_hash: str, introspection: Dict):
+        '''
+        stores the introspection result for the version and schema hash,
+        it's written to a temporary file first so that a probe starting at
+        the same time never reads half of it
+        '''
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(
+                dir=self.directory, suffix='.tmp'
+            )
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf8') as output:
+                    json.dump(introspection, output)
+                os.replace(temporary, self.path(version, schema_hash))
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        except OSError as err:
+            LOGGER.warning(
+                'failed to cache schema',
+                extra={
+                    'version': version,
+                    'schema_hash': schema_hash,
+                    'error': err,
+                },
+            )
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Set
+
+
+class SendWindow:
+    """
+    bounds how many requests are in flight at once and tracks, in the
+    order they were started, which of them completed.
+    completed_through is the highest sequence number at or below which
+    every request completed, either acknowledged or failed
+    """
+
+    def __init__(self, size: int = 4):
+        if size <= 0:
+            raise ValueError('size must be positive')
+        self.size = size
+        self._slots = asyncio.Semaphore(size)
+        self._in_flight: Set[int] = set()
+        self._next_seq = 0
+        self.completed_through = -1
+        self.acked = 0
+        self.failed = 0
+
+    async def acquire(self) -> int:
+        '''
+        waits for a free slot
+        @returns the sequence number of the request taking the slot
+        '''
+        await self._slots.acquire()
+        seq = self._next_seq
+        self._next_seq += 1
+        self._in_flight.add(seq)
+        return seq
+
+    def release(self, seq: int, *, acked: bool):
+        '''
+        frees the slot of the request with sequence number seq
+        '''
+        if acked:
+            self.acked += 1
+        else:
+            self.failed += 1
+        self.cancel(seq)
+
+    def cancel(self, seq: int):
+        '''
+        frees the slot of the request with sequence number seq without
+        counting it, for a slot taken by a request that was never started
+        '''
+        self._in_flight.remove(seq)
+        if self._in_flight:
+            self.completed_through = min(self._in_flight) - 1
+        else:
+            self.completed_through = self._next_seq - 1
+        self._slots.release()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
@@ -0,0 +1,171 @@
+import logging
+import mmap
+import os
+import struct
+from typing import List, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+_MAGIC = b'INQS'
+# magic, padding, read offset, write offset
+_HEADER = struct.Struct('<4s4xQQ')
+# the length of the record that follows
+_RECORD = struct.Struct('<I')
+
+
+class SpillFile:
+    """
+    append only file of log lines that's memory mapped at its full size.
+    the header holds the offset of the first unread record and the offset
+    the next record is written at. a record is written before the write
+    offset is moved past it and a read only counts once its offset is
+    committed, so after a crash reading resumes from the last commit and a
+    half written record is never seen.
+    once everything written was read both offsets go back to the start.
+    when a line doesn't fit the unread records are moved to the start if
+    that doesn't write over them, otherwise lines that don't fit are
+    dropped
+    """
+
+    def __init__(self, path: str, max_size: int = 64 * 1024 * 1024):
+        if max_size <= _HEADER.size + _RECORD.size:
+            raise ValueError('max_size is too small')
+        self.path = path
+        self.max_size = max_size
+        self.dropped = 0
+        # the bytes the records were moved towards the start in total, the
+        # offsets read hands out include it so that they still point at the
+        # same record once it was moved
+        self._moved = 0
+
+        exists = os.path.exists(path)
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if os.fstat(self._file.fileno()).st_size != max_size:
+            self._file.truncate(max_size)
+        self._map = mmap.mmap(self._file.fileno(), max_size)
+
+        magic, self.read_offset, self.write_offset = _HEADER.unpack_from(
+            self._map
+        )
+        if magic != _MAGIC or not (
+                _HEADER.size <= self.read_offset <= self.write_offset <=
+                max_size):
+            if exists:
+                LOGGER.warning(
+                    'resetting invalid spill file', extra={'path': path}
+                )
+            self.read_offset = self.write_offset = _HEADER.size
+            self._write_header()
+
+    def _write_header(self):
+        _HEADER.pack_into(
+            self._map, 0, _MAGIC, self.read_offset, self.write_offset
+        )
+        self._map.flush(0, min(mmap.PAGESIZE, self.max_size))
+
+    def pending(self) -> bool:
+        '''
+        @returns whether there are records that weren't read yet
+        '''
+        return self.read_offset < self.write_offset
+
+    def _flush(self, start: int, end: int):
+        # flushes have to start at a multiple of the allocation granularity
+        if end <= start:
+            return
+        start -= start % mmap.ALLOCATIONGRANULARITY
+        self._map.flush(start, end - start)
+
+    def _compact(self):
+        '''
+        moves the unread records to the start, unless they'd be written over
+        before they're all moved. until the header points at their new
+        place the records are still where it says they are
+        '''
+        unread = self.write_offset - self.read_offset
+        shift = self.read_offset - _HEADER.size
+        if shift == 0 or unread > shift:
+            return
+        self._map.move(_HEADER.size, self.read_offset, unread)
+        self._flush(_HEADER.size, _HEADER.size + unread)
+        self._moved += shift
+        self.read_offset = _HEADER.size
+        self.write_offset = _HEADER.size + unread
+        self._write_header()
+
+    def append(self, lines: List[str]) -> int:
+        '''
+        @returns how many of the lines were written
+        '''
+        start = offset = self.write_offset
+        written = 0
+        compacted = False
+        for line in lines:
+            data = line.encode('utf8')
+            end = offset + _RECORD.size + len(data)
+            if end > self.max_size and not compacted:
+                compacted = True
+                self._flush(start, offset)
+                self.write_offset = offset
+                self._compact()
+                start = offset = self.write_offset
+                end = offset + _RECORD.size + len(data)
+            if end > self.max_size:
+                break
+            _RECORD.pack_into(self._map, offset, len(data))
+            self._map[offset + _RECORD.size:end] = data
+            offset = end
+            written += 1
+        self.dropped += len(lines) - written
+        if written:
+            self._flush(start, offset)
+            self.write_offset = offset
+            self._write_header()
+        return written
+
+    def read(self, max_count: int) -> Tuple[List[str], int]:
+        '''
+        @returns up to max_count unread lines and the offset to commit once
+                 they're handled
+        '''
+        lines = []
+        offset = self.read_offset
+        while offset < self.write_offset and len(lines) < max_count:
+            # a length running past the written records means the file
+            # was damaged
+            start = offset + _RECORD.size
+            end = None
+            if start <= self.write_offset:
+                (length,) = _RECORD.unpack_from(self._map, offset)
+                end = start + length
+            if end is None or end > self.write_offset:
+                LOGGER.warning(
+                    'skipping corrupt spilled logs',
+                    extra={
+                        'path': self.path,
+                        'offset': offset,
+                    },
+                )
+                offset = self.write_offset
+                break
+            lines.append(self._map[start:end].decode('utf8', 'replace'))
+            offset = end
+        return lines, offset + self._moved
+
+    def commit(self, offset: int):
+        '''
+        marks everything before offset as read
+        '''
+        self.read_offset = offset - self._moved
+        if self.read_offset == self.write_offset:
+            self._moved += self.read_offset - _HEADER.size
+            self.read_offset = self.write_offset = _HEADER.size
+        self._write_header()
+
+    @property
+    def closed(self) -> bool:
+        return self._map.closed
+
+    def close(self):
+        self._map.close()
+        self._file.close()
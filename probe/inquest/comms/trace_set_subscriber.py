@@ -1,18 +1,45 @@
+import asyncio
+import functools
 import logging
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
-from gql import gql
 from gql.transport.exceptions import TransportQueryError
 
 from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.coalescer import Coalescer
 from inquest.comms.exception_sender import ExceptionSender
-from inquest.comms.utils import log_result
+from inquest.comms.operations import (
+    DESIRED_SET_SNAPSHOT,
+    INITIAL_PROBE_INFO,
+    PROBE_DELTA_NOTIFICATION,
+    PROBE_NOTIFICATION,
+    PUBLISH_LOG,
+    supports_deltas,
+)
+from inquest.comms.utils import wrap_log
 from inquest.probe import Probe
 
 LOGGER = logging.getLogger(__name__)
 
 
 class TraceSetSubscriber(ClientConsumer):
+    """
+    applies the trace set's desired set whenever it changes.
+    a burst of notifications, like when several traces are edited in quick
+    succession, is coalesced so only the latest desired set is applied
+    @param quiet: seconds without a notification that end a burst
+    @param max_delay: the most seconds a notification waits to be applied
+    desired sets are applied on a worker thread of their own, one at a
+    time, so that the event loop keeps sending logs and heartbeats while
+    the functions' code is generated.
+    when the backend supports it the subscriber follows deltas of the
+    desired set, the ids of the traces added, changed and removed along
+    with a sequence number, rather than receiving the whole desired set on
+    every change. the whole desired set is loaded once the subscription is
+    established, and again after a gap in the sequence
+    """
 
     def __init__(
         self,
@@ -20,98 +47,225 @@ class TraceSetSubscriber(ClientConsumer):
         probe: Probe,
         package: str,
         exception_sender: ExceptionSender,
+        quiet: float = 0.1,
+        max_delay: float = 1.0,
     ):
         super().__init__()
         self.probe = probe
         self.package = package
         self.exception_sender = exception_sender
+        self.quiet = quiet
+        self.max_delay = max_delay
+        # how many desired sets were skipped for a newer one
+        self.skipped = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # the desired set by trace id and the sequence number of the last
+        # delta applied to it, only kept while following deltas
+        self.desired_set: Dict[str, Dict] = OrderedDict()
+        self.sequence: Optional[int] = None
+        # how many times the whole desired set was loaded
+        self.resyncs = 0
+
+    async def __aenter__(self):
+        await super().__aenter__()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='inquest reconciler'
+        )
+        # doesn't wait for a desired set that's being applied, which would
+        # block the event loop. the worker still finishes applying it, and
+        # the probe's lock has the probe's own exit wait for it
+        self.callback(functools.partial(self._executor.shutdown, wait=False))
+        return self
 
     async def update_state(self, desired_set):
         try:
-            self.probe.new_desired_state(desired_set)
+            # cancelling the wait leaves the worker to finish applying the
+            # desired set, so no function is left half changed
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.probe.new_desired_state, desired_set
+            )
         except Exception as exc:
             await self.exception_sender.send_exception(exc)
 
     async def _send_initial(self):
-        query = gql(
-            '''\
-query InitialProbeInfo {
-  thisProbe {
-    traceSet {
-      id
-      desiredSet {
-        id
-        function {
-          name
-          parentClass {
-            name
-          }
-          file {
-            name
-          }
-        }
-        statement
-        line
-      }
-    }
-  }
-}
-    '''
-        )
-
         try:
-            result = await self.client.execute(query)
+            result = await self.client.execute(INITIAL_PROBE_INFO)
             desired_set = result['thisProbe']['traceSet']['desiredSet']
             await self.update_state(desired_set)
-        except:
-            pass
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.debug(
+                'failed to load the desired set', extra={'error': err}
+            )
 
-    async def main(self):
-        """
-        listens for changes to the desired_set
-        """
+    async def _report_skipped(self, skipped: int):
+        self.skipped += skipped
+        LOGGER.debug('skipped desired sets', extra={'skipped': skipped})
+        await wrap_log(
+            LOGGER,
+            self.client.execute(
+                PUBLISH_LOG,
+                variable_values={
+                    'content':
+                        [
+                            f'inquest: skipped {skipped} intermediate '
+                            + 'trace set states'
+                        ]
+                },
+            ),
+            mute_error=True,
+        )
 
-        # Request subscription
-        subscription = gql(
-            '''
-subscription probeNotification($traceSetId: String!){
-  probeNotification(traceSetId: $traceSetId) {
-    message
-    traceSet {
-      id
-      desiredSet {
-        id
-        function {
-          name
-          parentClass {
-            name
-          }
-          file {
-            name
-          }
-        }
-        statement
-        line
-      }
-
-    }
-  }
-}
+    async def _apply(self, coalescer: Coalescer):
+        while True:
+            desired_set, skipped = await coalescer.get()
+            await self.update_state(desired_set)
+            if skipped:
+                await self._report_skipped(skipped)
+
+    def _apply_detached(self, desired_set):
+        '''
+        applies a desired set on the worker thread once the connection it
+        came over is gone, so its errors can only be logged
         '''
+        try:
+            self.probe.new_desired_state(desired_set)
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.warning(
+                'failed to apply the desired set', extra={'error': err}
+            )
+
+    async def _resync(self) -> Optional[List[Dict]]:
+        '''
+        replaces the desired set with a full snapshot of it
+        @returns the snapshot's desired set, or None if it couldn't be
+                 loaded
+        '''
+        self.resyncs += 1
+        try:
+            result = await self.client.execute(DESIRED_SET_SNAPSHOT)
+        except TransportQueryError as err:
+            LOGGER.warning(
+                'failed to load the desired set', extra={'error': err}
+            )
+            self.sequence = None
+            return None
+        trace_set = result['thisProbe']['traceSet']
+        self.sequence = trace_set['desiredSetSequence']
+        self.desired_set = OrderedDict(
+            (trace['id'], trace) for trace in trace_set['desiredSet']
         )
+        LOGGER.debug('resynced', extra={'sequence': self.sequence})
+        return list(self.desired_set.values())
+
+    def _apply_delta(self, delta: Dict) -> Optional[bool]:
+        '''
+        @returns whether the delta changed the desired set, or None if it
+                 doesn't follow the current desired set
+        '''
+        sequence = delta['sequence']
+        if self.sequence is not None and sequence <= self.sequence:
+            # already part of the desired set
+            return False
+        if self.sequence is None or sequence != self.sequence + 1:
+            return None
+        for trace_id in delta['removed']:
+            self.desired_set.pop(trace_id, None)
+        for trace in [*delta['added'], *delta['changed']]:
+            self.desired_set[trace['id']] = trace
+        self.sequence = sequence
+        return True
+
+    async def _receive_deltas(self, deltas: asyncio.Queue):
+        async for result in self.client.subscribe(
+                PROBE_DELTA_NOTIFICATION,
+                variable_values={'traceSetId': self.trace_set_id}):
+            deltas.put_nowait(result['probeDeltaNotification'])
+
+    @staticmethod
+    async def _next_delta(deltas: asyncio.Queue,
+                          receive: asyncio.Future) -> Optional[Dict]:
+        '''
+        @returns the next delta received, or None once the subscription
+                 ended
+        @raises the subscription's error if it failed
+        '''
+        delta = asyncio.ensure_future(deltas.get())
+        await asyncio.wait([delta, receive],
+                           return_when=asyncio.FIRST_COMPLETED)
+        if delta.done():
+            return delta.result()
+        delta.cancel()
+        receive.result()
+        return None
+
+    async def _follow_deltas(self, coalescer: Coalescer):
+        deltas = asyncio.Queue()
+        receive = asyncio.ensure_future(self._receive_deltas(deltas))
+        try:
+            # the snapshot is only taken once the backend acknowledged the
+            # subscription with its first, empty, delta. a delta published
+            # while the snapshot is taken is received rather than missed,
+            # and the ones the snapshot already holds are ignored
+            if await self._next_delta(deltas, receive) is None:
+                return
+            desired_set = await self._resync()
+            if desired_set is not None:
+                await self.update_state(desired_set)
+            LOGGER.debug('waiting for trace deltas')
+
+            while True:
+                delta = await self._next_delta(deltas, receive)
+                if delta is None:
+                    return
+                LOGGER.debug('delta', extra={'delta': delta})
+                applied = self._apply_delta(delta)
+                if applied is None:
+                    LOGGER.info(
+                        'missed a trace set delta, resyncing',
+                        extra={
+                            'sequence': self.sequence,
+                            'received': delta['sequence'],
+                        },
+                    )
+                    desired_set = await self._resync()
+                    if desired_set is not None:
+                        coalescer.put(desired_set)
+                elif applied:
+                    coalescer.put(list(self.desired_set.values()))
+        finally:
+            receive.cancel()
+            await asyncio.gather(receive, return_exceptions=True)
 
+    async def _follow_desired_sets(self, coalescer: Coalescer):
         await self._send_initial()
         LOGGER.debug('waiting for traces')
 
+        async for result in self.client.subscribe(
+                PROBE_NOTIFICATION,
+                variable_values={'traceSetId': self.trace_set_id}):
+            desired_set = result['probeNotification']['traceSet'][
+                'desiredSet']
+            LOGGER.debug('notification', extra={'desired_set': desired_set})
+            coalescer.put(desired_set)
+
+    async def main(self):
+        """
+        listens for changes to the desired_set
+        """
+        coalescer = Coalescer(quiet=self.quiet, max_delay=self.max_delay)
+        apply = asyncio.ensure_future(self._apply(coalescer))
         try:
-            async for result in self.client.subscribe(
-                    subscription,
-                    variable_values={'traceSetId': self.trace_set_id}):
-                desired_set = result['probeNotification']['traceSet'][
-                    'desiredSet']
-                LOGGER.debug(
-                    'notification', extra={'desired_set': desired_set}
-                )
-                await self.update_state(desired_set)
+            if supports_deltas(self.client.schema):
+                await self._follow_deltas(coalescer)
+            else:
+                await self._follow_desired_sets(coalescer)
         except TransportQueryError as err:
             LOGGER.error('notification returned error', extra={'error': err})
+        finally:
+            apply.cancel()
+            # a desired set still waiting for its burst to end is applied
+            # rather than dropped, the worker applies it after the one it
+            # may be applying now
+            desired_set = coalescer.take()
+            if desired_set is not None:
+                self._executor.submit(self._apply_detached, desired_set)
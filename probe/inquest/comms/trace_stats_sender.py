@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from typing import Dict, List
+
+from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.operations import PUBLISH_LOG
+from inquest.comms.scheduler import BULK
+from inquest.comms.utils import wrap_log
+from inquest.probe import Probe
+from inquest.sampling import LimiterStats
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TraceStatsSender(ClientConsumer):
+    """
+    Periodically publishes how many hits each trace's limiter dropped
+    as log lines so they show up next to the trace's output
+    """
+
+    priority = BULK
+
+    def __init__(self, *, probe: Probe, delay: int = 10):
+        super().__init__()
+        self.probe = probe
+        self.delay = delay
+        self._reported: Dict[str, LimiterStats] = {}
+        self.query = PUBLISH_LOG
+
+    def _report(self) -> List[str]:
+        '''
+        @returns a line for every trace that dropped hits since the last report
+        '''
+        lines = []
+        stats = self.probe.trace_stats()
+        for trace_id, stat in stats.items():
+            previous = self._reported.get(trace_id, LimiterStats(0, 0))
+            sampled_out = stat.sampled_out - previous.sampled_out
+            suppressed = stat.suppressed - previous.suppressed
+            if sampled_out < 0 or suppressed < 0:
+                # the trace's limits changed and its limiter started over
+                sampled_out, suppressed = stat
+            if sampled_out or suppressed:
+                lines.append(
+                    f'inquest: trace {trace_id} dropped '
+                    + f'{sampled_out + suppressed} hits ({sampled_out} '
+                    + f'sampled out, {suppressed} rate limited)'
+                )
+        self._reported = stats
+        return lines
+
+    async def main(self):
+        while True:
+            await asyncio.sleep(self.delay)
+            lines = self._report()
+            if lines:
+                LOGGER.debug('sending trace stats', extra={'lines': lines})
+                await wrap_log(
+                    LOGGER,
+                    self.client.execute(
+                        self.query, variable_values={'content': lines}
+                    ),
+                    mute_error=True,
+                )
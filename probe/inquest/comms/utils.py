@@ -1,7 +1,25 @@
+import asyncio
 import logging
 from typing import Awaitable, Optional, OrderedDict
 
-from gql.transport.exceptions import TransportQueryError
+from gql.transport.exceptions import (
+    TransportClosed,
+    TransportProtocolError,
+    TransportQueryError,
+    TransportServerError,
+)
+from websockets.exceptions import ConnectionClosed
+
+# errors that mean the connection to the backend was lost, rather than
+# that the backend rejected a request
+CONNECTION_ERRORS = (
+    TransportClosed,
+    TransportProtocolError,
+    TransportServerError,
+    ConnectionClosed,
+    OSError,
+    asyncio.TimeoutError,
+)
 
 
 def log_result(logger: logging.Logger, result: OrderedDict):
@@ -1,4 +1,5 @@
 import logging
+from typing import NamedTuple, Optional
 
 import aiohttp
 
@@ -6,14 +7,28 @@ from inquest.utils.version import VERSION
 
 LOGGER = logging.getLogger(__name__)
 
+# the header the backend sends the hash of its graphql schema in
+SCHEMA_HASH_HEADER = 'Inquest-Schema-Hash'
+
 
 class VersionCheckException(Exception):
     pass
 
 
-async def check_version(url: str):
+class BackendVersion(NamedTuple):
+    version: str
+    # None for backends that don't send it
+    schema_hash: Optional[str] = None
+
+
+async def check_version(url: str) -> BackendVersion:
+    '''
+    @returns the backend's version and schema hash if it's compatible with
+             the probe's
+    '''
     async with aiohttp.ClientSession() as session:
-        backend_version = await _get_version(session, url)
+        backend = await _get_version(session, url)
+        backend_version = backend.version
 
         backend_semver = _convert_version(backend_version)
         probe_semver = _convert_version(VERSION)
@@ -33,13 +48,16 @@ async def check_version(url: str):
                     'probe_version': VERSION
                 }
             )
+        return backend
 
 
 def _convert_version(version: str):
     return [int(ver) for ver in version.split(".")]
 
 
-async def _get_version(session: aiohttp.ClientSession, url: str) -> str:
+async def _get_version(
+    session: aiohttp.ClientSession, url: str
+) -> BackendVersion:
     async with session.get(url) as resp:
         resp: aiohttp.ClientResponse = resp
 
@@ -53,4 +71,7 @@ async def _get_version(session: aiohttp.ClientSession, url: str) -> str:
             )
             raise VersionCheckException('response failed')
 
-        return (await resp.text()).strip()
+        return BackendVersion(
+            version=(await resp.text()).strip(),
+            schema_hash=resp.headers.get(SCHEMA_HASH_HEADER),
+        )
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import ast
+import bisect
 import copy
 import dataclasses
+import itertools
 import logging
-from typing import List, Optional, Tuple
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 LOGGER = logging.getLogger(__name__)
 
@@ -15,21 +18,57 @@ class TestStatement:
     body: Optional[List[List[TestStatement]]] = None
 
 
+class InjectionError(ValueError):
+
+    def __init__(self, index: int, line: int):
+        super().__init__(f'failed to inject statement at line {line}')
+        self.index = index
+        self.line = line
+
+
 class ASTInjector:
 
     def __init__(self, base_ast: ast.AST):
         """
         injector builder class
-        WARNING: this will mutate the input ast
+        the input ast is never mutated, it's only copied where statements
+        are inserted
         """
-        self._ast = copy.deepcopy(base_ast)
+        self._ast = base_ast
+        self._owned = False
 
     def insert(self, line: int, statement: ast.AST):
+        if not self._owned:
+            self._ast = copy.deepcopy(self._ast)
+            self._owned = True
         res, nodes = insert(self._ast, line, statement)
         if not res:
             raise ValueError('failed to inject statement')
         return nodes
 
+    def insert_all(self, statements: Sequence[Tuple[int, ast.AST]]):
+        """
+        inserts every (line, statement) pair in a single traversal
+        @raises InjectionError naming the first statement that couldn't
+                be placed, in which case nothing is inserted
+        """
+        self._ast = insert_all(self._ast, statements)
+        # insert_all shares the untouched subtrees with the previous ast
+        self._owned = False
+
+    def wrap(
+        self,
+        start: int,
+        end: int,
+        wrapper: Callable[[List[ast.AST]], List[ast.AST]],
+    ):
+        """
+        replaces the statements covering lines start through end with
+        wrapper(statements)
+        """
+        self._ast = wrap(self._ast, start, end, wrapper)
+        self._owned = False
+
     def result(self):
         return self._ast
 
@@ -118,6 +157,247 @@ def _modify(
     raise ValueError('unexpected injection failure')
 
 
+# (line, index in the input, statement)
+_Item = Tuple[int, int, ast.AST]
+
+
+def insert_all(
+    node: ast.AST,
+    statements: Sequence[Tuple[int, ast.AST]],
+) -> ast.AST:
+    """
+    batched version of insert: places every (line, statement) pair exactly
+    where calling insert for each pair in order of line would, but in one
+    traversal that locates lines by bisecting each block's line numbers.
+    only the nodes and blocks along the paths to the insertion points are
+    copied, the input node is left untouched.
+    @returns the new node
+    @raises InjectionError naming the first statement that couldn't be placed
+    """
+    items = sorted(
+        ((line, idx, statement)
+         for idx, (line, statement) in enumerate(statements)),
+        key=lambda item: (item[0], item[1]),
+    )
+    if not items:
+        return node
+    new_node, failed = _insert_all(node, items, [])
+    if failed:
+        first = min(failed, key=lambda item: item[1])
+        raise InjectionError(first[1], first[0])
+    return new_node
+
+
+def _insert_all(
+    node: ast.AST,
+    items: List[_Item],
+    heads: List[_Item],
+) -> Tuple[ast.AST, List[_Item]]:
+    """
+    inserts the items below node, and the heads (which are on node's line)
+    at the start of node's first block
+    @returns the copied node and the items that couldn't be placed
+    """
+    blocks = get_blocks(node)
+    if blocks is None:
+        return node, items + heads
+    failed = [item for item in items if node.lineno > item[0]]
+    items = [item for item in items if node.lineno <= item[0]]
+
+    new_blocks, block_failed = _modify_all(blocks, items)
+    if heads:
+        # each head is inserted before the heads that came before it
+        new_blocks[0][0:0] = [item[2] for item in reversed(heads)]
+    return _replace_blocks(node, new_blocks), failed + block_failed
+
+
+def _modify_all(
+    stmts: List[List[ast.AST]],
+    items: List[_Item],
+) -> Tuple[List[List[ast.AST]], List[_Item]]:
+    """
+    batched version of _modify
+    """
+    flat = [
+        (block_idx, statement_idx, statement)
+        for block_idx, statements in enumerate(stmts)
+        for statement_idx, statement in enumerate(statements)
+    ]
+    linenos = [statement.lineno for _, _, statement in flat]
+
+    # (block_idx, statement_idx) -> items inserted before that statement
+    slots: Dict[Tuple[int, int], List[_Item]] = defaultdict(list)
+    # index into flat -> items recursed into / put at the head of the node
+    recursions: Dict[int, List[_Item]] = defaultdict(list)
+    heads: Dict[int, List[_Item]] = defaultdict(list)
+    failed = []
+
+    for item in items:
+        line = item[0]
+        idx = bisect.bisect_right(linenos, line)
+        if idx == len(flat) and (idx == 0 or linenos[-1] != line):
+            # last line occurs before the insertion point
+            failed.append(item)
+            continue
+        if idx == 0:
+            slots[(0, 0)].append(item)
+            continue
+
+        block_idx, statement_idx, cur_statement = flat[idx - 1]
+        if not has_blocks(cur_statement):
+            slots[(block_idx, statement_idx + 1)].append(item)
+        elif cur_statement.lineno == line:
+            heads[idx - 1].append(item)
+        else:
+            recursions[idx - 1].append(item)
+
+    replaced = {}
+    for idx in set(recursions).union(heads):
+        block_idx, statement_idx, cur_statement = flat[idx]
+        replaced[idx], insert_failed = _insert_all(
+            cur_statement, recursions[idx], heads[idx]
+        )
+        if insert_failed:
+            # insert the statements that didn't fit into the proceeding line
+            slots[(block_idx, statement_idx + 1)].extend(insert_failed)
+
+    new_stmts = []
+    flat_idx = 0
+    for block_idx, statements in enumerate(stmts):
+        new_statements = []
+        for statement_idx in range(len(statements) + 1):
+            new_statements.extend(
+                _order_slot(slots.get((block_idx, statement_idx), []))
+            )
+            if statement_idx < len(statements):
+                new_statements.append(
+                    replaced.get(flat_idx, statements[statement_idx])
+                )
+                flat_idx += 1
+        new_stmts.append(new_statements)
+    return new_stmts, failed
+
+
+def _order_slot(items: List[_Item]) -> List[ast.AST]:
+    """
+    orders the statements inserted between two existing statements the way
+    repeated calls to insert would.
+    statements on different lines go in order of line. a statement on the
+    same line as the previously inserted one goes after it, unless the
+    previous one has blocks, in which case it goes at the start of its first
+    block (before anything else that was put there)
+    """
+    result: List[ast.AST] = []
+    for _, group in itertools.groupby(
+            sorted(items, key=lambda item: (item[0], item[1])),
+            key=lambda item: item[0],
+    ):
+        run: List[ast.AST] = []
+        # the last statement inserted at this level, statements nested into
+        # it go before everything already nested into it at group_start
+        outer = None
+        group_start = 0
+        for _, _, statement in group:
+            if outer is not None and has_blocks(outer):
+                run.insert(group_start, statement)
+            else:
+                group_start = len(run)
+                run.append(statement)
+                outer = statement
+        result.extend(run)
+    return result
+
+
+def wrap(
+    node: ast.AST,
+    start: int,
+    end: int,
+    wrapper: Callable[[List[ast.AST]], List[ast.AST]],
+) -> ast.AST:
+    """
+    replaces the innermost run of statements covering lines start through
+    end with wrapper(statements). the run begins at the first statement
+    ending on or after start and ends at the last statement beginning on or
+    before end, both in the same block.
+    only the nodes and blocks along the path to the run are copied
+    @returns the new node
+    @raises ValueError if no block holds such a run
+    """
+    new_node = _wrap(node, start, end, wrapper)
+    if new_node is None:
+        raise ValueError(f'failed to wrap lines {start} through {end}')
+    return new_node
+
+
+def _wrap(
+    node: ast.AST,
+    start: int,
+    end: int,
+    wrapper: Callable[[List[ast.AST]], List[ast.AST]],
+) -> Optional[ast.AST]:
+    blocks = get_blocks(node)
+    if blocks is None:
+        return None
+    for block_idx, block in enumerate(blocks):
+        first = next(
+            (
+                idx for idx, statement in enumerate(block)
+                if _end_lineno(statement) >= start
+            ),
+            None,
+        )
+        last = next(
+            (
+                idx for idx in reversed(range(len(block)))
+                if block[idx].lineno <= end
+            ),
+            None,
+        )
+        if first is None or last is None or first > last:
+            continue
+
+        statement = block[first]
+        if first == last and statement.lineno < start:
+            # the lines are inside of a single statement's blocks
+            new_statement = _wrap(statement, start, end, wrapper)
+            if new_statement is not None:
+                new_block = list(block)
+                new_block[first] = new_statement
+                return _replace_blocks(
+                    node,
+                    [*blocks[:block_idx], new_block, *blocks[block_idx + 1:]],
+                )
+
+        new_block = [
+            *block[:first],
+            *wrapper(block[first:last + 1]),
+            *block[last + 1:],
+        ]
+        return _replace_blocks(
+            node,
+            [*blocks[:block_idx], new_block, *blocks[block_idx + 1:]],
+        )
+    return None
+
+
+def _end_lineno(node: ast.AST) -> int:
+    end_lineno = getattr(node, 'end_lineno', None)
+    if end_lineno is not None:
+        return end_lineno
+    return max(
+        child.lineno for child in ast.walk(node) if hasattr(child, 'lineno')
+    )
+
+
+def _replace_blocks(node: ast.AST, blocks: List[List[ast.AST]]) -> ast.AST:
+    if isinstance(node, TestStatement):
+        return dataclasses.replace(node, body=blocks)
+    new_node = copy.copy(node)
+    for field, block in zip(_BLOCK_FIELDS[type(node)], blocks):
+        setattr(new_node, field, block)
+    return new_node
+
+
 def has_blocks(node: ast.AST):
     return get_blocks(node) is not None
 
@@ -164,3 +444,18 @@ def get_blocks(node: ast.AST) -> Optional[List[List[ast.AST]]]:
     else:
         res = None
     return res
+
+
+# the fields get_blocks reads its blocks from, in the same order
+_BLOCK_FIELDS = {
+    ast.FunctionDef: ('body',),
+    ast.AsyncFunctionDef: ('body',),
+    ast.ClassDef: ('body',),
+    ast.For: ('body', 'orelse'),
+    ast.AsyncFor: ('body', 'orelse'),
+    ast.While: ('body', 'orelse'),
+    ast.If: ('body', 'orelse'),
+    ast.With: ('body',),
+    ast.AsyncWith: ('body',),
+    ast.Try: ('body', 'orelse', 'finalbody'),
+}
@@ -0,0 +1,70 @@
+import collections
+import logging
+import types
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from inquest.trace_store import Fingerprint
+
+LOGGER = logging.getLogger(__name__)
+
+CodeKey = Tuple[types.CodeType, Fingerprint]
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class CodeCache:
+    """
+    bounded lru cache of generated code objects
+    keyed by the function's original code object and the fingerprint
+    of the traces that were injected into it
+    """
+
+    def __init__(self, maxsize: int = 256):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self._cache: Dict[CodeKey, types.CodeType] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: CodeKey) -> Optional[types.CodeType]:
+        code = self._cache.get(key)
+        if code is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._cache.move_to_end(key)
+        return code
+
+    def put(self, key: CodeKey, code: types.CodeType):
+        self._cache[key] = code
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            evicted, _ = self._cache.popitem(last=False)
+            self.evictions += 1
+            LOGGER.debug(
+                'evicting generated code',
+                extra={'function': evicted[0].co_name},
+            )
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            maxsize=self.maxsize,
+            currsize=len(self._cache),
+        )
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
@@ -22,6 +22,12 @@ class CodeReassigner(HasStack):
             raise ValueError('function was not assigned')
         return self._functions[func]
 
+    def base_code(self, func: FunctionOrMethod) -> types.CodeType:
+        '''
+        @returns the code the function had before any assignment
+        '''
+        return self._functions.get(func, func.__code__)
+
     def assign_function(self, func: FunctionOrMethod, code: types.CodeType):
         LOGGER.debug(
             'assigning to function', extra={'function': func.__name__}
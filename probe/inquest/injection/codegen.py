@@ -4,19 +4,88 @@ import logging
 import re
 import sys
 import types
-from typing import List, NamedTuple
+from typing import List, NamedTuple, Optional
 
-from inquest.injection.ast_injector import ASTInjector
+import inquest.logging
+from inquest.injection.ast_injector import ASTInjector, InjectionError
+from inquest.injection.source_index import SourceIndex
 from inquest.module_tree import FunctionOrMethod
 from inquest.utils.exceptions import ProbeException
 
 LOGGER = logging.getLogger(__name__)
 
+SOURCE_INDEX = SourceIndex()
+
+# the global the generated code reaches inquest.logging through. it's bound
+# once in the function's module instead of imported on every call, and
+# removed again once none of the module's functions has generated code
+LOGGING_NAME = '___inquest_logging'
+
+_TEMPLATE = '''\
+try:
+    {action}
+except Exception as exc:
+    {logging}.error("{id}", exc)
+'''
+
+# the limiter is checked before the f-string is evaluated
+_LIMITED_TEMPLATE = '''\
+if {logging}.allow("{id}"):
+    try:
+        {action}
+    except Exception as exc:
+        {logging}.error("{id}", exc)
+'''
+
+# the condition is checked first so a hit that doesn't match costs one check
+# and isn't counted by the limiter, errors in it are reported like any other
+_CONDITIONAL_TEMPLATE = '''\
+try:
+    if ({condition}){limit}:
+        {action}
+except Exception as exc:
+    {logging}.error("{id}", exc)
+'''
+
+# latency traces time the statements they wrap. the statements replace the
+# pass and the time is recorded even if they raise or return
+_LATENCY_TEMPLATE = '''\
+{start} = {logging}.perf_counter_ns()
+try:
+    pass
+finally:
+    {record}
+'''
+
+_LATENCY_RECORD = (
+    '{logging}.observe("{id}", {logging}.perf_counter_ns() - {start})'
+)
+
+# the limiter decides whether the time is recorded, not whether it's taken
+_LIMITED_LATENCY_RECORD = '''\
+if {logging}.allow("{id}"):
+        ''' + _LATENCY_RECORD
+
+# what a hit of each kind of trace does, a log trace's statement is an
+# f-string and a metric trace's statement a numeric expression
+_ACTIONS = {
+    'log': '{logging}.log(f"{statement}")',
+    'metric': '{logging}.observe("{id}", ({statement}))',
+}
+
 
 class Trace(NamedTuple):
     lineno: int
     statement: str
     id: str
+    # whether the hits are checked against the trace's limiter
+    limited: bool = False
+    # an expression that has to be true for a hit to be logged
+    condition: Optional[str] = None
+    # log, metric or latency
+    kind: str = 'log'
+    # the last line a latency trace times, it times the whole call if None
+    end_lineno: Optional[int] = None
 
 
 def _unwrap(func: FunctionOrMethod):
@@ -38,6 +107,11 @@ def _dedent_if_necessary(lines):
 
 def _get_ast(func1: FunctionOrMethod):
     func1 = _unwrap(func1)
+    func1_ast = SOURCE_INDEX.get_function_ast(func1)
+    if func1_ast is not None:
+        return func1_ast
+
+    # source isn't a readable file (e.g. defined in an interactive session)
     source_lines, func_lineno = inspect.getsourcelines(func1)
     source = "".join(_dedent_if_necessary(source_lines))
 
@@ -47,25 +121,23 @@ def _get_ast(func1: FunctionOrMethod):
     return func1_ast
 
 
-def _inject_and_codegen(func1_ast: ast.AST, filename):
-    func1_ast.body.insert(
-        0,
-        ast.Import(
-            lineno=func1_ast.body[0].lineno,
-            col_offset=func1_ast.body[0].col_offset,
-            names=[
-                ast.alias(name='inquest.logging', asname='___inquest_logging')
-            ],
-        ),
-    )
+def bind_logging(func1: FunctionOrMethod):
+    _unwrap(func1).__globals__[LOGGING_NAME] = inquest.logging
 
+
+def unbind_logging(func1: FunctionOrMethod):
+    _unwrap(func1).__globals__.pop(LOGGING_NAME, None)
+
+
+def _inject_and_codegen(func1_ast: ast.AST, filename):
     # python 3.8 introduced type_ignores into ast.Module
     if sys.version_info[0:2] >= (3, 8):
-        mod = compile(
-            ast.Module(body=[func1_ast], type_ignores=[]), filename, 'exec'
-        )
+        module = ast.Module(body=[func1_ast], type_ignores=[])
     else:
-        mod = compile(ast.Module(body=[func1_ast]), filename, 'exec')
+        module = ast.Module(body=[func1_ast])
+
+    # python 3.10 requires locations on every node
+    mod = compile(ast.fix_missing_locations(module), filename, 'exec')
 
     for obj in mod.co_consts:
         if isinstance(obj, types.CodeType):
@@ -73,6 +145,69 @@ def _inject_and_codegen(func1_ast: ast.AST, filename):
     raise Exception('failed to generate the new bytecode')
 
 
+def _latency_wrapper(trace: Trace, index: int):
+    if trace.condition is not None:
+        raise ValueError('latency traces can not have a condition')
+    start = f'___inquest_start_{index}'
+    record = _LIMITED_LATENCY_RECORD if trace.limited else _LATENCY_RECORD
+    source = _LATENCY_TEMPLATE.format(
+        logging=LOGGING_NAME,
+        start=start,
+        record=record.format(logging=LOGGING_NAME, id=trace.id, start=start),
+    )
+
+    def wrapper(statements: List[ast.AST]) -> List[ast.AST]:
+        prologue, try_node = ast.parse(source).body
+        lineno = statements[0].lineno
+        for node in [*ast.walk(prologue), *ast.walk(try_node)]:
+            if hasattr(node, 'lineno'):
+                node.lineno = lineno
+            if getattr(node, 'end_lineno', None) is not None:
+                node.end_lineno = lineno
+        try_node.body = statements
+        try_node.end_lineno = max(
+            getattr(statement, 'end_lineno', None) or statement.lineno
+            for statement in statements
+        )
+        return [prologue, try_node]
+
+    return wrapper
+
+
+def _trace_source(trace: Trace) -> str:
+    if trace.kind not in _ACTIONS:
+        raise ValueError(f'unknown trace kind {trace.kind}')
+    if trace.kind == 'metric':
+        # the value has to be a single expression on its own
+        ast.parse(trace.statement, mode='eval')
+    action = _ACTIONS[trace.kind].format(
+        logging=LOGGING_NAME,
+        statement=trace.statement,
+        id=trace.id,
+    )
+
+    if trace.condition is None:
+        template = _LIMITED_TEMPLATE if trace.limited else _TEMPLATE
+        return template.format(
+            logging=LOGGING_NAME,
+            action=action,
+            id=trace.id,
+        )
+
+    # the condition has to be a single expression on its own
+    ast.parse(trace.condition, mode='eval')
+    limit = ''
+    if trace.limited:
+        limit = f' and {LOGGING_NAME}.allow("{trace.id}")'
+    return _CONDITIONAL_TEMPLATE.format(
+        logging=LOGGING_NAME,
+        action=action,
+        id=trace.id,
+        condition=trace.condition,
+        limit=limit,
+    )
+
+
 def add_log_statements(
     func1: FunctionOrMethod, traces: List[Trace]
 ) -> types.CodeType:
@@ -83,23 +218,48 @@ def add_log_statements(
     filename = inspect.getfile(func1)
     injector = ASTInjector(func1_ast)
 
+    statements = []
+    # the traces the statements belong to, in the same order
+    statement_traces = []
+    latency_traces = []
     for trace in traces:
+        if trace.kind == 'latency':
+            latency_traces.append(trace)
+            continue
         try:
-            expr = ast.parse(
-                '''\
-try:
-    ___inquest_logging.log(f"{statement}")
-except Exception as exc:
-    ___inquest_logging.error("{id}", exc)
-'''.format(statement=trace.statement, id=trace.id)
-            )
+            expr = ast.parse(_trace_source(trace))
 
             for node in ast.walk(expr):
                 if hasattr(node, 'lineno'):
                     node.lineno = int(trace.lineno)
+                if getattr(node, 'end_lineno', None) is not None:
+                    node.end_lineno = int(trace.lineno)
 
-            injector.insert(trace.lineno, expr.body[0])
+            statements.append((int(trace.lineno), expr.body[0]))
+            statement_traces.append(trace)
+        except Exception as exc:
+            raise ProbeException(message=str(exc), trace_id=trace.id) from exc
+
+    try:
+        injector.insert_all(statements)
+    except InjectionError as exc:
+        raise ProbeException(
+            message=str(exc), trace_id=statement_traces[exc.index].id
+        ) from exc
+
+    # the timers are wrapped around the log statements so that the time
+    # spent on those shows up in the latencies
+    for index, trace in enumerate(latency_traces):
+        try:
+            if trace.end_lineno is None:
+                # from the first statement through the last
+                start, end = injector.result().body[0].lineno, sys.maxsize
+            else:
+                start, end = int(trace.lineno), int(trace.end_lineno)
+            injector.wrap(start, end, _latency_wrapper(trace, index))
         except Exception as exc:
             raise ProbeException(message=str(exc), trace_id=trace.id) from exc
 
-    return _inject_and_codegen(injector.result(), filename)
+    code = _inject_and_codegen(injector.result(), filename)
+    bind_logging(func1)
+    return code
@@ -0,0 +1,146 @@
+import ast
+import inspect
+import logging
+import os
+import threading
+import tokenize
+import types
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from inquest.module_tree import FunctionOrMethod
+
+LOGGER = logging.getLogger(__name__)
+
+FunctionNode = Union[ast.FunctionDef, ast.AsyncFunctionDef]
+
+
+class FunctionDefinition(NamedTuple):
+    name: str
+    # first line of the definition (including decorators) and last line
+    start: int
+    end: int
+    node: FunctionNode
+
+
+class _FileIndex(NamedTuple):
+    mtime: int
+    size: int
+    definitions: Dict[int, FunctionDefinition]
+
+
+def _end_line(node: ast.AST) -> int:
+    end_line = getattr(node, 'end_lineno', None)
+    if end_line is not None:
+        return end_line
+    return max(
+        child.lineno for child in ast.walk(node) if hasattr(child, 'lineno')
+    )
+
+
+def _index_definitions(tree: ast.Module) -> Dict[int, FunctionDefinition]:
+    definitions = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        # a code object's co_firstlineno points at its first decorator
+        start = min(
+            [
+                node.lineno,
+                *(decorator.lineno for decorator in node.decorator_list),
+            ]
+        )
+        definitions[start] = FunctionDefinition(
+            name=node.name,
+            start=start,
+            end=_end_line(node),
+            node=node,
+        )
+    return definitions
+
+
+class SourceIndex:
+    """
+    parses each source file once and indexes its function and method
+    definitions by the line they start on.
+    a file's index is rebuilt when the file's mtime or size changes or when
+    a code object no longer matches the definition at its line (as happens
+    after a module reload)
+    """
+
+    def __init__(self):
+        self._files: Dict[str, _FileIndex] = {}
+        self._lock = threading.Lock()
+        self.parses = 0
+
+    def invalidate(self, filename: Optional[str] = None):
+        with self._lock:
+            if filename is None:
+                self._files.clear()
+            else:
+                self._files.pop(filename, None)
+
+    def definitions(self, filename: str) -> List[FunctionDefinition]:
+        with self._lock:
+            return list(self._get_file(filename).definitions.values())
+
+    def get_function_ast(
+        self,
+        func: FunctionOrMethod,
+    ) -> Optional[FunctionNode]:
+        '''
+        @returns the ast of the function with line numbers matching the
+                 function's file, or None if the function's source file
+                 can't be read
+        the returned node is shared, callers must copy it before mutating it
+        '''
+        filename = inspect.getsourcefile(func)
+        if filename is None or not os.path.isfile(filename):
+            return None
+        code: types.CodeType = func.__code__
+        with self._lock:
+            definition = self._lookup(filename, code, force=False)
+            if definition is None:
+                definition = self._lookup(filename, code, force=True)
+        if definition is None:
+            raise OSError(
+                f'could not find the definition of {code.co_name} '
+                + f'at {filename}:{code.co_firstlineno}'
+            )
+        return definition.node
+
+    def _lookup(
+        self,
+        filename: str,
+        code: types.CodeType,
+        *,
+        force: bool,
+    ) -> Optional[FunctionDefinition]:
+        file_index = self._get_file(filename, force=force)
+        definition = file_index.definitions.get(code.co_firstlineno)
+        if definition is None or definition.name != code.co_name:
+            return None
+        return definition
+
+    def _get_file(self, filename: str, force: bool = False) -> _FileIndex:
+        mtime, size = self._stat(filename)
+        file_index = self._files.get(filename)
+        if (
+            force or file_index is None or file_index.mtime != mtime
+            or file_index.size != size
+        ):
+            LOGGER.debug('indexing source', extra={'filename': filename})
+            with tokenize.open(filename) as source_file:
+                tree = ast.parse(source_file.read(), filename)
+            self.parses += 1
+            file_index = _FileIndex(
+                mtime=mtime,
+                size=size,
+                definitions=_index_definitions(tree),
+            )
+            self._files[filename] = file_index
+        return file_index
+
+    @staticmethod
+    def _stat(filename: str) -> Tuple[int, int]:
+        stat = os.stat(filename)
+        return stat.st_mtime_ns, stat.st_size
@@ -1,11 +1,26 @@
 from __future__ import annotations
 
 import contextlib
-from typing import Set
+import threading
+# perf_counter_ns is reached through this module by latency traces
+from time import perf_counter_ns
+from typing import Callable, Dict, Tuple
+
+from inquest.metrics import AGGREGATORS, MetricAggregator
+from inquest.sampling import LimiterStats, TraceLimiter
 
 # flake8: noqa
 
-_CALL_BACKS: Set[Callback] = set()
+# replaced as a whole when a callback is added or removed, never mutated
+_CALL_BACKS: Tuple[Callback, ...] = ()
+_CALL_BACKS_LOCK = threading.Lock()
+
+# trace id -> the limiter deciding which of the trace's hits get logged
+_LIMITERS: Dict[str, TraceLimiter] = {}
+
+# trace id -> the values a metric or latency trace observed since the
+# last flush
+_METRICS: Dict[str, MetricAggregator] = {}
 
 
 class Callback:
@@ -26,30 +41,144 @@ class PrintCallback(Callback):
         pass
 
 
-def log(value):
+def _dispatchers(
+    callbacks: Tuple[Callback, ...],
+) -> Tuple[Callable[[str], None], Callable[[str, Exception], None]]:
+    '''
+    @returns log and error functions that call every callback in callbacks
+    '''
     # pylint: disable=all
-    for callback in _CALL_BACKS:
-        try:
-            callback.log(value)
-        except:
-            pass
+    if not callbacks:
 
+        def log_to_none(value):
+            pass
 
-def error(id: str, value):
-    # pylint: disable=all
-    for callback in _CALL_BACKS:
-        try:
-            callback.error(id, value)
-        except:
+        def error_to_none(id, value):
             pass
 
+        return log_to_none, error_to_none
+
+    if len(callbacks) == 1:
+        callback_log = callbacks[0].log
+        callback_error = callbacks[0].error
+
+        def log_to_one(value):
+            try:
+                callback_log(value)
+            except:
+                pass
+
+        def error_to_one(id, value):
+            try:
+                callback_error(id, value)
+            except:
+                pass
+
+        return log_to_one, error_to_one
+
+    def log_to_all(value):
+        for callback in callbacks:
+            try:
+                callback.log(value)
+            except:
+                pass
+
+    def error_to_all(id, value):
+        for callback in callbacks:
+            try:
+                callback.error(id, value)
+            except:
+                pass
+
+    return log_to_all, error_to_all
+
+
+# log and error are called by the generated code on every trace hit. they're
+# rebound to functions specialized to the current callbacks whenever those
+# change, so a hit never iterates over a collection that's being modified
+log, error = _dispatchers(_CALL_BACKS)
+
+
+def allow(id: str) -> bool:
+    limiter = _LIMITERS.get(id)
+    return limiter is None or limiter.allow()
+
+
+def get_limiter(id: str):
+    return _LIMITERS.get(id)
+
+
+def set_limiter(id: str, limiter: TraceLimiter):
+    _LIMITERS[id] = limiter
+
+
+def remove_limiter(id: str):
+    _LIMITERS.pop(id, None)
+
+
+def limiter_stats() -> Dict[str, LimiterStats]:
+    return {id: limiter.stats() for id, limiter in list(_LIMITERS.items())}
+
+
+def observe(id: str, value):
+    aggregator = _METRICS.get(id)
+    if aggregator is not None:
+        aggregator.observe(value)
+
+
+def add_metric(id: str, kind: str = 'metric', reset: bool = False):
+    '''
+    @param reset: whether to drop the values observed so far even if the
+                  trace already aggregates values of the kind
+    '''
+    aggregator = _METRICS.get(id)
+    if reset or aggregator is None or aggregator.kind != kind:
+        _METRICS[id] = AGGREGATORS[kind]()
+
+
+def remove_metric(id: str):
+    _METRICS.pop(id, None)
+
+
+def flush_metrics() -> Dict[str, MetricAggregator]:
+    '''
+    @returns the aggregates of every metric that observed values since
+             the last flush, and starts new ones in their place
+    '''
+    flushed = {}
+    for id, aggregator in list(_METRICS.items()):
+        if aggregator.count == 0 and aggregator.non_finite == 0:
+            continue
+        if _METRICS.get(id) is not aggregator:
+            continue
+        _METRICS[id] = type(aggregator)()
+        flushed[id] = aggregator
+    return flushed
+
+
+def _set_callbacks(callbacks: Tuple[Callback, ...]):
+    # pylint: disable=global-statement
+    global _CALL_BACKS, log, error
+    _CALL_BACKS = callbacks
+    log, error = _dispatchers(callbacks)
+
 
 def add_callback(value):
-    _CALL_BACKS.add(value)
+    with _CALL_BACKS_LOCK:
+        if value not in _CALL_BACKS:
+            _set_callbacks((*_CALL_BACKS, value))
 
 
 def remove_callback(value):
-    _CALL_BACKS.remove(value)
+    '''
+    @raises KeyError if the callback was never added
+    '''
+    with _CALL_BACKS_LOCK:
+        if value not in _CALL_BACKS:
+            raise KeyError(value)
+        _set_callbacks(
+            tuple(callback for callback in _CALL_BACKS if callback != value)
+        )
 
 
 @contextlib.contextmanager
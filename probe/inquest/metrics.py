@@ -0,0 +1,170 @@
+import math
+from typing import Dict, Iterable, Optional, Tuple
+
+# buckets per power of two, the bucket a value lands in is at most
+# 1 / (2 * SUB_BUCKETS) of the value wide
+SUB_BUCKETS = 8
+
+# shifts frexp's exponent (which is at least -1074) above zero
+_EXPONENT_OFFSET = 1100
+
+# the summary fields that count values rather than measure them
+_COUNTS = ('count', 'non_finite')
+
+
+def _bucket(value: float) -> int:
+    if value == 0:
+        return 0
+    mantissa, exponent = math.frexp(abs(value))
+    sub_bucket = int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+    key = 1 + (exponent + _EXPONENT_OFFSET) * SUB_BUCKETS + sub_bucket
+    return key if value > 0 else -key
+
+
+def _bucket_value(key: int) -> float:
+    '''
+    @returns the midpoint of the bucket
+    '''
+    if key == 0:
+        return 0.0
+    exponent, sub_bucket = divmod(abs(key) - 1, SUB_BUCKETS)
+    mantissa = 0.5 + (sub_bucket + 0.5) / (2 * SUB_BUCKETS)
+    value = math.ldexp(mantissa, exponent - _EXPONENT_OFFSET)
+    return value if key > 0 else -value
+
+
+class LogHistogram:
+    """
+    histogram with logarithmically spaced buckets.
+    two histograms merge by adding up their bucket counts
+    """
+
+    __slots__ = ('buckets',)
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+
+    def observe(self, value: float):
+        key = _bucket(value)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other: 'LogHistogram'):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def sorted_buckets(self) -> Iterable[Tuple[float, int]]:
+        '''
+        @returns (bucket midpoint, count) pairs in increasing order
+        '''
+        return sorted(
+            (_bucket_value(key), count) for key, count in self.buckets.items()
+        )
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        '''
+        @returns the midpoint of the bucket holding the given quantile or
+                 None if the histogram is empty
+        '''
+        total = sum(self.buckets.values())
+        if total == 0:
+            return None
+        rank = quantile * total
+        seen = 0
+        value = None
+        for value, count in self.sorted_buckets():
+            seen += count
+            if seen >= rank:
+                break
+        return value
+
+
+class MetricAggregator:
+    """
+    count, sum, min, max and histogram of a metric trace's values.
+    observe isn't locked, concurrent hits can be lost but never corrupt
+    the aggregate. nan and infinite values are only counted, they would
+    leave the sum and mean nan for good
+    """
+
+    __slots__ = ('count', 'non_finite', 'total', 'min', 'max', 'histogram')
+
+    kind = 'metric'
+
+    def __init__(self):
+        self.count = 0
+        self.non_finite = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.histogram = LogHistogram()
+
+    def observe(self, value):
+        value = float(value)
+        if not math.isfinite(value):
+            self.non_finite += 1
+            return
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.histogram.observe(value)
+
+    def merge(self, other: 'MetricAggregator'):
+        self.count += other.count
+        self.non_finite += other.non_finite
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram.merge(other.histogram)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        value = self.histogram.percentile(quantile)
+        if value is None:
+            return None
+        # the bucket midpoint can lie outside of the observed values
+        return min(max(value, self.min), self.max)
+
+    def summary(self) -> Dict[str, float]:
+        summary = {'count': self.count}
+        if self.non_finite:
+            summary['non_finite'] = self.non_finite
+        if self.count == 0:
+            return summary
+        return {
+            **summary,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+class LatencyAggregator(MetricAggregator):
+    """
+    aggregates a latency trace's timings, observed in nanoseconds and
+    summarized in milliseconds
+    """
+
+    __slots__ = ()
+
+    kind = 'latency'
+
+    def summary(self) -> Dict[str, float]:
+        summary = super().summary()
+        return {
+            key if key in _COUNTS else f'{key}_ms':
+            value if key in _COUNTS else value / 1e6
+            for key, value in summary.items()
+        }
+
+
+# the aggregator of each kind of trace that aggregates its hits
+AGGREGATORS = {
+    aggregator.kind: aggregator
+    for aggregator in (MetricAggregator, LatencyAggregator)
+}
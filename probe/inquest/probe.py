@@ -1,102 +1,64 @@
 import logging
 import sys
+import threading
 import types
-from typing import Dict, List, NamedTuple, Optional, Tuple
-
-import pandas as pd
+from typing import Dict, List, Optional, Set, Tuple
 
 import inquest.injection.codegen as codegen
+import inquest.logging
 from inquest.file_module_resolver import FileModuleResolver
 from inquest.hotpatch import get_function_in_module
+from inquest.injection.code_cache import CodeCache
 from inquest.injection.code_reassigner import CodeReassigner
+from inquest.sampling import LimiterStats, TraceLimiter, validate_limits
+from inquest.trace_store import (
+    DiffResult, Fingerprint, FunctionPath, TraceRecord, TraceStore,
+    diff_desired_set
+)
 from inquest.utils.exceptions import MultiTraceException, ProbeException
 from inquest.utils.has_stack import HasStack
 
 LOGGER = logging.getLogger(__name__)
 
-FunctionPath = Tuple[str, str]
-
-TRACE_COLUMNS = ['id', 'module', 'function', 'statement', 'lineno']
-
-CODE_COLUMNS = [
-    'module',
-    'function',
-    'code',
-]
-
-TRACE_WITH_ERROR_COLUMNS = [
-    *TRACE_COLUMNS,
-    'error',
-]
-
-
-class DiffResult(NamedTuple):
-    to_be_removed: pd.DataFrame
-    to_be_added: pd.DataFrame
-    to_be_updated: pd.DataFrame
-    new_traces: pd.DataFrame
-
-
-def group_by_location(trace_df: pd.DataFrame):
-    return trace_df.groupby(['module', 'function'])
-
-
-def diff_desired_set(
-    trace_df: pd.DataFrame,
-    desired_set_df: pd.DataFrame,
-) -> DiffResult:
-    merged = pd.merge(
-        trace_df,
-        desired_set_df,
-        how="outer",
-        on=['id'],
-        indicator=True,
-    )
-    """
-    creates trace dataframes of the new and old traces
-    """
-
-    # recreate module, function, and statement
-    merged['module'] = merged['module_y'].fillna(merged['module_x'])
-    merged['function'] = merged['function_y'].fillna(merged['function_x'])
-    merged['statement'] = merged['statement_y'].fillna(merged['statement_x'])
-    merged['lineno'] = merged['lineno_y'].fillna(merged['lineno_x'])
-
-    # to_be_removed is all ids that are removed
-    to_be_removed = merged[merged['_merge'] == 'left_only'][trace_df.columns]
-    to_be_added = merged[merged['_merge'] == 'right_only'][trace_df.columns]
-
-    # changed traces
-    to_be_updated = merged.query(
-        '_merge == "both" & '
-        + '( module_x != module_y | function_x != function_y '
-        + '| statement_x != statement_y | lineno_x != lineno_y )'
-    )[trace_df.columns]
-
-    new_traces = merged[merged['_merge'] != 'left_only'][trace_df.columns]
-    return DiffResult(
-        to_be_removed=to_be_removed,
-        to_be_added=to_be_added,
-        to_be_updated=to_be_updated,
-        new_traces=new_traces,
+# log traces emit a log line per hit, metric traces aggregate a numeric
+# value and latency traces the time spent in the function (or between two
+# of its lines) in process, which is reported periodically
+TRACE_KINDS = ('log', 'metric', 'latency')
+
+
+def _measured(trace: TraceRecord) -> Tuple:
+    '''
+    @returns what a metric or latency trace's values depend on, its limits
+             only decide which of them are kept
+    '''
+    return (
+        trace.module,
+        trace.function,
+        trace.statement,
+        trace.lineno,
+        trace.end_lineno,
+        trace.condition,
     )
 
 
 class Probe(HasStack):
     package: str
-    traces: pd.DataFrame
+    traces: TraceStore
     code: Dict[FunctionPath, types.CodeType]
+    fingerprints: Dict[FunctionPath, Fingerprint]
 
-    def __init__(self, package: str):
+    def __init__(self, package: str, *, code_cache_size: int = 256):
         super().__init__()
         self.package = package
-        self.traces = pd.DataFrame(
-            [],
-            columns=TRACE_WITH_ERROR_COLUMNS,
-        )
+        self.traces = TraceStore()
         self.module_resolver: FileModuleResolver = FileModuleResolver(package)
         self._code_reassigner = CodeReassigner()
+        self.code_cache = CodeCache(code_cache_size)
         self.code = {}
+        self.fingerprints = {}
+        # desired states are applied one at a time, whichever thread
+        # applies them
+        self._lock = threading.Lock()
 
     def enter(self):
         # first clear the desired state
@@ -128,8 +90,8 @@ class Probe(HasStack):
         desired_set: List[Dict[str, str]],
     ):
         """
-        constructs the desired_set 
-        @returns a list of trace dictionaries
+        constructs the desired_set
+        @returns the trace store of the desired traces
         """
         new_desired_set = []
         for trace in desired_set:
@@ -160,16 +122,38 @@ class Probe(HasStack):
                     trace_id=trace_id,
                 )
 
+            # sampling, rate limits, conditions and the kind of trace are
+            # optional per trace
+            sample_rate = trace.get('sampleRate')
+            rate_limit = trace.get('rateLimit')
+            kind = trace.get('kind') or 'log'
+            end_line = trace.get('endLine') if kind == 'latency' else None
+            try:
+                validate_limits(sample_rate, rate_limit)
+                if kind not in TRACE_KINDS:
+                    raise ValueError(f'unknown trace kind {kind}')
+                if end_line is not None and end_line < trace['line']:
+                    raise ValueError('endLine can not come before line')
+            except ValueError as exc:
+                raise ProbeException(
+                    message=str(exc), trace_id=trace_id
+                ) from exc
+
             new_desired_set.append(
-                {
-                    "id": trace_id,
-                    "function": function_name,
-                    "statement": trace['statement'],
-                    "module": module,
-                    'lineno': trace['line']
-                }
+                TraceRecord(
+                    id=trace_id,
+                    function=function_name,
+                    statement=trace['statement'],
+                    module=module,
+                    lineno=trace['line'],
+                    sample_rate=sample_rate,
+                    rate_limit=rate_limit,
+                    condition=trace.get('condition'),
+                    kind=kind,
+                    end_lineno=end_line,
+                )
             )
-        return new_desired_set
+        return TraceStore(new_desired_set)
 
     def new_desired_state(
         self,
@@ -182,46 +166,189 @@ class Probe(HasStack):
                   a dict mapping (function, module) to Exception is returned
         TODO make the error dict point directly to the problematic trace id
         '''
-        desired_set = self._construct_desired_set(desired_set)
-        LOGGER.debug('input desired_set %s', desired_set)
-        traces_df, new_traces, functions_to_be_reverted, errors = self._add_desired_set(
-            desired_set
-        )
-        LOGGER.debug('final desired_set %s', list(traces_df.id))
+        with self._lock:
+            desired_set = self._construct_desired_set(desired_set)
+            LOGGER.debug('input desired_set %s', desired_set)
+            diff, new_code, functions_to_be_reverted, errors = \
+                self._add_desired_set(desired_set)
+            LOGGER.debug(
+                'final desired_set %s', list(diff.new_traces.ids())
+            )
+
+            try:
+                self._apply_desired_set(
+                    diff, new_code, functions_to_be_reverted, errors
+                )
+            finally:
+                self._unbind_logging(
+                    [
+                        *new_code,
+                        *(location for location, _ in functions_to_be_reverted)
+                    ]
+                )
 
+    def _apply_desired_set(
+        self,
+        diff: DiffResult,
+        new_code: Dict[FunctionPath, Tuple[types.CodeType, Fingerprint]],
+        functions_to_be_reverted: List[Tuple[FunctionPath,
+                                             types.FunctionType]],
+        errors: Dict[FunctionPath, Exception],
+    ):
         if errors != {}:
             raise MultiTraceException(errors)
 
-        for func in functions_to_be_reverted:
-            self._code_reassigner.revert_function(func)
+        # every function is looked up before any of them is changed
+        functions = {
+            location: self._get_function(*location)
+            for location in new_code
+        }
+
+        # only after ensuring there are no errors at all do we set code
+        # objects
+        self._swap_code(functions_to_be_reverted, new_code, functions)
+
+        # limiters and metrics are only set once the code using them is
+        # assigned, so a failed swap leaves them matching the code. a
+        # hit in between finds the trace's previous limiter and metric,
+        # or none, and is logged unlimited or not aggregated
+        self._set_trace_state(self.traces, diff)
+        for location, _ in functions_to_be_reverted:
+            del self.code[location]
+            del self.fingerprints[location]
+        for location, (code, fingerprint) in new_code.items():
+            self.code[location] = code
+            self.fingerprints[location] = fingerprint
+        for trace in diff.to_be_removed:
+            inquest.logging.remove_limiter(trace.id)
+            inquest.logging.remove_metric(trace.id)
+        self.traces = diff.new_traces
+
+    def _unbind_logging(self, locations: List[FunctionPath]):
+        '''
+        removes the generated code's global from the modules of the
+        locations once none of their functions has generated code, so
+        the modules are left as they were found
+        '''
+        traced = {module for module, _ in self.code}
+        for module, function in locations:
+            if module in traced:
+                continue
+            try:
+                codegen.unbind_logging(self._get_function(module, function))
+            except ProbeException:
+                continue
+
+    def _swap_code(
+        self,
+        functions_to_be_reverted: List[Tuple[FunctionPath,
+                                             types.FunctionType]],
+        new_code: Dict[FunctionPath, Tuple[types.CodeType, Fingerprint]],
+        functions: Dict[FunctionPath, types.FunctionType],
+    ):
+        '''
+        reverts and assigns the functions' code as one change. if assigning
+        any of them fails the ones already changed get their previous code
+        back, so no function is left with code of another desired state
+        '''
+        previous = []
+        try:
+            for _, func in functions_to_be_reverted:
+                previous.append((func, func.__code__))
+                self._code_reassigner.revert_function(func)
+            for location, (code, _) in new_code.items():
+                func = functions[location]
+                previous.append((func, func.__code__))
+                # cached code may have been generated before the module's
+                # global was last removed
+                codegen.bind_logging(func)
+                self._code_reassigner.assign_function(func, code)
+        except BaseException:
+            for func, code in reversed(previous):
+                func.__code__ = code
+            raise
 
-        # TODO figure out where to send errors when this fails
-        # only after ensuring there are no errors at all do we set code objects
-        for (module, function), code in new_traces.items():
-            function_obj = self._get_function(module, function)
-            self._code_reassigner.assign_function(function_obj, code)
-        self.traces = traces_df
+    @staticmethod
+    def _set_trace_state(traces: TraceStore, diff: DiffResult):
+        for trace in [*diff.to_be_added, *diff.to_be_updated]:
+            if trace.kind != 'log':
+                # values of another expression or another part of the code
+                # don't belong in the same aggregate
+                previous = traces.get(trace.id)
+                reset = previous is not None and _measured(previous) != \
+                    _measured(trace)
+                inquest.logging.add_metric(trace.id, trace.kind, reset)
+            else:
+                inquest.logging.remove_metric(trace.id)
+
+            if not trace.limited:
+                inquest.logging.remove_limiter(trace.id)
+                continue
+            limiter = inquest.logging.get_limiter(trace.id)
+            if limiter is None or not limiter.same_limits(
+                    trace.sample_rate, trace.rate_limit):
+                inquest.logging.set_limiter(
+                    trace.id,
+                    TraceLimiter(
+                        sample_rate=trace.sample_rate,
+                        rate_limit=trace.rate_limit,
+                    ),
+                )
 
-    def _add_desired_set(self, desired_set: List[Dict[str, str]]):
+    def trace_stats(self) -> Dict[str, LimiterStats]:
+        '''
+        @returns the number of hits each limited trace sampled out
+                 or suppressed
+        '''
+        stats = inquest.logging.limiter_stats()
+        return {
+            trace_id: stats[trace_id]
+            for trace_id in self.traces.ids()
+            if trace_id in stats
+        }
+
+    def _add_desired_set(self, desired_set: TraceStore):
         '''
         composes the new trace state given the input desired_set
-        @returns a tuple of the new traces, the final code objects,
+        only functions whose group of traces changed are regenerated
+        @returns a tuple of the diff, the code objects and fingerprints
+                 of the changed functions, the functions to be reverted,
                  and the error dict
         '''
-        desired_df = pd.DataFrame(
-            desired_set,
-            columns=TRACE_COLUMNS,
-        )
         diff = diff_desired_set(
             self.traces,
-            desired_df,
+            desired_set,
         )
 
-        functions_to_be_reverted = list(
-            self._functions_to_be_removed(diff.to_be_removed)
+        functions_to_be_reverted = []
+        locations_to_be_set = []
+        for location in self._changed_locations(diff):
+            fingerprint = diff.new_traces.fingerprint(location)
+            if fingerprint == self.fingerprints.get(location, ()):
+                continue
+            if fingerprint:
+                locations_to_be_set.append(location)
+            else:
+                functions_to_be_reverted.append(
+                    (location, self._get_function(*location))
+                )
+
+        new_code, errors = self._set_traces(
+            diff.new_traces, locations_to_be_set
         )
-        new_traces, errors = self._set_traces(diff.new_traces)
-        return diff.new_traces, new_traces, functions_to_be_reverted, errors
+        return diff, new_code, functions_to_be_reverted, errors
+
+    def _changed_locations(self, diff: DiffResult) -> Set[FunctionPath]:
+        '''
+        @returns every function whose traces were added, removed or updated
+        '''
+        changed = set(diff.to_be_added.locations())
+        changed.update(diff.to_be_removed.locations())
+        for trace in diff.to_be_updated:
+            changed.add(trace.location)
+            # an update can move a trace out of its previous function
+            changed.add(self.traces.get(trace.id).location)
+        return changed
 
     def _get_function(
         self, module: str, function: str, trace_id: Optional[str] = None
@@ -234,35 +361,47 @@ class Probe(HasStack):
         except Exception as exc:
             raise ProbeException(message=str(exc), trace_id=trace_id) from exc
 
-    def _functions_to_be_removed(self, traces: pd.DataFrame):
-        for (module, function), _ in group_by_location(traces):
-            yield self._get_function(module, function)
-
-    def _set_traces(self, traces: pd.DataFrame):
+    def _set_traces(
+        self,
+        traces: TraceStore,
+        locations: List[FunctionPath],
+    ):
         '''
-        sets the code dict for the new traces
+        generates the code for the functions at the given locations
         '''
         new_code = {}
         errors = {}
-        for (module, function), group in group_by_location(traces):
+        for location in locations:
             try:
-                statements = [
-                    codegen.Trace(
-                        statement=statement,
-                        id=id,
-                        lineno=lineno,
-                    ) for statement, id, lineno in
-                    zip(group['statement'], group['id'], group['lineno'])
-                ]
-                embedded_code = codegen.add_log_statements(
-                    self._get_function(module, function),
-                    statements,
+                fingerprint = traces.fingerprint(location)
+                new_code[location] = (
+                    self._generate_code(location, fingerprint),
+                    fingerprint,
                 )
-                new_code[(module, function)] = embedded_code
             except Exception as error:  # pylint: disable=all
-                errors[(module, function)] = error
+                errors[location] = error
         return new_code, errors
 
+    def _generate_code(
+        self,
+        location: FunctionPath,
+        fingerprint: Fingerprint,
+    ) -> types.CodeType:
+        '''
+        generates the function's code with the fingerprint's traces, reusing
+        the code generated earlier for the same function and traces
+        '''
+        function_obj = self._get_function(*location)
+        key = (self._code_reassigner.base_code(function_obj), fingerprint)
+        code = self.code_cache.get(key)
+        if code is None:
+            code = codegen.add_log_statements(
+                function_obj,
+                [codegen.Trace(*code_key) for code_key in fingerprint],
+            )
+            self.code_cache.put(key, code)
+        return code
+
     @staticmethod
     def get_path(module, function):
         return f'{module}:{function}'
@@ -1,16 +1,8 @@
-import asyncio
 import inspect
 import logging
 import threading
 from typing import List, Optional, Union
 
-from inquest.comms.client_provider import ClientProvider
-from inquest.comms.exception_sender import ExceptionSender
-from inquest.comms.heartbeat import Heartbeat
-from inquest.comms.log_sender import LogSender
-from inquest.comms.module_sender import ModuleSender
-from inquest.comms.trace_set_subscriber import TraceSetSubscriber
-from inquest.comms.version_checker import check_version
 from inquest.probe import Probe
 
 LOGGER = logging.getLogger(__name__)
@@ -61,14 +53,30 @@ class ProbeRunner(threading.Thread):
         return "" if not self.ssl else "s"
 
     def client_consumers(self):
+        # pylint: disable=import-outside-toplevel
+        # the comms stack pulls in aiohttp, gql and websockets which
+        # are slow to import, so they are only loaded on the probe thread
+        from inquest.comms.error_reporter import ErrorReporter
+        from inquest.comms.exception_sender import ExceptionSender
+        from inquest.comms.heartbeat import Heartbeat
+        from inquest.comms.log_sender import LogSender
+        from inquest.comms.metric_sender import MetricSender
+        from inquest.comms.module_sender import ModuleSender
+        from inquest.comms.trace_set_subscriber import TraceSetSubscriber
+        from inquest.comms.trace_stats_sender import TraceStatsSender
+
         sender = ExceptionSender()
+        error_reporter = ErrorReporter(exception_sender=sender)
         consumers = [
             TraceSetSubscriber(
                 probe=self.probe,
                 package=self.package,
                 exception_sender=sender,
             ),
-            LogSender(exception_sender=sender),
+            LogSender(error_reporter=error_reporter),
+            error_reporter,
+            TraceStatsSender(probe=self.probe),
+            MetricSender(),
             Heartbeat(),
             sender,
         ]
@@ -90,6 +98,8 @@ class ProbeRunner(threading.Thread):
         """
         # pylint: disable=global-statement, broad-except
         global _ENABLED
+        # pylint: disable=import-outside-toplevel
+        import asyncio
         try:
             LOGGER.info('inquest daemon is running')
             evloop = asyncio.new_event_loop()
@@ -105,12 +115,11 @@ class ProbeRunner(threading.Thread):
                 _ENABLED = False
 
     async def _run_async(self):
-        url = f'ws{self._ssl_suffix}://{self.endpoint}/api/graphql'
+        # pylint: disable=import-outside-toplevel
+        from inquest.comms.client_provider import ClientProvider
+        from inquest.comms.schema_cache import SchemaCache
 
-        # checks that the versions match between the backend and the frontend
-        await check_version(
-            f'http{self._ssl_suffix}://{self.endpoint}/api/version'
-        )
+        url = f'ws{self._ssl_suffix}://{self.endpoint}/api/graphql'
 
         consumers = self.client_consumers()
         async with ClientProvider(
@@ -118,6 +127,12 @@ class ProbeRunner(threading.Thread):
                 url=url,
                 ssl=self.ssl,
                 consumers=consumers,
+                # checks that the versions match between the backend and
+                # the frontend
+                version_url=(
+                    f'http{self._ssl_suffix}://{self.endpoint}/api/version'
+                ),
+                schema_cache=SchemaCache(),
         ) as provider:
             await provider.main()
 
@@ -149,8 +164,10 @@ def enable(
             # set ssl to true if the port points to the classic ssl port
             ssl = port == 443
         if package is None:
-            frame = inspect.stack()[1]
-            mod = inspect.getmodule(frame[0])
+            # inspect.stack() would read the source of every frame on the
+            # stack, only the caller's frame is needed here
+            frame = inspect.currentframe().f_back
+            mod = inspect.getmodule(frame)
             package = mod.__name__
         probe = ProbeRunner(
             package=package,
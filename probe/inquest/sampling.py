@@ -0,0 +1,110 @@
+import numbers
+import random
+import time
+from typing import NamedTuple, Optional
+
+
+class LimiterStats(NamedTuple):
+    sampled_out: int
+    suppressed: int
+
+
+def validate_limits(
+    sample_rate: Optional[float],
+    rate_limit: Optional[float],
+):
+    '''
+    @raises ValueError if either isn't a number, the sample rate isn't in
+            (0, 1] or the rate limit isn't positive
+    '''
+    for name, value in (('sample rate', sample_rate),
+                        ('rate limit', rate_limit)):
+        if value is not None and (
+            isinstance(value, bool) or not isinstance(value, numbers.Real)
+        ):
+            raise ValueError(f'{name} must be a number')
+    if sample_rate is not None and not 0 < sample_rate <= 1:
+        raise ValueError('sample rate must be in (0, 1]')
+    if rate_limit is not None and not rate_limit > 0:
+        raise ValueError('rate limit must be positive')
+
+
+class TraceLimiter:
+    """
+    decides whether a trace hit is logged.
+    a hit is first sampled with probability sample_rate, then has to take a
+    token from a bucket that refills at rate_limit tokens per second and
+    holds at most burst tokens.
+    the counters aren't locked so they can be off by a few under contention
+    """
+
+    __slots__ = (
+        'sample_rate',
+        'rate_limit',
+        'burst',
+        '_tokens',
+        '_last',
+        'sampled_out',
+        'suppressed',
+    )
+
+    def __init__(
+        self,
+        *,
+        sample_rate: Optional[float] = None,
+        rate_limit: Optional[float] = None,
+        burst: Optional[float] = None,
+    ):
+        validate_limits(sample_rate, rate_limit)
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        if burst is None:
+            burst = max(1.0, rate_limit or 0.0)
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self.sampled_out = 0
+        self.suppressed = 0
+
+    def same_limits(self, sample_rate, rate_limit) -> bool:
+        return (
+            self.sample_rate == sample_rate and self.rate_limit == rate_limit
+        )
+
+    def allow(self) -> bool:
+        if (
+            self.sample_rate is not None
+            and random.random() >= self.sample_rate
+        ):
+            self.sampled_out += 1
+            return False
+
+        if self.rate_limit is not None:
+            now = time.monotonic()
+            tokens = min(
+                self.burst,
+                self._tokens + (now - self._last) * self.rate_limit,
+            )
+            self._last = now
+            if tokens < 1:
+                self._tokens = tokens
+                self.suppressed += 1
+                return False
+            self._tokens = tokens - 1
+        return True
+
+    def refilled(self) -> bool:
+        '''
+        @returns whether the bucket is full again, from then on the limiter
+                 decides like a new one would
+        '''
+        if self.rate_limit is None:
+            return True
+        elapsed = time.monotonic() - self._last
+        return self._tokens + elapsed * self.rate_limit >= self.burst
+
+    def stats(self) -> LimiterStats:
+        return LimiterStats(
+            sampled_out=self.sampled_out,
+            suppressed=self.suppressed,
+        )
@@ -1,8 +1,13 @@
 import ast
+import copy
+import dataclasses
+import random
 
 import astor
 
-from inquest.injection.ast_injector import ASTInjector, TestStatement, insert
+from inquest.injection.ast_injector import (
+    ASTInjector, InjectionError, TestStatement, insert, insert_all
+)
 
 
 def empty_statement(lineno: int):
@@ -216,3 +221,190 @@ def test():
     print('hello')
 '''
     )
+
+
+@dataclasses.dataclass
+class TaggedStatement(TestStatement):
+    tag: str = ''
+
+
+def _random_block(rng, line, depth):
+    statements = []
+    for _ in range(rng.randint(1, 4)):
+        # a statement can share the line of the statement before it
+        line += rng.choice([0, 1, 1, 2])
+        if depth < 3 and rng.random() < 0.3:
+            blocks = []
+            for _ in range(rng.randint(1, 2)):
+                block, line = _random_block(
+                    rng, line + rng.choice([0, 1]), depth + 1
+                )
+                blocks.append(block)
+            statements.append(TaggedStatement(line, blocks, f's{line}'))
+        else:
+            statements.append(TaggedStatement(line, None, f's{line}'))
+    return statements, line
+
+
+def _marker(line, idx, compound):
+    if compound:
+        return TaggedStatement(line, [[TaggedStatement(line, None, f't{idx}')]])
+    return TaggedStatement(line, None, f't{idx}')
+
+
+def _flatten(node):
+    tags = [node.tag] if getattr(node, 'tag', '') else []
+    for block in node.body or []:
+        for statement in block:
+            tags.extend(_flatten(statement))
+    return tags
+
+
+def test_insert_all_matches_insert():
+    rng = random.Random(0)
+    for _ in range(500):
+        block, last_line = _random_block(rng, 2, 0)
+        root = TaggedStatement(1, [block], 'root')
+        compound = rng.random() < 0.5
+        lines = [
+            rng.randint(0, last_line + 1) for _ in range(rng.randint(1, 8))
+        ]
+
+        sequential = copy.deepcopy(root)
+        sequential_failed = False
+        for idx in sorted(range(len(lines)), key=lambda idx: lines[idx]):
+            res, _ = insert(
+                sequential, lines[idx], _marker(lines[idx], idx, compound)
+            )
+            sequential_failed = sequential_failed or not res
+
+        original = copy.deepcopy(root)
+        try:
+            batched = insert_all(
+                root,
+                [
+                    (line, _marker(line, idx, compound))
+                    for idx, line in enumerate(lines)
+                ],
+            )
+        except InjectionError:
+            assert sequential_failed
+            continue
+        assert not sequential_failed
+        assert _flatten(batched) == _flatten(sequential)
+        # the input tree is left untouched
+        assert root == original
+
+
+def test_ast_injector_insert_all():
+    node = ast.parse(
+        '''\
+def test():
+    for x in range(20):
+        print(x)
+    return "hello"
+'''
+    )
+    injector = ASTInjector(node.body[0])
+    injector.insert_all(
+        [
+            (3, ast.parse("print('after')").body[0]),
+            (1, ast.parse("print('first')").body[0]),
+            (2, ast.parse("print('loop')").body[0]),
+        ]
+    )
+    assert astor.to_source(injector.result()) == '''\
+def test():
+    print('first')
+    for x in range(20):
+        print('loop')
+        print(x)
+        print('after')
+    return \'hello\'
+'''
+    # the input ast is never mutated
+    assert astor.to_source(node) == '''\
+def test():
+    for x in range(20):
+        print(x)
+    return \'hello\'
+'''
+
+
+def test_ast_injector_insert_all_failure():
+    node = ast.parse('''\
+def test():
+    return "hello"
+''')
+    injector = ASTInjector(node.body[0])
+    try:
+        injector.insert_all(
+            [
+                (2, ast.parse("print('ok')").body[0]),
+                (5, ast.parse("print('outside')").body[0]),
+            ]
+        )
+        assert False, "expected an InjectionError"
+    except InjectionError as exc:
+        assert (exc.index, exc.line) == (1, 5)
+
+
+def test_ast_injector_wrap():
+    node = ast.parse(
+        '''\
+def test():
+    x = 1
+    for x in range(20):
+        print(x)
+
+        print(x * 2)
+    return "hello"
+'''
+    ).body[0]
+
+    def wrapper(statements):
+        try_node = ast.parse('try:\n    pass\nfinally:\n    done()').body[0]
+        try_node.body = statements
+        return [try_node]
+
+    def assert_wrapped(start, end, expected):
+        injector = ASTInjector(node)
+        injector.wrap(start, end, wrapper)
+        assert astor.to_source(injector.result()) == expected
+
+    # lines inside of the loop wrap the loop's statements
+    assert_wrapped(
+        4, 6, '''\
+def test():
+    x = 1
+    for x in range(20):
+        try:
+            print(x)
+            print(x * 2)
+        finally:
+            done()
+    return \'hello\'
+'''
+    )
+    # starting on the loop's line wraps the loop, blank lines are skipped
+    assert_wrapped(
+        3, 5, '''\
+def test():
+    x = 1
+    try:
+        for x in range(20):
+            print(x)
+            print(x * 2)
+    finally:
+        done()
+    return \'hello\'
+'''
+    )
+    # the input ast is never mutated
+    assert 'done' not in astor.to_source(node)
+
+    try:
+        ASTInjector(node).wrap(8, 9, wrapper)
+        assert False, "expected a ValueError"
+    except ValueError:
+        pass
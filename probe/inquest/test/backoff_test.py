@@ -0,0 +1,26 @@
+import random
+
+from inquest.comms.backoff import Backoff
+
+
+def test_delays_grow_and_are_capped():
+    backoff = Backoff(initial=1.0, maximum=8.0, rng=random.Random(0))
+    delays = [backoff.next() for _ in range(6)]
+    for delay, ceiling in zip(delays, [1, 2, 4, 8, 8, 8]):
+        assert ceiling / 2 <= delay <= ceiling
+
+
+def test_delays_are_jittered():
+    delays = {
+        Backoff(initial=1.0, rng=random.Random(seed)).next()
+        for seed in range(10)
+    }
+    assert len(delays) == 10
+
+
+def test_reset():
+    backoff = Backoff(initial=1.0, maximum=8.0)
+    for _ in range(5):
+        backoff.next()
+    backoff.reset()
+    assert backoff.next() <= 1.0
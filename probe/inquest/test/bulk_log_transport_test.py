@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from inquest.comms.bulk_log_transport import (
+    CONTENT_TYPE, ENCODINGS, BulkLogTransport, BulkLogTransportException,
+    decode_batch, encode_batch
+)
+from inquest.comms.log_sender import LogSender
+
+
+@pytest.mark.parametrize('compression', list(ENCODINGS))
+def test_round_trips_batches(compression):
+    lines = ['', 'hello', 'ünïcode', 'x' * 100000]
+    body = encode_batch(lines, compression)
+    assert len(body) < 1000
+    assert decode_batch(body, compression) == lines
+
+
+async def _stand_in_server(received, status=200):
+    compressions = {
+        encoding: compression
+        for compression, encoding in ENCODINGS.items()
+    }
+
+    async def handle(request: web.Request):
+        assert request.content_type == CONTENT_TYPE
+        # read the raw body, aiohttp would otherwise decompress it
+        body = await request.content.read()
+        compression = compressions[request.headers['Content-Encoding']]
+        received.append(
+            (request.match_info['trace_set'], decode_batch(body, compression))
+        )
+        return web.Response(status=status)
+
+    app = web.Application()
+    app.router.add_post('/api/logs/{trace_set}', handle)
+    runner = web.AppRunner(app, auto_decompress=False)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/api/logs'
+
+
+@pytest.mark.asyncio
+async def test_log_sender_posts_to_the_bulk_endpoint():
+    received = []
+    runner, url = await _stand_in_server(received)
+    try:
+        sender = LogSender(
+            error_reporter=None,
+            transport=BulkLogTransport(url=url, compression='zlib'),
+        )
+        sender._set_values(None, 'trace_set')
+        async with sender:
+            callback = sender.gen_callback()
+            main = asyncio.create_task(sender.main())
+            for idx in range(3):
+                callback.log(str(idx))
+            while not received:
+                await asyncio.sleep(0.01)
+            main.cancel()
+        assert received == [('trace_set', ['0', '1', '2'])]
+        assert sender.transport.bytes_sent > 0
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_failed_posts_raise():
+    runner, url = await _stand_in_server([], status=500)
+    try:
+        async with BulkLogTransport(url=url) as transport:
+            with pytest.raises(BulkLogTransportException):
+                await transport.send('trace_set', ['line'])
+    finally:
+        await runner.cleanup()
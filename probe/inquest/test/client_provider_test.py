@@ -0,0 +1,273 @@
+import asyncio
+import random
+
+import pytest
+
+import inquest.logging
+from inquest.comms.backoff import Backoff
+from inquest.comms.client_consumer import ClientConsumer
+from inquest.comms.exception_sender import ExceptionSender
+from inquest.comms.heartbeat import Heartbeat
+from inquest.comms.log_sender import LogSender
+from inquest.comms.operations import supports_deltas
+from inquest.comms.schema_cache import SchemaCache
+from inquest.comms.trace_set_subscriber import TraceSetSubscriber
+from inquest.comms.version_checker import VersionCheckException
+from inquest.probe import Probe
+from inquest.test.probe_test_module.test_imported_module import sample
+from inquest.test.stand_in_backend import (
+    StandInBackend,
+    StandInClientProvider,
+    stop,
+    wait_for,
+)
+
+
+class CountingInitializer(ClientConsumer):
+    initialization = True
+
+    def __init__(self):
+        super().__init__()
+        self.runs = 0
+
+    async def main(self):
+        self.runs += 1
+
+
+def _trace(trace_id: str, statement: str):
+    return {
+        'id': trace_id,
+        'function':
+            {
+                'name': sample.__name__,
+                'file':
+                    {
+                        'name':
+                            'inquest/test/probe_test_module/'
+                            + 'test_imported_module.py'
+                    },
+                'parentClass': None,
+            },
+        'statement': statement,
+        'line': 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_reconnects_after_the_backend_restarts():
+    backend = StandInBackend()
+
+    initializer = CountingInitializer()
+    sender = ExceptionSender()
+    log_sender = LogSender(error_reporter=None, batching={'max_count': 1})
+    with Probe(__name__) as probe:
+        async with StandInClientProvider(
+                backend,
+                consumers=[
+                    initializer,
+                    sender,
+                    TraceSetSubscriber(
+                        probe=probe,
+                        package=__name__,
+                        exception_sender=sender,
+                    ),
+                    log_sender,
+                    Heartbeat(delay=0.05),
+                ],
+                backoff=Backoff(initial=0.05, maximum=0.1),
+        ) as provider:
+            main = asyncio.create_task(provider.main())
+            await wait_for(lambda: backend.subscribers == 1)
+            inquest.logging.log('before')
+            await wait_for(lambda: backend.logs == ['before'])
+
+            backend.kill()
+            # buffered while the probe is disconnected
+            inquest.logging.log('during')
+            await asyncio.sleep(0.2)
+            backend.restart()
+
+            await wait_for(lambda: backend.subscribers == 1)
+            await wait_for(lambda: backend.logs == ['before', 'during'])
+            heartbeats = backend.heartbeats
+            await wait_for(lambda: backend.heartbeats > heartbeats)
+
+            # the new subscription delivers trace changes
+            backend.notify([_trace('1', 'traced {arg1}')])
+            await wait_for(lambda: probe.traces.get('1') is not None)
+            assert backend.failures == []
+            await stop(main)
+
+    # logged in once, the second connection reused the authorization
+    assert backend.probes == 1
+    assert len(backend.connections) >= 3
+    assert backend.connections[1] is not None
+    assert len(set(backend.connections[1:])) == 1
+    # the initialization consumers weren't run again
+    assert initializer.runs == 1
+
+
+@pytest.mark.asyncio
+async def test_keeps_sending_logs_across_many_reconnects():
+    backend = StandInBackend()
+    log_sender = LogSender(error_reporter=None, max_in_flight=2)
+    async with StandInClientProvider(
+            backend,
+            consumers=[log_sender],
+            backoff=Backoff(initial=0.01, maximum=0.02),
+    ) as provider:
+        main = asyncio.create_task(provider.main())
+        # more reconnects than the log sender has slots in its window
+        restarts = log_sender.send_window.size + 1
+        for restart in range(restarts):
+            connections = len(backend.connections)
+            inquest.logging.log(str(restart))
+            await wait_for(lambda: len(backend.logs) == restart + 1)
+            backend.kill()
+            await asyncio.sleep(0.05)
+            backend.restart()
+            await wait_for(lambda: len(backend.connections) > connections)
+
+        inquest.logging.log('last')
+        await wait_for(lambda: backend.logs[-1:] == ['last'])
+        await stop(main)
+
+    assert backend.logs == [
+        *(str(restart) for restart in range(restarts)),
+        'last',
+    ]
+    assert log_sender.send_window.in_flight == 0
+
+
+class RecordingBackoff(Backoff):
+
+    def __init__(self, **kwargs):
+        super().__init__(rng=random.Random(0), **kwargs)
+        self.delays = []
+
+    def next(self):
+        delay = super().next()
+        self.delays.append(delay)
+        return delay
+
+
+@pytest.mark.asyncio
+async def test_backs_off_from_connections_dropped_right_away():
+    backend = StandInBackend()
+    backoff = RecordingBackoff(initial=0.01, maximum=0.08)
+    async with StandInClientProvider(
+            backend,
+            consumers=[Heartbeat(delay=0.01)],
+            backoff=backoff,
+            stable_after=0.1,
+    ) as provider:
+        main = asyncio.create_task(provider.main())
+        backend.drops_connections = True
+        backend.kill()
+        backend.restart()
+        await wait_for(lambda: len(backoff.delays) == 5)
+        # every connection was accepted, and still the delays grew
+        assert len(backend.connections) >= 6
+        assert backoff.delays[0] <= 0.01
+        assert all(delay >= 0.04 for delay in backoff.delays[3:])
+
+        # a connection that stays up has the delays start over
+        backend.drops_connections = False
+        connections = len(backend.connections)
+        await wait_for(lambda: len(backend.connections) > connections)
+        await asyncio.sleep(0.15)
+        attempts = len(backoff.delays)
+        backend.kill()
+        backend.restart()
+        await wait_for(lambda: len(backoff.delays) > attempts)
+        assert backoff.delays[attempts] <= 0.01
+        await stop(main)
+
+
+@pytest.mark.asyncio
+async def test_logs_in_and_loads_the_schema_over_one_connection():
+    backend = StandInBackend()
+    async with StandInClientProvider(
+            backend, consumers=[Heartbeat()]
+    ) as provider:
+        pass
+
+    assert backend.connections[0] is None
+    assert backend.connections[1:] == [provider.headers['Authorization']]
+    assert sorted(backend.operations) == [
+        (0, 'IntrospectionQuery'),
+        (0, 'NewProbeMutation'),
+    ]
+    assert set(provider.timings) == {
+        'version',
+        'login_connect',
+        'login',
+        'schema',
+        'connect',
+        'consumers',
+        'total',
+    }
+
+
+class IncompatibleClientProvider(StandInClientProvider):
+
+    async def _check_version(self):
+        await asyncio.sleep(0.01)
+        raise VersionCheckException('backend version incompatible')
+
+
+@pytest.mark.asyncio
+async def test_connects_while_checking_the_version():
+    backend = StandInBackend()
+    with pytest.raises(VersionCheckException):
+        async with IncompatibleClientProvider(backend, consumers=[]):
+            pass
+
+    # the connection was opened, but no probe was created
+    assert backend.connections == [None]
+    assert backend.probes == 0
+
+
+def _introspections(backend: StandInBackend) -> int:
+    return sum(
+        1 for _, name in backend.operations if name == 'IntrospectionQuery'
+    )
+
+
+@pytest.mark.asyncio
+async def test_warm_starts_skip_introspection(tmp_path):
+    backend = StandInBackend(version='1.2.3')
+    cache = SchemaCache(str(tmp_path))
+    for _ in range(2):
+        async with StandInClientProvider(
+                backend, consumers=[], schema_cache=cache
+        ) as provider:
+            assert provider.schema is not None
+
+    assert _introspections(backend) == 1
+    assert backend.probes == 2
+
+    # another version of the backend has its schema loaded again
+    backend.version = '1.3.0'
+    async with StandInClientProvider(
+            backend, consumers=[], schema_cache=cache
+    ):
+        pass
+    assert _introspections(backend) == 2
+
+    # as does another build of the same version with another schema
+    delta_backend = StandInBackend(version='1.3.0', deltas=True)
+    async with StandInClientProvider(
+            delta_backend, consumers=[], schema_cache=cache
+    ) as provider:
+        assert supports_deltas(provider.schema)
+    assert _introspections(delta_backend) == 1
+
+    # a backend that doesn't send its schema hash isn't cached
+    backend.schema_hash = None
+    for _ in range(2):
+        async with StandInClientProvider(
+                backend, consumers=[], schema_cache=cache
+        ):
+            pass
+    assert _introspections(backend) == 4
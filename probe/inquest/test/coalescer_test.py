@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from inquest.comms.coalescer import Coalescer
+
+
+@pytest.mark.asyncio
+async def test_releases_the_latest_value_once_quiet():
+    coalescer = Coalescer(quiet=0.05, max_delay=1.0)
+    for value in range(5):
+        coalescer.put(value)
+        await asyncio.sleep(0.01)
+    assert await coalescer.get() == (4, 4)
+
+    coalescer.put(5)
+    assert await coalescer.get() == (5, 0)
+    assert coalescer.skipped == 4
+
+
+@pytest.mark.asyncio
+async def test_max_delay_bounds_a_steady_stream():
+    coalescer = Coalescer(quiet=0.05, max_delay=0.1)
+
+    async def stream():
+        for value in range(100):
+            coalescer.put(value)
+            await asyncio.sleep(0.01)
+
+    producer = asyncio.create_task(stream())
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    value, skipped = await coalescer.get()
+    elapsed = loop.time() - started
+    producer.cancel()
+
+    assert elapsed < 0.2
+    assert 0 < value < 99
+    assert skipped == value
+
+
+@pytest.mark.asyncio
+async def test_take_ends_the_burst_early():
+    coalescer = Coalescer(quiet=10.0, max_delay=10.0)
+    assert coalescer.take() is None
+    coalescer.put(1)
+    coalescer.put(2)
+    assert coalescer.take() == 2
+    assert coalescer.take() is None
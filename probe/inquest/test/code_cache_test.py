@@ -0,0 +1,33 @@
+from inquest.injection.code_cache import CacheInfo, CodeCache
+
+
+def _code(value):
+    return compile(str(value), '<test>', 'eval')
+
+
+def test_code_cache_hits_and_misses():
+    cache = CodeCache(maxsize=2)
+    key = (_code(1), ((1, 'statement', 'id'),))
+    assert cache.get(key) is None
+    code = _code(2)
+    cache.put(key, code)
+    assert cache.get(key) is code
+    assert cache.info() == CacheInfo(
+        hits=1, misses=1, evictions=0, maxsize=2, currsize=1
+    )
+
+
+def test_code_cache_evicts_least_recently_used():
+    cache = CodeCache(maxsize=2)
+    original = _code(0)
+    keys = [(original, ((lineno, 'statement', 'id'),)) for lineno in range(3)]
+    cache.put(keys[0], _code(0))
+    cache.put(keys[1], _code(1))
+    # touching the first key makes the second the least recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], _code(2))
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    assert cache.info().evictions == 1
+    assert len(cache) == 2
@@ -1,8 +1,11 @@
-import pandas as pd
+from inquest.trace_store import TraceStore, diff_desired_set
 
-from inquest.probe import TRACE_COLUMNS, diff_desired_set
+from .probe_test import create_trace as create_probe_trace
+from .probe_test import flatten_trace
 
-from .probe_test import create_trace as create_trace_raw
+
+def create_trace_raw(*args):
+    return flatten_trace(create_probe_trace(*args))
 
 
 def create_trace(key: str, loc=None):
@@ -31,26 +34,16 @@ DEFAULT_SET = [
 
 
 def create_trace_df(data):
-    return pd.DataFrame(
-        data,
-        columns=TRACE_COLUMNS,
-    )
+    return TraceStore.from_dicts(data)
 
 
 def assert_diff(
     diff, desired_set_df, to_be_added, to_be_updated, to_be_removed
 ):
-    assert all(
-        diff.new_traces.set_index('id') == desired_set_df.set_index('id')
-    )
-
-    assert all(diff.to_be_added.set_index('id') == to_be_added.set_index('id'))
-    assert all(
-        diff.to_be_removed.set_index('id') == to_be_removed.set_index('id')
-    )
-    assert all(
-        diff.to_be_updated.set_index('id') == to_be_updated.set_index('id')
-    )
+    assert diff.new_traces == desired_set_df
+    assert diff.to_be_added == to_be_added
+    assert diff.to_be_removed == to_be_removed
+    assert diff.to_be_updated == to_be_updated
 
 
 def test_diff_desired_set():
@@ -180,3 +173,36 @@ def test_diff_desired_set_with_id_change_2():
         to_be_updated,
         to_be_removed,
     )
+
+
+def test_diff_desired_set_by_location():
+    trace_df = create_trace_df(DEFAULT_SET)
+    desired_set_df = create_trace_df(
+        [
+            create_trace("1"),
+            create_trace("3", loc="test"),
+            create_trace("4", loc="test"),
+        ]
+    )
+
+    diff = diff_desired_set(trace_df, desired_set_df)
+    assert set(diff.new_traces.locations()) == {
+        ("mod1", "function1"),
+        ("moduletest", "functiontest"),
+    }
+    assert [
+        trace.id
+        for trace in diff.new_traces.group(("moduletest", "functiontest"))
+    ] == ["3", "4"]
+    assert list(diff.to_be_removed.locations()) == [("mod2", "function2")]
+    assert diff.to_be_added.group(("mod1", "function1")) == []
+
+
+def test_trace_store_duplicate_ids():
+    store = create_trace_df([
+        create_trace("1"),
+        create_trace("1", loc="test"),
+    ])
+    assert len(store) == 1
+    assert list(store.locations()) == [("moduletest", "functiontest")]
+    assert store.get("1").module == "moduletest"
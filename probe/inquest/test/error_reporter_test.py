@@ -0,0 +1,155 @@
+import pytest
+
+from inquest.comms.error_reporter import ErrorReporter
+from inquest.comms.exception_sender import MAX_BATCH, ExceptionSender
+
+
+def _reports(reporter):
+    return [(exc.trace_id, exc.message) for exc in reporter._take_reports()]
+
+
+def test_deduplicates_errors():
+    reporter = ErrorReporter(exception_sender=None)
+    for _ in range(3):
+        reporter.report('1', 'boom')
+    reporter.report('1', 'other')
+    reporter.report('2', 'boom')
+    assert _reports(reporter) == [
+        ('1', 'boom (occurred 3 times)'),
+        ('1', 'other'),
+        ('2', 'boom'),
+    ]
+    assert _reports(reporter) == []
+
+
+def test_rate_limits_each_trace():
+    # one report per trace and no refill to speak of
+    reporter = ErrorReporter(
+        exception_sender=None, rate_limit=1e-9, burst=1, max_pending=3
+    )
+    reporter.report('1', 'first')
+    reporter.report('1', 'second')
+    reporter.report('2', 'boom')
+    assert _reports(reporter) == [('1', 'first'), ('2', 'boom')]
+
+    # the held back error keeps counting
+    reporter.report('1', 'second')
+    reporter.report('1', 'third')
+    reporter.report('1', 'fourth')
+    reporter.report('1', 'fifth')
+    assert _reports(reporter) == []
+    assert reporter._pending[('1', 'second')] == 2
+    assert reporter.dropped == 1
+
+
+class RecordingClient:
+
+    def __init__(self):
+        self.requests = []
+
+    async def execute(self, query, variable_values):
+        self.requests.append(variable_values)
+        return {}
+
+
+@pytest.mark.asyncio
+async def test_sends_reports_in_one_mutation():
+    client = RecordingClient()
+    sender = ExceptionSender()
+    sender._set_values(client, 'trace_set')
+    reporter = ErrorReporter(exception_sender=sender)
+    for idx in range(3):
+        reporter.report(str(idx), 'boom')
+    await sender.send_exceptions(reporter._take_reports())
+    assert client.requests == [
+        {
+            f'input{idx}': {
+                'message': 'boom',
+                'traceId': str(idx),
+            }
+            for idx in range(3)
+        }
+    ]
+
+
+def test_forgets_the_limiters_of_quiet_traces():
+    reporter = ErrorReporter(exception_sender=None, rate_limit=1e9, burst=1)
+    reporter.report('1', 'boom')
+    assert _reports(reporter) == [('1', 'boom')]
+    assert reporter._limiters == {}
+
+    # a trace that can't report yet keeps its limiter
+    reporter = ErrorReporter(exception_sender=None, rate_limit=1e-9, burst=1)
+    reporter.report('1', 'boom')
+    assert _reports(reporter) == [('1', 'boom')]
+    assert list(reporter._limiters) == ['1']
+
+
+class FlakyClient(RecordingClient):
+
+    def __init__(self):
+        super().__init__()
+        self.up = False
+
+    async def execute(self, query, variable_values):
+        if not self.up:
+            raise ConnectionError('backend is down')
+        return await super().execute(query, variable_values)
+
+
+@pytest.mark.asyncio
+async def test_requeues_failed_reports_and_logs_drops():
+    client = FlakyClient()
+    sender = ExceptionSender()
+    sender._set_values(client, 'trace_set')
+    reporter = ErrorReporter(exception_sender=sender, max_pending=1)
+    reporter._set_values(client, 'trace_set')
+    reporter.report('1', 'boom')
+    reporter.report('2', 'boom')
+    await reporter._send()
+    assert reporter._pending == {('1', 'boom'): 1}
+
+    client.up = True
+    reporter.report('1', 'boom')
+    await reporter._send()
+    assert client.requests == [
+        {
+            'input0': {
+                'message': 'boom (occurred 2 times)',
+                'traceId': '1',
+            }
+        },
+        {
+            'content':
+                [
+                    'inquest: dropped 1 errors because too many were '
+                    + 'waiting to be reported'
+                ]
+        },
+    ]
+    await reporter._send()
+    assert len(client.requests) == 2
+
+
+class FailingLaterClient(RecordingClient):
+
+    async def execute(self, query, variable_values):
+        if self.requests:
+            raise ConnectionError('backend went away')
+        return await super().execute(query, variable_values)
+
+
+@pytest.mark.asyncio
+async def test_only_requeues_the_batches_that_failed():
+    client = FailingLaterClient()
+    sender = ExceptionSender()
+    sender._set_values(client, 'trace_set')
+    reporter = ErrorReporter(exception_sender=sender)
+    reporter._set_values(client, 'trace_set')
+    for idx in range(MAX_BATCH + 5):
+        reporter.report(str(idx), 'boom')
+    await reporter._send()
+    assert len(client.requests) == 1
+    assert list(reporter._pending) == [
+        (str(idx), 'boom') for idx in range(MAX_BATCH, MAX_BATCH + 5)
+    ]
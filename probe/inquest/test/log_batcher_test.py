@@ -0,0 +1,73 @@
+import pytest
+
+from inquest.comms.log_batcher import (
+    FLUSH_BYTES, FLUSH_COUNT, FLUSH_LATENCY, LogBatcher
+)
+from inquest.comms.log_buffer import EmissionBuffer
+from inquest.comms.log_sender import Log
+
+
+def _filled_buffer(lines):
+    log_buffer = EmissionBuffer()
+    for line in lines:
+        log_buffer.put(Log(line))
+    return log_buffer
+
+
+@pytest.mark.asyncio
+async def test_flushes_on_count():
+    batcher = LogBatcher(
+        _filled_buffer(str(idx) for idx in range(5)), max_count=2
+    )
+    batches = [await batcher.next_batch() for _ in range(2)]
+    assert [batch.reason for batch in batches] == [FLUSH_COUNT, FLUSH_COUNT]
+    assert batches[1].entries == [Log('2'), Log('3')]
+
+    batch = await batcher.next_batch()
+    assert (batch.entries, batch.reason) == ([Log('4')], FLUSH_LATENCY)
+    assert batcher.stats()['flush_reasons'] == {
+        FLUSH_COUNT: 2,
+        FLUSH_BYTES: 0,
+        FLUSH_LATENCY: 1,
+    }
+    assert batcher.stats()['batch_sizes']['sum'] == 5
+
+
+@pytest.mark.asyncio
+async def test_flushes_on_bytes_without_reordering():
+    batcher = LogBatcher(
+        _filled_buffer(['a' * 6, 'b' * 6, 'c', 'd' * 20]), max_bytes=10
+    )
+    batches = [await batcher.next_batch() for _ in range(3)]
+    assert [batch.entries for batch in batches] == [
+        [Log('a' * 6)],
+        [Log('b' * 6), Log('c')],
+        # an entry over the limit on its own is still sent
+        [Log('d' * 20)],
+    ]
+    assert [batch.reason for batch in batches] == [FLUSH_BYTES] * 3
+
+
+@pytest.mark.asyncio
+async def test_requeued_entries_are_batched_by_count():
+    batcher = LogBatcher(_filled_buffer(['buffered']), max_count=2)
+    batcher.requeue([Log(str(idx)) for idx in range(5)])
+    batches = [await batcher.next_batch() for _ in range(3)]
+    assert [batch.entries for batch in batches] == [
+        [Log('0'), Log('1')],
+        [Log('2'), Log('3')],
+        [Log('4'), Log('buffered')],
+    ]
+    assert [batch.reason for batch in batches] == [FLUSH_COUNT] * 3
+
+
+def test_window_follows_send_latency():
+    batcher = LogBatcher(EmissionBuffer(), min_window=0.01, max_window=0.5)
+    batcher.record_send(0.2)
+    assert batcher.window == 0.2
+    for _ in range(50):
+        batcher.record_send(10)
+    assert batcher.window == 0.5
+    for _ in range(50):
+        batcher.record_send(0)
+    assert batcher.window == 0.01
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+
+import pytest
+
+from inquest.comms.log_buffer import DROP_NEWEST, DROP_OLDEST, EmissionBuffer
+
+
+def test_keeps_order_within_a_thread():
+    buffer = EmissionBuffer(capacity=150)
+
+    def produce(name):
+        for idx in range(50):
+            buffer.put((name, idx))
+
+    threads = [
+        threading.Thread(target=produce, args=(name,)) for name in 'abc'
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(buffer) == 150
+    entries = buffer.drain()
+    for name in 'abc':
+        assert [idx for entry, idx in entries if entry == name] == list(
+            range(50)
+        )
+    assert len(buffer) == 0
+    assert buffer.dropped() == 0
+
+
+@pytest.mark.parametrize(
+    'policy,expected', [
+        (DROP_OLDEST, [7, 8, 9]),
+        (DROP_NEWEST, [0, 1, 2]),
+    ]
+)
+def test_drop_policies(policy, expected):
+    buffer = EmissionBuffer(capacity=3, policy=policy)
+    for idx in range(10):
+        buffer.put(idx)
+    assert buffer.drain() == expected
+    assert buffer.dropped() == 7
+
+
+def test_drain_is_bounded():
+    buffer = EmissionBuffer()
+    for idx in range(10):
+        buffer.put(idx)
+    assert buffer.drain(4) == [0, 1, 2, 3]
+    assert buffer.drain() == [4, 5, 6, 7, 8, 9]
+
+
+def test_forgets_finished_threads_but_not_their_drops():
+    buffer = EmissionBuffer(capacity=1)
+
+    def produce():
+        buffer.put(1)
+        buffer.put(2)
+
+    thread = threading.Thread(target=produce)
+    thread.start()
+    thread.join()
+    assert buffer.drain() == [2]
+    assert buffer.drain() == []
+    assert buffer._stripes == ()
+    assert buffer.dropped() == 1
+
+
+def _produce_in_threads(buffer, threads, entries):
+    for name in range(threads):
+        thread = threading.Thread(
+            target=lambda name=name: [
+                buffer.put((name, idx)) for idx in range(entries)
+            ]
+        )
+        thread.start()
+        thread.join()
+
+
+@pytest.mark.parametrize(
+    'policy,kept', [
+        (DROP_OLDEST, [8, 9]),
+        (DROP_NEWEST, [0, 1]),
+    ]
+)
+def test_capacity_is_split_across_threads(policy, kept):
+    buffer = EmissionBuffer(capacity=10, policy=policy)
+    _produce_in_threads(buffer, 5, 10)
+    assert len(buffer) == 10
+    assert buffer.dropped() == 40
+    entries = buffer.drain()
+    for name in range(5):
+        assert [idx for entry, idx in entries if entry == name] == kept
+
+    # the drained threads are forgotten, and their share with them
+    assert buffer._stripes == ()
+    for idx in range(10):
+        buffer.put(idx)
+    assert len(buffer) == 10
+
+
+def test_holds_one_entry_per_thread_beyond_capacity():
+    buffer = EmissionBuffer(capacity=2)
+    _produce_in_threads(buffer, 4, 3)
+    assert len(buffer) == 4
+    assert buffer.dropped() == 8
+
+
+@pytest.mark.asyncio
+async def test_wait_is_woken_from_another_thread():
+    buffer = EmissionBuffer()
+    waiter = asyncio.create_task(buffer.wait())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    thread = threading.Thread(target=buffer.put, args=('hit',))
+    thread.start()
+    await asyncio.wait_for(waiter, 1)
+    thread.join()
+    assert buffer.drain() == ['hit']
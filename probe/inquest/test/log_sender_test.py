@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from inquest.comms.log_buffer import DROP_NEWEST
+from inquest.comms.log_sender import Log, LogSender
+from inquest.test.stand_in_backend import (
+    SlowClient,
+    StandInBackend,
+    stop,
+    wait_for,
+)
+
+
+def test_reports_dropped_logs_once():
+    sender = LogSender(error_reporter=None, capacity=2, policy=DROP_NEWEST)
+    callback = sender.gen_callback()
+    for idx in range(5):
+        callback.log(str(idx))
+    assert sender.log_buffer.drain() == [Log('0'), Log('1')]
+    assert sender._dropped_report() == [
+        "inquest: dropped 3 logs because the probe's buffer was full"
+    ]
+    assert sender._dropped_report() == []
+
+
+@pytest.mark.asyncio
+async def test_pipelines_sends_within_the_window():
+    client = SlowClient(0.05)
+    sender = LogSender(
+        error_reporter=None,
+        batching={'max_count': 1},
+        max_in_flight=3,
+    )
+    sender._set_values(client, 'trace_set')
+    callback = sender.gen_callback()
+    for idx in range(9):
+        callback.log(str(idx))
+
+    main = asyncio.create_task(sender.main())
+    started = asyncio.get_running_loop().time()
+    while len(client.sent) < 9:
+        await asyncio.sleep(0.01)
+    elapsed = asyncio.get_running_loop().time() - started
+
+    assert sorted(sent['content'] for sent in client.sent) == [
+        [str(idx)] for idx in range(9)
+    ]
+    assert client.max_in_flight == 3
+    # three rounds of three batches rather than nine round trips
+    assert elapsed < 9 * 0.05
+    assert sender.send_window.completed_through == 8
+    assert sender.batch_stats()['acked'] == 9
+    await stop(main)
+
+
+@pytest.mark.asyncio
+async def test_stopping_while_idle_frees_the_slot():
+    client = SlowClient(0)
+    sender = LogSender(error_reporter=None, max_in_flight=2)
+    sender._set_values(client, 'trace_set')
+    # stopped while waiting for logs more often than the window is wide
+    for _ in range(3):
+        main = asyncio.create_task(sender.main())
+        await asyncio.sleep(0.01)
+        await stop(main)
+    assert sender.send_window.in_flight == 0
+
+    sender.gen_callback().log('sent')
+    main = asyncio.create_task(sender.main())
+    await wait_for(
+        lambda: [sent['content'] for sent in client.sent] == [['sent']]
+    )
+    await stop(main)
+
+
+@pytest.mark.asyncio
+async def test_spills_while_the_backend_is_down(tmp_path):
+    backend = StandInBackend()
+    sender = LogSender(
+        error_reporter=None,
+        batching={'max_count': 2},
+        spill_path=str(tmp_path / 'spill'),
+        replay_delay=0.01,
+    )
+    sender._set_values(backend.client(), 'trace_set')
+    async with sender:
+        callback = sender.gen_callback()
+        main = asyncio.create_task(sender.main())
+
+        callback.log('0')
+        await wait_for(lambda: backend.logs == ['0'])
+
+        backend.kill()
+        for idx in range(1, 6):
+            callback.log(str(idx))
+        await wait_for(lambda: len(sender.log_buffer) == 0)
+        await asyncio.sleep(0.05)
+        assert sender.spill.pending()
+
+        backend.restart()
+        callback.log('6')
+        await wait_for(lambda: len(backend.logs) == 7)
+        # the spilled logs are replayed in order, ahead of the newer ones
+        assert backend.logs == [str(idx) for idx in range(7)]
+        assert not sender.spill.pending()
+        await stop(main)
+
+
+@pytest.mark.asyncio
+async def test_replays_the_spill_after_a_restart(tmp_path):
+    path = str(tmp_path / 'spill')
+    backend = StandInBackend()
+    backend.kill()
+
+    sender = LogSender(error_reporter=None, spill_path=path)
+    sender._set_values(backend.client(), 'trace_set')
+    async with sender:
+        callback = sender.gen_callback()
+        # never sent before the sender stops
+        callback.log('buffered')
+    assert backend.logs == []
+
+    backend.restart()
+    sender = LogSender(error_reporter=None, spill_path=path)
+    sender._set_values(backend.client(), 'trace_set')
+    async with sender:
+        main = asyncio.create_task(sender.main())
+        await wait_for(lambda: backend.logs == ['buffered'])
+        await stop(main)
+
+
+@pytest.mark.asyncio
+async def test_spills_sends_cut_off_by_stopping(tmp_path):
+    path = str(tmp_path / 'spill')
+    sender = LogSender(error_reporter=None, spill_path=path)
+    client = SlowClient(None)
+    sender._set_values(client, 'trace_set')
+    async with sender:
+        main = asyncio.create_task(sender.main())
+        sender.gen_callback().log('in flight')
+        await wait_for(lambda: client.in_flight == 1)
+        await stop(main)
+        # spilled by the time the sender stopped
+        assert sender.spill.pending()
+        assert sender.send_window.in_flight == 0
+
+    backend = StandInBackend()
+    sender = LogSender(error_reporter=None, spill_path=path)
+    sender._set_values(backend.client(), 'trace_set')
+    async with sender:
+        main = asyncio.create_task(sender.main())
+        await wait_for(lambda: backend.logs == ['in flight'])
+        await stop(main)
@@ -0,0 +1,64 @@
+import pytest
+
+import inquest.logging
+from inquest.logging import Callback, add_callback, remove_callback
+
+
+class RecordingCallback(Callback):
+
+    def __init__(self):
+        self.logs = []
+        self.errors = []
+
+    def log(self, value):
+        self.logs.append(value)
+
+    def error(self, trace_id, value):
+        self.errors.append((trace_id, value))
+
+
+class FailingCallback(Callback):
+
+    def log(self, value):
+        raise RuntimeError(value)
+
+    def error(self, trace_id, value):
+        raise RuntimeError(value)
+
+
+def test_dispatches_to_every_callback():
+    # nothing to dispatch to
+    inquest.logging.log('dropped')
+    inquest.logging.error('1', ValueError())
+
+    first = RecordingCallback()
+    second = RecordingCallback()
+    failing = FailingCallback()
+    exc = ValueError()
+    with inquest.logging.with_callback(first):
+        inquest.logging.log('one')
+        with inquest.logging.with_callback(failing), \
+                inquest.logging.with_callback(second):
+            # a failing callback doesn't keep the others from being called
+            inquest.logging.log('all')
+            inquest.logging.error('1', exc)
+        inquest.logging.log('one again')
+    inquest.logging.log('dropped')
+
+    assert first.logs == ['one', 'all', 'one again']
+    assert first.errors == [('1', exc)]
+    assert second.logs == ['all']
+    assert second.errors == [('1', exc)]
+
+
+def test_callbacks_are_added_once():
+    callback = RecordingCallback()
+    add_callback(callback)
+    add_callback(callback)
+    try:
+        inquest.logging.log('once')
+    finally:
+        remove_callback(callback)
+    assert callback.logs == ['once']
+    with pytest.raises(KeyError):
+        remove_callback(callback)
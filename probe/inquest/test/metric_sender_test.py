@@ -0,0 +1,21 @@
+from inquest.comms.metric_sender import MetricSender
+from inquest.metrics import LatencyAggregator, MetricAggregator
+
+
+def test_reports_one_line_per_metric():
+    aggregator = MetricAggregator()
+    for value in [1, 2, 3]:
+        aggregator.observe(value)
+    assert MetricSender._report({'1': aggregator}) == [
+        'inquest: metric 1 count=3 sum=6 min=1 max=3 mean=2 '
+        + 'p50=2.125 p95=3 p99=3'
+    ]
+
+
+def test_reports_latencies_in_milliseconds():
+    aggregator = LatencyAggregator()
+    aggregator.observe(2_000_000)
+    assert MetricSender._report({'1': aggregator}) == [
+        'inquest: latency 1 count=1 sum_ms=2 min_ms=2 max_ms=2 mean_ms=2 '
+        + 'p50_ms=2 p95_ms=2 p99_ms=2'
+    ]
@@ -0,0 +1,64 @@
+import math
+import random
+
+from inquest.metrics import (
+    SUB_BUCKETS, LatencyAggregator, LogHistogram, MetricAggregator
+)
+
+
+def test_histogram_buckets_are_relatively_accurate():
+    rng = random.Random(0)
+    for _ in range(1000):
+        value = rng.choice([1, -1]) * 10**rng.uniform(-6, 6)
+        histogram = LogHistogram()
+        histogram.observe(value)
+        estimate = histogram.percentile(0.5)
+        assert abs(estimate - value) <= abs(value) / (2 * SUB_BUCKETS)
+
+
+def test_histogram_percentiles():
+    histogram = LogHistogram()
+    for value in range(1, 101):
+        histogram.observe(value)
+    histogram.observe(0)
+    histogram.observe(-5)
+    assert histogram.percentile(0) < 0
+    assert abs(histogram.percentile(0.5) - 49) <= 49 / SUB_BUCKETS
+    assert abs(histogram.percentile(0.99) - 99) <= 99 / SUB_BUCKETS
+    assert LogHistogram().percentile(0.5) is None
+
+
+def test_aggregator_merges():
+    values = [3, 1, 4, 1, 5, 9, 2, 6]
+    whole = MetricAggregator()
+    halves = [MetricAggregator(), MetricAggregator()]
+    for idx, value in enumerate(values):
+        whole.observe(value)
+        halves[idx % 2].observe(value)
+
+    merged = MetricAggregator()
+    for half in halves:
+        merged.merge(half)
+    assert merged.summary() == whole.summary()
+
+    summary = whole.summary()
+    assert summary['count'] == 8
+    assert summary['sum'] == 31
+    assert (summary['min'], summary['max']) == (1, 9)
+    assert summary['p99'] == 9
+    assert MetricAggregator().summary() == {'count': 0}
+
+
+def test_aggregator_only_counts_non_finite_values():
+    aggregator = MetricAggregator()
+    for value in [1, math.nan, 3, math.inf, -math.inf, math.nan]:
+        aggregator.observe(value)
+    summary = aggregator.summary()
+    assert summary['count'] == 2
+    assert summary['non_finite'] == 4
+    assert all(math.isfinite(value) for value in summary.values())
+    assert summary['mean'] == 2
+
+    only_nan = LatencyAggregator()
+    only_nan.observe(math.nan)
+    assert only_nan.summary() == {'count': 0, 'non_finite': 1}
@@ -1,12 +1,13 @@
 import os
 from typing import Dict
 
-import pandas as pd
-
+import inquest.injection.codegen as codegen
+import inquest.logging
 from inquest.logging import Callback, PrintCallback, with_callback
-from inquest.probe import TRACE_COLUMNS, TRACE_WITH_ERROR_COLUMNS, Probe
+from inquest.probe import Probe
 from inquest.test.probe_test_module.test_imported_module import sample
 from inquest.test.sample import TestClass
+from inquest.utils.exceptions import MultiTraceException, ProbeException
 
 
 def flatten_trace(trace):
@@ -117,12 +118,10 @@ def test_on_function_changes(capsys):
             assert result is None
             assert capsys.readouterr().out == ""
             assert sample(2, 1) == 3
-            traces = probe.traces[TRACE_COLUMNS].set_index('id')
-            assert all(
-                traces == pd
-                .DataFrame([flatten_trace(trace)
-                            for trace in desired_state]).set_index('id')
-            ), "traces is not set as the input desired_set"
+            traces = {trace.id: trace.statement for trace in probe.traces}
+            assert traces == {
+                trace['id']: trace['statement'] for trace in desired_state
+            }, "traces is not set as the input desired_set"
             assert capsys.readouterr().out == f"{output}\n"
 
         # testing duplicate
@@ -195,9 +194,7 @@ def test_on_function_changes(capsys):
             "1",
         )
 
-    assert all(
-        probe.traces == pd.DataFrame([], columns=TRACE_WITH_ERROR_COLUMNS)
-    )
+    assert len(probe.traces) == 0
     assert sample(2, 1) == 3
     captured = capsys.readouterr()
     assert capsys.readouterr().out == ""
@@ -212,12 +209,10 @@ def test_on_class_methods(capsys):
             assert result is None
             assert capsys.readouterr().out == ""
             obj.sample(2)
-            traces = probe.traces[TRACE_COLUMNS].set_index('id')
-            assert all(
-                traces == pd
-                .DataFrame([flatten_trace(trace)
-                            for trace in desired_state]).set_index('id')
-            ), "traces is not set as the input desired_set"
+            traces = {trace.id: trace.statement for trace in probe.traces}
+            assert traces == {
+                trace['id']: trace['statement'] for trace in desired_state
+            }, "traces is not set as the input desired_set"
             assert capsys.readouterr().out == f"{output}\n"
 
         assert_desired_state(
@@ -260,3 +255,348 @@ def test_on_runtime_failure(capsys):
         assert result is None
         assert sample(2, 1) == 3
         assert capsys.readouterr().out == ""
+
+
+def test_only_changed_functions_are_regenerated(capsys):
+    with Probe(__name__) as probe, with_callback(PrintCallback()):
+        function_trace = create_trace(
+            'inquest/test/probe_test_module/test_imported_module.py',
+            'sample',
+            '{arg1}',
+            "1",
+            1,
+        )
+        method_trace = create_trace(
+            'inquest/test/sample.py',
+            'sample',
+            '{x}',
+            "2",
+            24,
+            'TestClass',
+        )
+        probe.new_desired_state([function_trace, method_trace])
+        sample_code = sample.__code__
+        method_code = TestClass.sample.__code__
+
+        # only the method's trace changes
+        method_trace = {**method_trace, 'statement': 'x={x}'}
+        probe.new_desired_state([function_trace, method_trace])
+        assert sample.__code__ is sample_code
+        assert TestClass.sample.__code__ is not method_code
+
+        TestClass().sample(2)
+        assert sample(2, 1) == 3
+        assert capsys.readouterr().out == "x=2\n2\n"
+
+        # removing the method's only trace reverts it and leaves sample alone
+        probe.new_desired_state([function_trace])
+        assert sample.__code__ is sample_code
+        assert set(probe.fingerprints) == {
+            ('inquest.test.probe_test_module.test_imported_module', 'sample')
+        }
+        TestClass().sample(2)
+        assert capsys.readouterr().out == ""
+
+    assert sample.__code__ is not sample_code
+
+
+def test_failed_swap_leaves_no_function_changed():
+    with Probe(__name__) as probe:
+        function_trace = create_trace(
+            'inquest/test/probe_test_module/test_imported_module.py',
+            'sample',
+            '{arg1}',
+            "1",
+            1,
+        )
+        method_trace = {
+            **create_trace(
+                'inquest/test/sample.py',
+                'sample',
+                '{x}',
+                "2",
+                24,
+                'TestClass',
+            ),
+            'kind': 'metric',
+            'rateLimit': 10,
+        }
+        sample_code = sample.__code__
+        method_code = TestClass.sample.__code__
+
+        assign_function = probe._code_reassigner.assign_function
+
+        def failing_assign_function(func, code):
+            if func is TestClass.sample:
+                raise ValueError('assignment failed')
+            assign_function(func, code)
+
+        probe._code_reassigner.assign_function = failing_assign_function
+        try:
+            probe.new_desired_state([function_trace, method_trace])
+            assert False, 'the swap should have failed'
+        except ValueError:
+            pass
+
+        assert sample.__code__ is sample_code
+        assert TestClass.sample.__code__ is method_code
+        assert list(probe.traces.ids()) == []
+        assert probe.fingerprints == {}
+        # nor are the traces' limiters and metrics
+        assert inquest.logging.get_limiter("2") is None
+        assert "2" not in inquest.logging._METRICS
+
+        # the probe can still apply the desired set once assigning works
+        probe._code_reassigner.assign_function = assign_function
+        probe.new_desired_state([function_trace, method_trace])
+        assert sample.__code__ is not sample_code
+        assert TestClass.sample.__code__ is not method_code
+        assert inquest.logging.get_limiter("2") is not None
+        assert "2" in inquest.logging._METRICS
+
+
+def test_toggling_traces_reuses_generated_code(capsys):
+    with Probe(__name__) as probe, with_callback(PrintCallback()):
+        trace = create_trace(
+            'inquest/test/probe_test_module/test_imported_module.py',
+            'sample',
+            '{arg1}',
+            "1",
+            1,
+        )
+        probe.new_desired_state([trace])
+        generated_code = sample.__code__
+
+        probe.new_desired_state([])
+        assert sample.__code__ is not generated_code
+
+        probe.new_desired_state([trace])
+        assert sample.__code__ is generated_code
+        assert probe.code_cache.info().hits == 1
+        assert probe.code_cache.info().misses == 1
+
+        assert sample(2, 1) == 3
+        assert capsys.readouterr().out == "2\n"
+
+
+def test_removing_the_last_trace_restores_the_module():
+    module_globals = sample.__globals__
+    trace = create_trace(
+        'inquest/test/probe_test_module/test_imported_module.py',
+        'sample',
+        '{arg1}',
+        "1",
+        1,
+    )
+    with Probe(__name__) as probe:
+        probe.new_desired_state([trace])
+        assert module_globals[codegen.LOGGING_NAME] is inquest.logging
+
+        probe.new_desired_state([])
+        assert codegen.LOGGING_NAME not in module_globals
+
+        # the cached code gets the global back
+        probe.new_desired_state([trace])
+        assert probe.code_cache.info().hits == 1
+        assert module_globals[codegen.LOGGING_NAME] is inquest.logging
+    assert codegen.LOGGING_NAME not in module_globals
+
+
+def test_rate_limited_trace(capsys):
+    with Probe(__name__) as probe, with_callback(PrintCallback()):
+        trace = {
+            **create_trace(
+                'inquest/test/probe_test_module/test_imported_module.py',
+                'sample',
+                '{arg1}',
+                "1",
+                1,
+            ),
+            # a bucket of one token that takes ~17 minutes to refill
+            'rateLimit': 0.001,
+        }
+        probe.new_desired_state([trace])
+        for _ in range(5):
+            assert sample(2, 1) == 3
+        assert capsys.readouterr().out == "2\n"
+        assert probe.trace_stats() == {"1": (0, 4)}
+
+        # unchanged limits keep their limiter
+        probe.new_desired_state([trace])
+        assert sample(2, 1) == 3
+        assert capsys.readouterr().out == ""
+        assert probe.trace_stats() == {"1": (0, 5)}
+
+        # dropping the limits removes the limiter
+        trace = {**trace, 'rateLimit': None}
+        probe.new_desired_state([trace])
+        assert sample(2, 1) == 3
+        assert capsys.readouterr().out == "2\n"
+        assert probe.trace_stats() == {}
+
+
+def test_sampled_trace():
+    calls = []
+
+    class CountingCallback(Callback):
+
+        def log(self, value):
+            calls.append(value)
+
+        def error(self, trace_id, value):
+            calls.append(value)
+
+    with Probe(__name__) as probe, with_callback(CountingCallback()):
+        trace = {
+            **create_trace(
+                'inquest/test/probe_test_module/test_imported_module.py',
+                'sample',
+                # evaluating this would call error
+                '{undefined_name}',
+                "1",
+                1,
+            ),
+            'sampleRate': 1e-12,
+        }
+        probe.new_desired_state([trace])
+        for _ in range(10):
+            assert sample(2, 1) == 3
+        assert calls == []
+        assert probe.trace_stats()["1"].sampled_out == 10
+
+
+def test_invalid_limits():
+    with Probe(__name__) as probe:
+        trace = create_trace(
+            'inquest/test/probe_test_module/test_imported_module.py',
+            'sample',
+            '{arg1}',
+            "1",
+            1,
+        )
+        for limits in ({'sampleRate': 2}, {'sampleRate': 'half'},
+                       {'rateLimit': [1]}):
+            try:
+                probe.new_desired_state([{**trace, **limits}])
+                assert False, "expected a ProbeException"
+            except ProbeException as exc:
+                assert exc.trace_id == "1"
+
+
+def test_conditional_trace(capsys):
+    with Probe(__name__) as probe, with_callback(PrintCallback()):
+        trace = {
+            **create_trace(
+                'inquest/test/probe_test_module/test_imported_module.py',
+                'sample',
+                '{arg1}',
+                "1",
+                1,
+            ),
+            'condition': 'arg1 > arg2',
+        }
+        probe.new_desired_state([trace])
+        assert sample(2, 1) == 3
+        assert sample(1, 2) == 3
+        assert capsys.readouterr().out == "2\n"
+
+        # conditions combine with limits
+        probe.new_desired_state([{**trace, 'rateLimit': 0.001}])
+        for _ in range(3):
+            assert sample(1, 2) == 3
+        assert sample(2, 1) == 3
+        assert sample(2, 1) == 3
+        assert capsys.readouterr().out == "2\n"
+        # only the matching hit past the first was suppressed
+        assert probe.trace_stats() == {"1": (0, 1)}
+
+
+def test_metric_trace(capsys):
+    with Probe(__name__) as probe, with_callback(PrintCallback()):
+        trace = {
+            **create_trace(
+                'inquest/test/probe_test_module/test_imported_module.py',
+                'sample',
+                'arg1 * 10',
+                "1",
+                1,
+            ),
+            'kind': 'metric',
+        }
+        probe.new_desired_state([trace])
+        for arg1 in range(1, 5):
+            assert sample(arg1, 1) == arg1 + 1
+        # metric traces don't log their hits
+        assert capsys.readouterr().out == ""
+
+        metrics = inquest.logging.flush_metrics()
+        assert list(metrics) == ["1"]
+        summary = metrics["1"].summary()
+        assert (summary['count'], summary['sum']) == (4, 100)
+        assert (summary['min'], summary['max']) == (10, 40)
+        assert inquest.logging.flush_metrics() == {}
+
+        # a new expression starts a new aggregate
+        assert sample(1, 1) == 2
+        probe.new_desired_state([{**trace, 'statement': 'arg2'}])
+        assert sample(2, 3) == 5
+        summary = inquest.logging.flush_metrics()["1"].summary()
+        assert (summary['count'], summary['sum']) == (1, 3)
+
+        # nan and inf hits are counted apart from the aggregate
+        for arg2 in [float('nan'), float('inf'), 4]:
+            sample(1, arg2)
+        assert capsys.readouterr().out == ""
+        summary = inquest.logging.flush_metrics()["1"].summary()
+        assert (summary['count'], summary['non_finite']) == (1, 2)
+        assert summary['mean'] == 4
+
+        # turning it back into a log trace drops the metric
+        probe.new_desired_state([{**trace, 'kind': 'log'}])
+        assert sample(2, 1) == 3
+        assert capsys.readouterr().out == "arg1 * 10\n"
+        assert inquest.logging.flush_metrics() == {}
+
+
+def test_latency_trace():
+    trace = create_trace(
+        'inquest/test/probe_test_module/test_imported_module.py',
+        'sample',
+        '',
+        "1",
+        1,
+    )
+    with Probe(__name__) as probe:
+        probe.new_desired_state([{**trace, 'kind': 'latency'}])
+        for _ in range(3):
+            assert sample(2, 1) == 3
+        # the time is recorded when the function raises too
+        try:
+            sample(2, None)
+            assert False, "expected a TypeError"
+        except TypeError:
+            pass
+
+        metrics = inquest.logging.flush_metrics()
+        assert metrics["1"].kind == 'latency'
+        summary = metrics["1"].summary()
+        assert summary['count'] == 4
+        assert 0 < summary['p50_ms'] < 1000
+
+        # a range needs lines of the function
+        try:
+            probe.new_desired_state(
+                [{**trace, 'kind': 'latency', 'line': 5, 'endLine': 6}]
+            )
+            assert False, "expected a MultiTraceException"
+        except MultiTraceException as exc:
+            [error] = exc.errors.values()
+            assert error.trace_id == "1"
+
+        probe.new_desired_state(
+            [{**trace, 'kind': 'latency', 'line': 2, 'endLine': 2}]
+        )
+        assert sample(2, 1) == 3
+        assert inquest.logging.flush_metrics()["1"].count == 1
+
+    assert inquest.logging.flush_metrics() == {}
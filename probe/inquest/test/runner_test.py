@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+
+def test_import_is_lazy():
+    output = subprocess.run(
+        [
+            sys.executable,
+            '-c',
+            '''\
+import sys
+import inquest
+print(",".join(sorted(
+    name for name in ("aiohttp", "gql", "janus", "websockets", "pandas")
+    if name in sys.modules
+)))
+''',
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout.decode('utf8').strip()
+    assert output == ''
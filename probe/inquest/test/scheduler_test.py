@@ -0,0 +1,94 @@
+import asyncio
+import sys
+
+import pytest
+
+from inquest.comms.scheduler import (
+    BULK, CONTROL, OutboundScheduler, ScheduledClient
+)
+from inquest.test.stand_in_backend import SlowClient, stop
+
+
+@pytest.mark.asyncio
+async def test_control_is_not_stuck_behind_bulk():
+    client = SlowClient(0.02)
+    scheduler = OutboundScheduler(client, max_in_flight=4, reserved=1)
+    bulk = ScheduledClient(scheduler, BULK)
+    control = ScheduledClient(scheduler, CONTROL)
+
+    flood = [
+        asyncio.create_task(bulk.execute(None, {'priority': BULK}))
+        for _ in range(30)
+    ]
+    await asyncio.sleep(0.005)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await control.execute(None, {'priority': CONTROL}) == {
+        'priority': CONTROL
+    }
+    # it only waited on its own request, not on the 30 queued ones
+    assert loop.time() - started < 5 * 0.02
+
+    await asyncio.gather(*flood)
+    assert client.max_in_flight_by_priority[BULK] == 3
+    assert scheduler.wait_times[CONTROL].max < 0.02
+
+
+@pytest.mark.asyncio
+async def test_bulk_is_not_starved():
+    client = SlowClient(0.01)
+    scheduler = OutboundScheduler(
+        client, max_in_flight=2, reserved=1, control_weight=2
+    )
+    requests = [
+        scheduler.execute(None, {'priority': priority}, priority=priority)
+        for priority in [CONTROL] * 12 + [BULK]
+    ]
+    await asyncio.gather(*requests)
+    # the bulk request got a turn long before the control requests ran out
+    assert client.order.index(BULK) < 6
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_give_up_their_turn():
+    client = SlowClient(0.01)
+    scheduler = OutboundScheduler(client, max_in_flight=2, reserved=1)
+    running = asyncio.create_task(
+        scheduler.execute(None, {'priority': BULK}, priority=BULK)
+    )
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(
+        scheduler.execute(None, {'priority': BULK}, priority=BULK)
+    )
+    await asyncio.sleep(0)
+    await stop(waiting)
+    await running
+    assert await scheduler.execute(
+        None, {'priority': BULK}, priority=BULK
+    ) == {'priority': BULK}
+    assert client.order == [BULK, BULK]
+
+
+class AnsweringClient:
+
+    async def execute(self, document, variable_values=None):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            # like asyncio.wait_for when the request finishes as it's
+            # cancelled
+            return 'answered'
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 11), reason='tasks count cancellations from 3.11'
+)
+@pytest.mark.asyncio
+async def test_requests_answered_as_they_are_cancelled_are_cancelled():
+    scheduler = OutboundScheduler(AnsweringClient(), max_in_flight=2)
+    request = asyncio.create_task(scheduler.execute(None))
+    await asyncio.sleep(0)
+    await stop(request)
+    assert request.cancelled()
+    assert scheduler._in_flight[CONTROL] == 0
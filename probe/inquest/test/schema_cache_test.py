@@ -0,0 +1,28 @@
+import os
+
+from inquest.comms.schema_cache import SchemaCache
+
+
+def test_stores_by_version_and_schema_hash(tmp_path):
+    cache = SchemaCache(str(tmp_path / 'cache'))
+    assert cache.load('1.2.3', 'abc') is None
+    cache.store('1.2.3', 'abc', {'__schema': {'types': []}})
+    assert cache.load('1.2.3', 'abc') == {'__schema': {'types': []}}
+    assert cache.load('1.2.4', 'abc') is None
+    # another build of the same version
+    assert cache.load('1.2.3', 'def') is None
+    # no temporary files are left behind
+    assert os.listdir(tmp_path / 'cache') == ['schema-1.2.3-abc.json']
+
+
+def test_key_cant_escape_the_directory(tmp_path):
+    cache = SchemaCache(str(tmp_path))
+    assert os.path.dirname(cache.path('../../1.2.3', '../abc')) == \
+        str(tmp_path)
+
+
+def test_unreadable_schema_is_a_miss(tmp_path):
+    cache = SchemaCache(str(tmp_path))
+    with open(cache.path('1.2.3', 'abc'), 'w') as output:
+        output.write('{"__sch')
+    assert cache.load('1.2.3', 'abc') is None
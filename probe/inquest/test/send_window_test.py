@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from inquest.comms.send_window import SendWindow
+
+
+@pytest.mark.asyncio
+async def test_tracks_completions_in_order():
+    window = SendWindow(2)
+    first = await window.acquire()
+    second = await window.acquire()
+    third = asyncio.create_task(window.acquire())
+    await asyncio.sleep(0)
+    # the window is full
+    assert not third.done()
+
+    window.release(second, acked=True)
+    assert await third == 2
+    # the first request is still in flight
+    assert window.completed_through == -1
+
+    window.release(first, acked=False)
+    assert window.completed_through == 1
+    window.release(2, acked=True)
+    assert window.completed_through == 2
+    assert (window.acked, window.failed, window.in_flight) == (2, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_cancel_frees_the_slot_uncounted():
+    window = SendWindow(1)
+    seq = await window.acquire()
+    window.cancel(seq)
+    assert await window.acquire() == 1
+    assert (window.acked, window.failed, window.in_flight) == (0, 0, 1)
@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import textwrap
+
+from inquest.injection.source_index import SourceIndex
+from inquest.test.sample import TestClass, sample, sample_with_decorator
+
+
+def _load_module(path):
+    spec = importlib.util.spec_from_file_location('source_index_sample', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_file_is_parsed_once():
+    index = SourceIndex()
+    assert index.get_function_ast(sample).name == 'sample'
+    assert index.get_function_ast(TestClass.sample).name == 'sample'
+    assert index.get_function_ast(sample_with_decorator.__wrapped__).name == (
+        'sample_with_decorator'
+    )
+    assert index.parses == 1
+
+
+def test_method_keeps_file_line_numbers():
+    index = SourceIndex()
+    node = index.get_function_ast(TestClass.sample)
+    assert node.lineno == TestClass.sample.__code__.co_firstlineno
+    filename = TestClass.sample.__code__.co_filename
+    definitions = {
+        definition.start: definition
+        for definition in index.definitions(filename)
+    }
+    definition = definitions[node.lineno]
+    assert (definition.start, definition.end) == (node.lineno, node.lineno + 1)
+
+
+def test_file_change_invalidates(tmp_path):
+    path = tmp_path / 'source_index_sample.py'
+    path.write_text('def first():\n    pass\n')
+    module = _load_module(str(path))
+
+    index = SourceIndex()
+    assert index.get_function_ast(module.first).name == 'first'
+    assert index.get_function_ast(module.first).name == 'first'
+    assert index.parses == 1
+
+    path.write_text(
+        textwrap.dedent(
+            '''\
+            import os
+
+
+            def second():
+                return os.getcwd()
+            '''
+        )
+    )
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    module = _load_module(str(path))
+    assert index.get_function_ast(module.second).name == 'second'
+    assert index.parses == 2
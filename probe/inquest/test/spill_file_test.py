@@ -0,0 +1,74 @@
+from inquest.comms.spill_file import SpillFile
+
+
+def test_reads_resume_from_the_committed_offset(tmp_path):
+    path = str(tmp_path / 'spill')
+    spill = SpillFile(path, max_size=4096)
+    assert spill.append(['one', 'two', 'thrée']) == 3
+    lines, offset = spill.read(2)
+    assert lines == ['one', 'two']
+    spill.commit(offset)
+    spill.append(['four'])
+    spill.close()
+
+    spill = SpillFile(path, max_size=4096)
+    assert spill.pending()
+    lines, offset = spill.read(10)
+    assert lines == ['thrée', 'four']
+    spill.commit(offset)
+    assert not spill.pending()
+    spill.close()
+
+    # nothing that was read and committed comes back
+    spill = SpillFile(path, max_size=4096)
+    assert spill.read(10)[0] == []
+    spill.close()
+
+
+def test_drops_lines_past_the_size_cap(tmp_path):
+    spill = SpillFile(str(tmp_path / 'spill'), max_size=64)
+    assert spill.append(['x' * 10] * 5) == 2
+    assert spill.dropped == 3
+
+    # the file starts over once everything in it was read
+    lines, offset = spill.read(10)
+    spill.commit(offset)
+    assert spill.append(['x' * 10] * 2) == 2
+    assert spill.dropped == 3
+    spill.close()
+
+
+def test_resets_invalid_files(tmp_path):
+    path = tmp_path / 'spill'
+    path.write_bytes(b'garbage' * 10)
+    spill = SpillFile(str(path), max_size=128)
+    assert not spill.pending()
+    assert spill.append(['line']) == 1
+    assert spill.read(10)[0] == ['line']
+    spill.close()
+
+
+def test_reclaims_read_space(tmp_path):
+    spill = SpillFile(str(tmp_path / 'spill'), max_size=80)
+    assert spill.append(['x' * 10] * 4) == 4
+    spill.commit(spill.read(2)[1])
+    lines, offset = spill.read(1)
+    # the file is full until the unread records are moved to the start
+    assert spill.append(['y' * 10] * 2) == 2
+    assert spill.dropped == 0
+    # the offset read handed out still points past the same records
+    spill.commit(offset)
+    assert spill.read(10)[0] == ['x' * 10, 'y' * 10, 'y' * 10]
+    spill.close()
+
+
+def test_skips_corrupt_records(tmp_path):
+    spill = SpillFile(str(tmp_path / 'spill'), max_size=128)
+    spill.append(['one', 'two'])
+    # the second record's length runs past the end of the records
+    spill._map[31:35] = b'\xff\xff\xff\x00'
+    lines, offset = spill.read(10)
+    assert lines == ['one']
+    spill.commit(offset)
+    assert not spill.pending()
+    spill.close()
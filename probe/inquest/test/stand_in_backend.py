@@ -0,0 +1,473 @@
+import asyncio
+import hashlib
+from inspect import isawaitable
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from gql.transport.async_transport import AsyncTransport
+from gql.transport.exceptions import TransportClosed
+from graphql import (
+    build_schema,
+    execute,
+    extend_schema,
+    get_operation_ast,
+    parse,
+    print_schema,
+    subscribe,
+)
+
+from inquest.comms.client_provider import ClientProvider
+from inquest.comms.version_checker import BackendVersion
+
+# the part of the backend's schema the probe uses
+SCHEMA = build_schema(
+    '''
+type FileInfo {
+  name: String!
+}
+
+type ClassInfo {
+  name: String!
+}
+
+type FunctionInfo {
+  name: String!
+  file: FileInfo!
+  parentClass: ClassInfo
+}
+
+type Trace {
+  id: String!
+  function: FunctionInfo
+  statement: String!
+  line: Float!
+}
+
+type TraceSet {
+  id: String!
+  desiredSet: [Trace!]!
+}
+
+type Probe {
+  id: String!
+  isAlive: Boolean!
+  traceSet: TraceSet!
+}
+
+type ProbeFailure {
+  message: String!
+}
+
+type ProbeNotification {
+  message: String!
+  traceSet: TraceSet!
+}
+
+input NewProbeFailureInput {
+  traceId: String
+  message: String!
+}
+
+type Query {
+  thisProbe: Probe
+}
+
+type Mutation {
+  publishLog(content: [String!]!): [String!]!
+  newProbeFailure(newProbeFailure: NewProbeFailureInput!): ProbeFailure!
+  heartbeat: Probe!
+  newProbe(traceSetId: String!): Probe!
+}
+
+type Subscription {
+  probeNotification(traceSetId: String!): ProbeNotification!
+}
+'''
+)
+
+# the schema of a backend that also sends deltas of the desired set
+DELTA_SCHEMA = extend_schema(
+    SCHEMA,
+    parse(
+        '''
+extend type TraceSet {
+  desiredSetSequence: Int!
+}
+
+type TraceSetDelta {
+  sequence: Int!
+  removed: [String!]!
+  added: [Trace!]!
+  changed: [Trace!]!
+}
+
+extend type Subscription {
+  probeDeltaNotification(traceSetId: String!): TraceSetDelta!
+}
+'''
+    ),
+)
+
+
+class StandInBackend:
+    """
+    answers the probe's queries from memory through in process transports.
+    it can be killed, dropping every connection and refusing new ones, and
+    restarted to test how the probe recovers, or made to drop connections
+    as soon as it accepts them. with deltas it also sends the
+    changes to the desired set
+    """
+
+    def __init__(
+        self,
+        trace_set_id: str = 'trace_set',
+        version: str = '0.0.0',
+        deltas: bool = False,
+    ):
+        self.trace_set_id = trace_set_id
+        self.version = version
+        self.schema = DELTA_SCHEMA if deltas else SCHEMA
+        # like the backend, the hash of the schema's definition
+        self.schema_hash: Optional[str] = hashlib.sha256(
+            print_schema(self.schema).encode('utf8')
+        ).hexdigest()
+        self.desired_set: List[Dict] = []
+        self.sequence = 0
+        self.logs: List[str] = []
+        self.failures: List[Dict] = []
+        self.probes = 0
+        self.heartbeats = 0
+        self.up = True
+        # whether connections are dropped right after they're accepted
+        self.drops_connections = False
+        # seconds a subscription takes to be established
+        self.subscribe_delay = 0.0
+        # the authorization header of every connection made
+        self.connections: List[Optional[str]] = []
+        # the connection's index and the name of every operation run
+        self.operations: List[Tuple[int, str]] = []
+        self._transports: Set['StandInTransport'] = set()
+        self._subscribers: List[asyncio.Queue] = []
+        self._delta_subscribers: List[asyncio.Queue] = []
+        self.root = {
+            'thisProbe': lambda info: self._probe(),
+            'publishLog': self._publish_log,
+            'newProbeFailure': self._new_probe_failure,
+            'heartbeat': self._heartbeat,
+            'newProbe': self._new_probe,
+            'probeNotification': self._probe_notification,
+            'probeDeltaNotification': self._probe_delta_notification,
+        }
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers) + len(self._delta_subscribers)
+
+    def transport(self, headers: Optional[Dict[str, str]] = None):
+        return StandInTransport(self, headers or {})
+
+    def client(self) -> 'StandInClient':
+        return StandInClient(self)
+
+    def kill(self):
+        self.up = False
+        for transport in list(self._transports):
+            transport.drop()
+
+    def restart(self):
+        self.up = True
+
+    def notify(self, desired_set: List[Dict], deliver: bool = True):
+        '''
+        changes the desired set and tells the subscribed probes
+        @param deliver: whether the probes following deltas receive the
+                        change's delta, without it they miss the delta
+        '''
+        previous = {trace['id']: trace for trace in self.desired_set}
+        current = {trace['id']: trace for trace in desired_set}
+        self.desired_set = desired_set
+        self.sequence += 1
+        delta = {
+            'sequence': self.sequence,
+            'removed': [
+                trace_id for trace_id in previous if trace_id not in current
+            ],
+            'added': [
+                trace for trace_id, trace in current.items()
+                if trace_id not in previous
+            ],
+            'changed': [
+                trace for trace_id, trace in current.items()
+                if trace_id in previous and previous[trace_id] != trace
+            ],
+        }
+        for queue in self._subscribers:
+            queue.put_nowait(desired_set)
+        if deliver:
+            for queue in self._delta_subscribers:
+                queue.put_nowait(delta)
+
+    def _trace_set(self, desired_set=None):
+        return {
+            'id': self.trace_set_id,
+            'desiredSetSequence': self.sequence,
+            'desiredSet':
+                self.desired_set if desired_set is None else desired_set,
+        }
+
+    def _probe(self):
+        return {
+            'id': str(self.probes),
+            'isAlive': True,
+            'traceSet': self._trace_set(),
+        }
+
+    def _publish_log(self, info, content):
+        self.logs.extend(content)
+        return content
+
+    def _new_probe_failure(self, info, newProbeFailure):
+        self.failures.append(newProbeFailure)
+        return newProbeFailure
+
+    def _heartbeat(self, info):
+        self.heartbeats += 1
+        return self._probe()
+
+    def _new_probe(self, info, traceSetId):
+        self.probes += 1
+        return self._probe()
+
+    async def _stream(
+        self, subscribers: List[asyncio.Queue], to_result, first=None
+    ):
+        '''
+        streams what's put in the subscription's queue, after first if it's
+        given, once the subscription is established
+        '''
+        await asyncio.sleep(self.subscribe_delay)
+        queue = asyncio.Queue()
+        subscribers.append(queue)
+        try:
+            if first is not None:
+                yield to_result(first)
+            while True:
+                yield to_result(await queue.get())
+        finally:
+            subscribers.remove(queue)
+
+    def _probe_notification(self, info, traceSetId):
+        return self._stream(
+            self._subscribers,
+            lambda desired_set: {
+                'probeNotification':
+                    {
+                        'message': 'update',
+                        'traceSet': self._trace_set(desired_set),
+                    }
+            },
+        )
+
+    def _probe_delta_notification(self, info, traceSetId):
+        # like the backend, an empty delta acknowledges the subscription
+        acknowledgement = {
+            'sequence': self.sequence,
+            'removed': [],
+            'added': [],
+            'changed': [],
+        }
+        return self._stream(
+            self._delta_subscribers,
+            lambda delta: {'probeDeltaNotification': delta},
+            acknowledgement,
+        )
+
+
+class StandInClient:
+    """
+    runs queries and mutations against the stand in backend without a
+    connection, for consumers tested on their own. while the backend is
+    down its requests fail
+    """
+
+    def __init__(self, backend: StandInBackend):
+        self.backend = backend
+
+    async def execute(self, document, variable_values=None):
+        # a round trip takes a turn of the event loop or two
+        await asyncio.sleep(0.001)
+        if not self.backend.up:
+            raise ConnectionError('the backend is down')
+        result = execute(
+            self.backend.schema,
+            document,
+            self.backend.root,
+            variable_values=variable_values,
+        )
+        if isawaitable(result):
+            result = await result
+        if result.errors:
+            raise result.errors[0]
+        return result.data
+
+
+class SlowClient:
+    """
+    answers each request with its variable values after delay seconds, or
+    never if delay is None. it records the variable values of the requests
+    as they're answered, the order of their priorities when they carry one,
+    and how many requests were in flight at once, in total and by priority.
+    like a real connection a cancelled request takes a few turns of the
+    event loop to be given up on
+    """
+
+    def __init__(self, delay: Optional[float]):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.max_in_flight_by_priority: Dict[str, int] = {}
+        self._in_flight_by_priority: Dict[str, int] = {}
+        self.order: List[str] = []
+        self.sent: List[Dict] = []
+
+    async def execute(self, document, variable_values=None):
+        priority = (variable_values or {}).get('priority')
+        self.order.append(priority)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        in_flight = self._in_flight_by_priority.get(priority, 0) + 1
+        self._in_flight_by_priority[priority] = in_flight
+        self.max_in_flight_by_priority[priority] = max(
+            self.max_in_flight_by_priority.get(priority, 0), in_flight
+        )
+        request = asyncio.ensure_future(
+            asyncio.sleep(60 if self.delay is None else self.delay)
+        )
+        try:
+            await asyncio.shield(request)
+        finally:
+            request.cancel()
+            await asyncio.gather(request, return_exceptions=True)
+            self.in_flight -= 1
+            self._in_flight_by_priority[priority] -= 1
+        self.sent.append(variable_values)
+        return variable_values
+
+
+async def wait_for(condition: Callable[[], bool], timeout: float = 5.0):
+    '''
+    waits until the condition holds, failing the test after timeout seconds
+    '''
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+
+async def stop(task: asyncio.Future):
+    '''
+    cancels the task and waits for it to finish, so it doesn't outlive the
+    test that started it
+    '''
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+class StandInTransport(AsyncTransport):
+    """
+    a connection to the stand in backend. like the websockets transport it
+    has a receive_data_task that finishes once the connection is dropped
+    """
+
+    def __init__(self, backend: StandInBackend, headers: Dict[str, str]):
+        self.backend = backend
+        self.headers = headers
+        self.receive_data_task: Optional[asyncio.Future] = None
+        self.index: Optional[int] = None
+
+    async def connect(self):
+        if not self.backend.up:
+            raise ConnectionRefusedError('the backend is down')
+        self.index = len(self.backend.connections)
+        self.backend.connections.append(self.headers.get('Authorization'))
+        self.receive_data_task = asyncio.get_running_loop().create_future()
+        self.backend._transports.add(self)
+        if self.backend.drops_connections:
+            asyncio.get_running_loop().call_soon(self.drop)
+
+    def drop(self):
+        self.backend._transports.discard(self)
+        if self.receive_data_task is not None and \
+                not self.receive_data_task.done():
+            self.receive_data_task.set_result(None)
+
+    async def close(self):
+        self.drop()
+
+    def _check_open(self, document, operation_name):
+        if self.receive_data_task is None or self.receive_data_task.done():
+            raise TransportClosed('the connection is closed')
+        operation = get_operation_ast(document, operation_name)
+        self.backend.operations.append((self.index, operation.name.value))
+
+    async def execute(
+        self, document, variable_values=None, operation_name=None
+    ):
+        self._check_open(document, operation_name)
+        result = execute(
+            self.backend.schema,
+            document,
+            self.backend.root,
+            variable_values=variable_values,
+            operation_name=operation_name,
+        )
+        if isawaitable(result):
+            result = await result
+        return result
+
+    async def subscribe(
+        self, document, variable_values=None, operation_name=None
+    ):
+        self._check_open(document, operation_name)
+        results = await subscribe(
+            self.backend.schema,
+            document,
+            self.backend.root,
+            variable_values=variable_values,
+            operation_name=operation_name,
+        )
+        try:
+            while True:
+                result = asyncio.ensure_future(results.__anext__())
+                await asyncio.wait([result, self.receive_data_task],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not result.done():
+                    result.cancel()
+                    raise TransportClosed('the connection was dropped')
+                yield result.result()
+        finally:
+            await results.aclose()
+
+
+class StandInClientProvider(ClientProvider):
+    """
+    a client provider connecting to the stand in backend
+    """
+
+    def __init__(self, backend: StandInBackend, **kwargs):
+        super().__init__(
+            trace_set_id=backend.trace_set_id,
+            url='stand-in',
+            ssl=False,
+            **kwargs,
+        )
+        self.backend = backend
+
+    def _transport(self):
+        return self.backend.transport(self.headers)
+
+    async def _check_version(self):
+        self.backend_version = BackendVersion(
+            self.backend.version, self.backend.schema_hash
+        )
+        return self.backend_version
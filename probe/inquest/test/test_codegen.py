@@ -1,6 +1,9 @@
+import dis
 import types
 
 import inquest.injection.codegen as codegen
+import inquest.logging
+from inquest.utils.exceptions import ProbeException
 
 
 class FakeCodeReassigner:
@@ -20,7 +23,7 @@ def assign_function(self, func, code: types.CodeType):
 def test_on_code_reassigner(capsys):
     result = codegen.add_log_statements(
         FakeCodeReassigner.assign_function,
-        [codegen.Trace(lineno=9, statement="test", id="test")]
+        [codegen.Trace(lineno=12, statement="test", id="test")]
     )
     assert isinstance(result, types.CodeType)
 
@@ -28,6 +31,37 @@ def test_on_code_reassigner(capsys):
 def test_on_basic_assign_function(capsys):
     result = codegen.add_log_statements(
         assign_function,
-        [codegen.Trace(lineno=14, statement="test", id="test")]
+        [codegen.Trace(lineno=17, statement="test", id="test")]
     )
     assert isinstance(result, types.CodeType)
+
+
+def test_generated_code_does_not_import():
+    result = codegen.add_log_statements(
+        assign_function,
+        [codegen.Trace(lineno=17, statement="test", id="test")]
+    )
+    opnames = {
+        instruction.opname for instruction in dis.get_instructions(result)
+    }
+    assert 'IMPORT_NAME' not in opnames
+    assert globals()[codegen.LOGGING_NAME] is inquest.logging
+
+
+def test_invalid_condition():
+    for condition in ['x ==', 'x):\n    pass\nif (x']:
+        try:
+            codegen.add_log_statements(
+                assign_function,
+                [
+                    codegen.Trace(
+                        lineno=17,
+                        statement="test",
+                        id="test",
+                        condition=condition,
+                    )
+                ],
+            )
+            assert False, "expected a ProbeException"
+        except ProbeException as exc:
+            assert exc.trace_id == "test"
@@ -0,0 +1,323 @@
+import asyncio
+import time
+
+import pytest
+
+from inquest.comms.exception_sender import ExceptionSender
+from inquest.comms.trace_set_subscriber import TraceSetSubscriber
+from inquest.probe import Probe
+from inquest.test.probe_test_module.test_imported_module import sample
+from inquest.test.stand_in_backend import (
+    StandInBackend,
+    StandInClientProvider,
+    stop,
+    wait_for,
+)
+
+
+def _trace(trace_id: str, statement: str):
+    return {
+        'id': trace_id,
+        'function':
+            {
+                'name': sample.__name__,
+                'file':
+                    {
+                        'name':
+                            'inquest/test/probe_test_module/'
+                            + 'test_imported_module.py'
+                    },
+                'parentClass': None,
+            },
+        'statement': statement,
+        'line': 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_coalesces_bursts_of_notifications():
+    backend = StandInBackend()
+    applied = []
+    sender = ExceptionSender()
+    with Probe(__name__) as probe:
+        new_desired_state = probe.new_desired_state
+
+        def counting_new_desired_state(desired_set):
+            applied.append([trace['id'] for trace in desired_set])
+            return new_desired_state(desired_set)
+
+        probe.new_desired_state = counting_new_desired_state
+        subscriber = TraceSetSubscriber(
+            probe=probe,
+            package=__name__,
+            exception_sender=sender,
+            quiet=0.05,
+        )
+        async with StandInClientProvider(
+                backend, consumers=[sender, subscriber]
+        ) as provider:
+            main = asyncio.create_task(provider.main())
+            await wait_for(lambda: backend.subscribers == 1)
+            # the initial, empty, desired set
+            assert applied == [[]]
+
+            desired_set = []
+            for idx in range(5):
+                desired_set = desired_set + [_trace(str(idx), f'{idx}')]
+                backend.notify(desired_set)
+                await asyncio.sleep(0.005)
+            await wait_for(lambda: len(applied) == 2)
+            await asyncio.sleep(0.1)
+            await stop(main)
+
+        # only the last of the burst was applied
+        assert applied == [[], ['0', '1', '2', '3', '4']]
+    assert subscriber.skipped == 4
+    assert backend.logs == [
+        'inquest: skipped 4 intermediate trace set states'
+    ]
+    assert backend.failures == []
+
+
+@pytest.mark.asyncio
+async def test_applies_the_pending_desired_set_when_stopped():
+    backend = StandInBackend()
+    sender = ExceptionSender()
+    with Probe(__name__) as probe:
+        subscriber = TraceSetSubscriber(
+            probe=probe,
+            package=__name__,
+            exception_sender=sender,
+            # the burst never ends on its own
+            quiet=60,
+            max_delay=60,
+        )
+        async with StandInClientProvider(
+                backend, consumers=[sender, subscriber]
+        ) as provider:
+            main = asyncio.create_task(provider.main())
+            await wait_for(lambda: backend.subscribers == 1)
+            backend.notify([_trace('1', '{arg1}')])
+            await asyncio.sleep(0.05)
+            assert probe.traces.get('1') is None
+
+            await stop(main)
+            await wait_for(lambda: probe.traces.get('1') is not None)
+
+
+@pytest.mark.asyncio
+async def test_applies_desired_sets_off_the_event_loop():
+    backend = StandInBackend()
+    sender = ExceptionSender()
+    with Probe(__name__) as probe:
+        new_desired_state = probe.new_desired_state
+
+        def slow_new_desired_state(desired_set):
+            # stands in for parsing, injecting and compiling a large module
+            time.sleep(0.3)
+            return new_desired_state(desired_set)
+
+        probe.new_desired_state = slow_new_desired_state
+        subscriber = TraceSetSubscriber(
+            probe=probe,
+            package=__name__,
+            exception_sender=sender,
+        )
+        async with StandInClientProvider(
+                backend, consumers=[sender, subscriber]
+        ):
+            loop = asyncio.get_running_loop()
+            longest_gap = 0.0
+            update = asyncio.create_task(
+                subscriber.update_state([_trace('1', '{arg1}')])
+            )
+            while not update.done():
+                before = loop.time()
+                await asyncio.sleep(0.01)
+                longest_gap = max(longest_gap, loop.time() - before)
+            await update
+
+            assert probe.traces.get('1') is not None
+            assert longest_gap < 0.1
+    assert backend.failures == []
+
+
+def _applied_ids(probe: Probe):
+    return sorted(probe.traces.ids())
+
+
+@pytest.mark.asyncio
+async def test_follows_desired_set_deltas():
+    backend = StandInBackend(deltas=True)
+    backend.notify([_trace('1', '{arg1}')])
+    sender = ExceptionSender()
+    with Probe(__name__) as probe:
+        subscriber = TraceSetSubscriber(
+            probe=probe,
+            package=__name__,
+            exception_sender=sender,
+            quiet=0.01,
+        )
+        async with StandInClientProvider(
+                backend, consumers=[sender, subscriber]
+        ) as provider:
+            main = asyncio.create_task(provider.main())
+            # the snapshot is applied once the subscription is open
+            await wait_for(lambda: _applied_ids(probe) == ['1'])
+            assert backend.subscribers == 1
+            assert subscriber.sequence == 1
+
+            # a trace added, one changed
+            backend.notify([_trace('1', '{arg2}'), _trace('2', '{arg1}')])
+            await wait_for(lambda: _applied_ids(probe) == ['1', '2'])
+            assert subscriber.sequence == 2
+            assert probe.traces.get('1').statement == '{arg2}'
+
+            # a trace removed
+            backend.notify([_trace('2', '{arg1}')])
+            await wait_for(lambda: _applied_ids(probe) == ['2'])
+            assert subscriber.sequence == 3
+            assert subscriber.resyncs == 1
+            await stop(main)
+
+    names = [name for _, name in backend.operations]
+    assert 'probeNotification' not in names
+    assert 'InitialProbeInfo' not in names
+    assert names.count('DesiredSetSnapshot') == 1
+    assert backend.failures == []
+
+
+class ChangingDuringSnapshot(StandInBackend):
+    """
+    changes the desired set right after answering the first snapshot
+    query, before the probe has the answer
+    """
+
+    def __init__(self, desired_set, **kwargs):
+        super().__init__(**kwargs)
+        self.change = desired_set
+
+    def _probe(self):
+        probe = super()._probe()
+        if self.change is not None and \
+                self.operations[-1][1] == 'DesiredSetSnapshot':
+            desired_set, self.change = self.change, None
+            self.notify(desired_set)
+        return probe
+
+
+# the subscription is established right away, or well after the probe
+# started subscribing, like over a slow connection
+@pytest.mark.parametrize('subscribe_delay', [0, 0.1])
+@pytest.mark.asyncio
+async def test_receives_deltas_published_during_the_snapshot(subscribe_delay):
+    backend = ChangingDuringSnapshot([_trace('1', '{arg1}')], deltas=True)
+    backend.subscribe_delay = subscribe_delay
+    sender = ExceptionSender()
+    with Probe(__name__) as probe:
+        subscriber = TraceSetSubscriber(
+            probe=probe,
+            package=__name__,
+            exception_sender=sender,
+            quiet=0.01,
+        )
+        async with StandInClientProvider(
+                backend, consumers=[sender, subscriber]
+        ) as provider:
+            main = asyncio.create_task(provider.main())
+            # no further change comes to reveal a missed delta
+            await wait_for(lambda: _applied_ids(probe) == ['1'])
+            assert subscriber.sequence == 1
+            assert subscriber.resyncs == 1
+            await stop(main)
+    assert backend.failures == []
+
+
+@pytest.mark.asyncio
+async def test_resyncs_after_a_missed_delta():
+    backend = StandInBackend(deltas=True)
+    sender = ExceptionSender()
+    with Probe(__name__) as probe:
+        subscriber = TraceSetSubscriber(
+            probe=probe,
+            package=__name__,
+            exception_sender=sender,
+            quiet=0.01,
+        )
+        async with StandInClientProvider(
+                backend, consumers=[sender, subscriber]
+        ) as provider:
+            main = asyncio.create_task(provider.main())
+            await wait_for(lambda: subscriber.sequence == 0)
+
+            # the probe never hears of the first change, so the second
+            # one's delta doesn't follow its desired set
+            backend.notify([_trace('1', '{arg1}')], deliver=False)
+            backend.notify([_trace('1', '{arg1}'), _trace('2', '{arg2}')])
+            await wait_for(lambda: _applied_ids(probe) == ['1', '2'])
+            assert subscriber.sequence == 2
+            assert subscriber.resyncs == 2
+            await stop(main)
+
+    names = [name for _, name in backend.operations]
+    assert names.count('DesiredSetSnapshot') == 2
+    assert backend.failures == []
+
+
+@pytest.mark.asyncio
+async def test_receives_whole_desired_sets_without_deltas():
+    backend = StandInBackend()
+    sender = ExceptionSender()
+    with Probe(__name__) as probe:
+        subscriber = TraceSetSubscriber(
+            probe=probe,
+            package=__name__,
+            exception_sender=sender,
+            quiet=0.01,
+        )
+        async with StandInClientProvider(
+                backend, consumers=[sender, subscriber]
+        ) as provider:
+            main = asyncio.create_task(provider.main())
+            await wait_for(lambda: backend.subscribers == 1)
+            backend.notify([_trace('1', '{arg1}')])
+            await wait_for(lambda: _applied_ids(probe) == ['1'])
+            await stop(main)
+
+    names = [name for _, name in backend.operations]
+    assert 'DesiredSetSnapshot' not in names
+    assert 'probeNotification' in names
+    assert subscriber.resyncs == 0
+    assert backend.failures == []
+
+
+@pytest.mark.asyncio
+async def test_stopping_doesnt_wait_for_the_worker():
+    backend = StandInBackend()
+    sender = ExceptionSender()
+    with Probe(__name__) as probe:
+        new_desired_state = probe.new_desired_state
+
+        def slow_new_desired_state(desired_set):
+            time.sleep(0.3)
+            return new_desired_state(desired_set)
+
+        probe.new_desired_state = slow_new_desired_state
+        subscriber = TraceSetSubscriber(
+            probe=probe,
+            package=__name__,
+            exception_sender=sender,
+        )
+        loop = asyncio.get_running_loop()
+        async with StandInClientProvider(
+                backend, consumers=[sender, subscriber]
+        ):
+            update = asyncio.create_task(
+                subscriber.update_state([_trace('1', '{arg1}')])
+            )
+            await asyncio.sleep(0.05)
+            await stop(update)
+            stopping = loop.time()
+        assert loop.time() - stopping < 0.1
+        # the worker still finishes applying the desired set
+        await wait_for(lambda: probe.traces.get('1') is not None)
@@ -0,0 +1,34 @@
+from inquest.comms.trace_stats_sender import TraceStatsSender
+from inquest.sampling import LimiterStats
+
+
+class FakeProbe:
+
+    def __init__(self):
+        self.stats = {}
+
+    def trace_stats(self):
+        return self.stats
+
+
+def test_reports_deltas():
+    probe = FakeProbe()
+    sender = TraceStatsSender(probe=probe)
+    assert sender._report() == []
+
+    probe.stats = {'1': LimiterStats(3, 2), '2': LimiterStats(0, 0)}
+    assert sender._report() == [
+        'inquest: trace 1 dropped 5 hits (3 sampled out, 2 rate limited)'
+    ]
+    assert sender._report() == []
+
+    probe.stats = {'1': LimiterStats(4, 2)}
+    assert sender._report() == [
+        'inquest: trace 1 dropped 1 hits (1 sampled out, 0 rate limited)'
+    ]
+
+    # a limiter that was replaced starts counting from zero again
+    probe.stats = {'1': LimiterStats(1, 0)}
+    assert sender._report() == [
+        'inquest: trace 1 dropped 1 hits (1 sampled out, 0 rate limited)'
+    ]
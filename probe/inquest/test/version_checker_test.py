@@ -0,0 +1,35 @@
+import pytest
+from aiohttp import web
+
+from inquest.comms.version_checker import (
+    SCHEMA_HASH_HEADER, BackendVersion, check_version
+)
+from inquest.utils.version import VERSION
+
+
+async def _stand_in_server(headers):
+
+    async def handle(request: web.Request):
+        return web.Response(text=VERSION, headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/api/version', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/api/version'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('schema_hash', ['abc', None])
+async def test_reads_the_schema_hash(schema_hash):
+    headers = {} if schema_hash is None else {SCHEMA_HASH_HEADER: schema_hash}
+    runner, url = await _stand_in_server(headers)
+    try:
+        assert await check_version(url) == BackendVersion(
+            VERSION, schema_hash
+        )
+    finally:
+        await runner.cleanup()
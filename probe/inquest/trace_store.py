@@ -0,0 +1,230 @@
+from typing import (
+    Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+)
+
+FunctionPath = Tuple[str, str]
+
+# the fields of a trace the generated code depends on
+TraceKey = Tuple[int, str, str, bool, Optional[str], str, Optional[int]]
+
+# the code keys of every trace in a function, sorted
+Fingerprint = Tuple[TraceKey, ...]
+
+
+class TraceRecord:
+    """
+    a single trace as the probe sees it
+    """
+
+    __slots__ = (
+        'id',
+        'module',
+        'function',
+        'statement',
+        'lineno',
+        'sample_rate',
+        'rate_limit',
+        'condition',
+        'kind',
+        'end_lineno',
+    )
+
+    def __init__(
+        self,
+        *,
+        id: str,  # pylint: disable=redefined-builtin
+        module: str,
+        function: str,
+        statement: str,
+        lineno: int,
+        sample_rate: Optional[float] = None,
+        rate_limit: Optional[float] = None,
+        condition: Optional[str] = None,
+        kind: str = 'log',
+        end_lineno: Optional[int] = None,
+    ):
+        self.id = id
+        self.module = module
+        self.function = function
+        self.statement = statement
+        self.lineno = lineno
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self.condition = condition
+        self.kind = kind
+        self.end_lineno = end_lineno
+
+    @property
+    def location(self) -> FunctionPath:
+        return (self.module, self.function)
+
+    @property
+    def limited(self) -> bool:
+        '''
+        whether or not the trace's hits go through a limiter
+        '''
+        return self.sample_rate is not None or self.rate_limit is not None
+
+    def code_key(self) -> TraceKey:
+        '''
+        the fields the generated code depends on, in the order of
+        codegen.Trace's fields
+        '''
+        return (
+            self.lineno,
+            self.statement,
+            self.id,
+            self.limited,
+            self.condition,
+            self.kind,
+            self.end_lineno,
+        )
+
+    def same_as(self, other: 'TraceRecord') -> bool:
+        """
+        whether or not the two records describe the same trace
+        """
+        return (
+            self.module == other.module and self.function == other.function
+            and self.statement == other.statement
+            and self.lineno == other.lineno
+            and self.sample_rate == other.sample_rate
+            and self.rate_limit == other.rate_limit
+            and self.condition == other.condition
+            and self.kind == other.kind
+            and self.end_lineno == other.end_lineno
+        )
+
+    def to_dict(self) -> Dict[str, object]:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, TraceRecord):
+            return NotImplemented
+        return self.id == other.id and self.same_as(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return 'TraceRecord(%s)' % ', '.join(
+            '%s=%r' % (key, getattr(self, key)) for key in self.__slots__
+        )
+
+
+class TraceStore:
+    """
+    an immutable set of traces indexed by trace id and by the
+    (module, function) location the trace is embedded in
+    """
+
+    __slots__ = ('_by_id', '_by_location')
+
+    def __init__(self, traces: Iterable[TraceRecord] = ()):
+        self._by_id: Dict[str, TraceRecord] = {}
+        self._by_location: Dict[FunctionPath, Dict[str, TraceRecord]] = {}
+        for trace in traces:
+            self._add(trace)
+
+    @classmethod
+    def from_dicts(cls, traces: Iterable[Dict[str, object]]) -> 'TraceStore':
+        return cls(TraceRecord(**trace) for trace in traces)
+
+    def _add(self, trace: TraceRecord):
+        previous = self._by_id.get(trace.id)
+        if previous is not None:
+            # later duplicates of the same id override earlier ones
+            del self._by_location[previous.location][previous.id]
+            if not self._by_location[previous.location]:
+                del self._by_location[previous.location]
+        self._by_id[trace.id] = trace
+        self._by_location.setdefault(trace.location, {})[trace.id] = trace
+
+    def get(self, trace_id: str) -> Optional[TraceRecord]:
+        return self._by_id.get(trace_id)
+
+    def group(self, location: FunctionPath) -> List[TraceRecord]:
+        '''
+        @returns the traces embedded in the function at location
+        '''
+        return list(self._by_location.get(location, {}).values())
+
+    def fingerprint(self, location: FunctionPath) -> Fingerprint:
+        '''
+        @returns a hashable summary of the traces at location which is
+                 equal for two groups iff they generate the same code
+        '''
+        # ids are unique so sorting never compares past them
+        return tuple(
+            sorted(
+                trace.code_key()
+                for trace in self._by_location.get(location, {}).values()
+            )
+        )
+
+    def groups(self) -> Iterator[Tuple[FunctionPath, List[TraceRecord]]]:
+        for location, traces in self._by_location.items():
+            yield location, list(traces.values())
+
+    def locations(self) -> Iterator[FunctionPath]:
+        return iter(self._by_location)
+
+    def ids(self) -> Iterator[str]:
+        return iter(self._by_id)
+
+    def __contains__(self, trace_id: str) -> bool:
+        return trace_id in self._by_id
+
+    def __iter__(self) -> Iterator[TraceRecord]:
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __eq__(self, other):
+        if not isinstance(other, TraceStore):
+            return NotImplemented
+        return self._by_id == other._by_id
+
+    def __repr__(self):
+        return 'TraceStore(%r)' % list(self._by_id.values())
+
+
+class DiffResult(NamedTuple):
+    to_be_removed: TraceStore
+    to_be_added: TraceStore
+    to_be_updated: TraceStore
+    new_traces: TraceStore
+
+
+def diff_desired_set(
+    traces: TraceStore,
+    desired_set: TraceStore,
+) -> DiffResult:
+    """
+    compares the current traces against the desired set by trace id
+    @returns the traces that are removed, added, and updated plus the
+             new set of traces (which is just the desired set)
+    """
+    to_be_added = []
+    to_be_updated = []
+    for trace in desired_set:
+        current = traces.get(trace.id)
+        if current is None:
+            to_be_added.append(trace)
+        elif not current.same_as(trace):
+            to_be_updated.append(trace)
+
+    # every unmatched id in the desired set is an addition, so the
+    # number of removals follows from the sizes of the two sets
+    num_removed = len(traces) - (len(desired_set) - len(to_be_added))
+    to_be_removed = [] if num_removed == 0 else [
+        trace for trace in traces if trace.id not in desired_set
+    ]
+
+    return DiffResult(
+        to_be_removed=TraceStore(to_be_removed),
+        to_be_added=TraceStore(to_be_added),
+        to_be_updated=TraceStore(to_be_updated),
+        new_traces=desired_set,
+    )